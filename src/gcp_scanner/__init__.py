@@ -0,0 +1,2 @@
+# The startup profile measures time from the package import.
+from . import lazy_import  # pylint: disable=unused-import
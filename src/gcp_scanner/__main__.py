@@ -16,7 +16,9 @@
 
 """
 
+import sys
+
 from . import scanner
 
 if __name__ == '__main__':
-  scanner.main()
+  sys.exit(scanner.main())
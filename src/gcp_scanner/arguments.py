@@ -140,6 +140,160 @@ token_uri and client_secret stored in JSON format.'
       default=1,
       dest='resource_worker_count',
       help='Set limit for resource crawlers run in parallel.')
+  parser.add_argument(
+      '-iwc',
+      '--impersonation-worker-count',
+      default=1,
+      dest='impersonation_worker_count',
+      help='Set limit for service account impersonation attempts run in\
+ parallel.')
+  parser.add_argument(
+      '-it',
+      '--impersonation-timeout',
+      default=60,
+      type=float,
+      dest='impersonation_timeout',
+      help='Timeout in seconds for a single impersonation attempt.')
+  parser.add_argument(
+      '-cd',
+      '--cache-dir',
+      default=None,
+      dest='cache_dir',
+      help='Path to a directory to persist caches between scans, e.g.\
+ impersonation results. The directory contains access tokens.')
+  parser.add_argument(
+      '-ict',
+      '--impersonation-cache-ttl',
+      default=86400,
+      type=float,
+      dest='impersonation_cache_ttl',
+      help='Number of seconds a failed impersonation attempt is cached for.')
+  parser.add_argument(
+      '--empty-location-ttl',
+      default=0,
+      type=float,
+      dest='empty_location_ttl',
+      help='Number of seconds a location without KMS keyrings is skipped for\
+ in later crawls of the same project, e.g. 604800 for a week. Kept in\
+ --cache-dir between scans. Keyrings created there in the meantime are\
+ missed. The default 0 lists every location.')
+  parser.add_argument(
+      '--discovery-docs',
+      default='bundled',
+      choices=['bundled', 'live'],
+      dest='discovery_docs',
+      help='Source of API discovery documents. bundled uses the documents\
+ pinned with google-api-python-client and works offline, live downloads\
+ them and keeps them in --cache-dir.')
+  parser.add_argument(
+      '--discovery-cache-ttl',
+      default=86400,
+      type=float,
+      dest='discovery_cache_ttl',
+      help='Number of seconds downloaded discovery documents are reused for.')
+  parser.add_argument(
+      '-mir',
+      '--max-inflight-requests',
+      default=0,
+      type=int,
+      dest='max_inflight_requests',
+      help='Set limit for API requests in flight across all crawlers.\
+ 0 means unlimited.')
+  parser.add_argument(
+      '-mira',
+      '--max-inflight-requests-per-api',
+      default=0,
+      type=int,
+      dest='max_inflight_requests_per_api',
+      help='Set limit for API requests in flight to a single API, e.g.\
+ compute or storage. 0 means unlimited.')
+  parser.add_argument(
+      '--max-attempts',
+      default=5,
+      type=int,
+      dest='max_attempts',
+      help='Number of attempts of an API request failing with 429, 5xx or\
+ network errors. Retries wait with exponential backoff and jitter, other\
+ errors, e.g. 403 or 404, are not retried.')
+  parser.add_argument(
+      '--retry-budget-per-api',
+      default=1000,
+      type=int,
+      dest='retry_budget_per_api',
+      help='Set limit for retries of requests to a single API in the whole\
+ scan. 0 means unlimited.')
+  parser.add_argument(
+      '--http-pool-size',
+      default=32,
+      type=int,
+      dest='http_pool_size',
+      help='Number of idle keep-alive HTTP transports kept for the API\
+ clients. Requests never wait for a transport, extra ones are closed once\
+ idle.')
+  parser.add_argument(
+      '--engine',
+      default='threads',
+      choices=['threads', 'asyncio'],
+      dest='engine',
+      help='Crawl engine. asyncio runs the list calls of async crawlers on a\
+ single event loop, other crawlers run on threads.')
+  parser.add_argument(
+      '--processes',
+      default=1,
+      type=int,
+      dest='processes',
+      help='Number of worker processes. Projects are split into as many\
+ shards and the output manifests of the shards are merged. Cannot be\
+ combined with --shard-count.')
+  parser.add_argument(
+      '--shard-index',
+      default=0,
+      type=int,
+      dest='shard_index',
+      help='Index of the shard of projects to scan, from 0 to\
+ --shard-count - 1.')
+  parser.add_argument(
+      '--shard-count',
+      default=1,
+      type=int,
+      dest='shard_count',
+      help='Number of shards the projects are split into, e.g. one per\
+ machine. Projects are assigned by a stable hash of their ID. Cannot be\
+ combined with --processes.')
+  parser.add_argument(
+      '--coordinator',
+      default=None,
+      dest='coordinator',
+      help='Run as a coordinator listening on HOST:PORT. Discovered projects\
+ are split into (project, crawler) tasks run by --worker processes. The\
+ coordinator has no authentication, use localhost or a private network.')
+  parser.add_argument(
+      '--worker',
+      default=None,
+      dest='worker',
+      help='Run as a worker taking tasks from the coordinator at\
+ http://HOST:PORT. Workers need credentials of the same identities as\
+ the coordinator.')
+  parser.add_argument(
+      '--lease-timeout',
+      default=300,
+      type=float,
+      dest='lease_timeout',
+      help='Number of seconds without a heartbeat after which a task is\
+ handed to another worker.')
+  parser.add_argument(
+      '--scan-time-suffix',
+      default=None,
+      dest='scan_time_suffix',
+      help='Timestamp appended to the output file names. Defaults to the\
+ current time. Use the same value on all shards of a scan.')
+  parser.add_argument(
+      '--startup-profile',
+      default=False,
+      action='store_true',
+      dest='startup_profile',
+      help='Print when startup steps finished and how long the deferred\
+ imports of crawlers, clients and gRPC libraries took.')
 
   args: argparse.Namespace = parser.parse_args()
 
@@ -159,5 +313,17 @@ token_uri and client_secret stored in JSON format.'
       args.output
     )
     sys.exit(ERROR_CODES.get('InvalidDirError'))
+  if not 0 <= args.shard_index < args.shard_count:
+    logging.error(
+      'Shard index %d is out of range for %d shards.',
+      args.shard_index, args.shard_count
+    )
+    sys.exit(ERROR_CODES.get('InvalidShardError'))
+  if args.processes > 1 and args.shard_count > 1:
+    logging.error(
+      '--processes cannot be combined with --shard-count. Run one process\
+ per shard with --shard-index instead.'
+    )
+    sys.exit(ERROR_CODES.get('InvalidShardError'))
 
   return args
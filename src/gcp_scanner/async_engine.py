@@ -0,0 +1,357 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to crawl projects on an asyncio event loop.
+
+Crawlers implementing IAsyncCrawler run on the event loop and share a pooled
+HTTP transport, so thousands of paginated list calls can be in flight at
+once. Other crawlers run on a thread pool through an adapter.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+from concurrent import futures
+import functools
+import logging
+import os
+import queue
+import sys
+from typing import Any, Dict, Optional
+
+from google.auth.transport import requests as auth_requests
+from googleapiclient import errors
+from googleapiclient import http
+import httplib2
+
+from . import lazy_import
+from . import models
+from . import negative_cache
+from . import request_budget
+from . import retry
+from . import scanner
+from .crawler.crawler_factory import CrawlerFactory
+from .crawler.interface_async_crawler import IAsyncCrawler
+
+try:
+  import aiohttp
+except ImportError:
+  aiohttp = None
+
+# Default number of pooled connections of the aiohttp transport.
+DEFAULT_MAX_CONNECTIONS = 1000
+
+
+class AsyncRequestBudget:
+  """Slots of the scan's request budget for requests made on the event loop.
+
+  Requests of async crawlers take their slots from the same
+  request_budget.RequestBudget as the crawlers running on threads, so both
+  together stay within the limits. Slots are taken on the loop when they
+  are free, otherwise a thread waits for them, so waiting requests do not
+  block the event loop.
+  """
+
+  def __init__(self, budget: request_budget.RequestBudget):
+    self._budget = budget
+
+  @contextlib.asynccontextmanager
+  async def slot(self, api_name: str):
+    """Waits until a request to api_name is allowed to start."""
+
+    acquired = self._budget.acquire(api_name, blocking=False)
+    if acquired is None:
+      future = asyncio.get_running_loop().run_in_executor(
+          None, self._budget.acquire, api_name)
+      try:
+        acquired = await asyncio.shield(future)
+      except asyncio.CancelledError:
+        # the thread still takes the slots, they are freed once it does
+        future.add_done_callback(self._release_later)
+        raise
+    try:
+      yield
+    finally:
+      self._budget.release(acquired)
+
+  def _release_later(self, future: asyncio.Future):
+    if not future.cancelled() and future.exception() is None:
+      self._budget.release(future.result())
+
+
+class AiohttpTransport:
+  """Executes discovery requests with a pooled aiohttp session."""
+
+  def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS):
+    self._session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_connections),
+    )
+    self._budget = AsyncRequestBudget(request_budget.current())
+    self._auth_request = auth_requests.Request()
+
+  async def execute(self, request: http.HttpRequest) -> Any:
+    """Executes the request and returns the deserialized response.
+
+    Transient errors are retried with the process-wide retry policy.
+    """
+
+    api_name, method_id, uri = retry.describe(request)
+    negative_cache.check(api_name)
+    attempt = 0
+    while True:
+      attempt += 1
+      try:
+        return await self._execute_once(request, api_name)
+      except Exception as e:  # pylint: disable=broad-except
+        delay = retry.on_error(api_name, method_id, uri, e, attempt)
+        if delay is None:
+          negative_cache.record(api_name, e)
+          raise
+      await asyncio.sleep(delay)
+
+  async def _execute_once(self, request: http.HttpRequest,
+                          api_name: str) -> Any:
+    headers = dict(request.headers)
+    credentials = getattr(request.http, 'credentials', None)
+    if credentials is not None:
+      if credentials.valid:
+        credentials.apply(headers)
+      else:
+        # refreshing is blocking, so it runs on a thread
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            credentials.before_request,
+            self._auth_request,
+            request.method,
+            request.uri,
+            headers,
+        )
+
+    async with self._budget.slot(api_name):
+      try:
+        async with self._session.request(
+            request.method, request.uri, data=request.body, headers=headers
+        ) as resp:
+          content = await resp.read()
+          info = {key.lower(): value for key, value in resp.headers.items()}
+          info['status'] = resp.status
+      except aiohttp.ClientConnectionError as e:
+        # retried like connection errors of httplib2
+        raise ConnectionError(str(e)) from e
+
+    response = httplib2.Response(info)
+    if response.status >= 300:
+      raise errors.HttpError(response, content, uri=request.uri)
+    return request.postproc(response, content)
+
+  async def close(self):
+    await self._session.close()
+
+
+class ExecutorTransport:
+  """Executes discovery requests on a thread pool.
+
+  It is used when aiohttp is not installed. Requests still go through the
+  blocking request budget of ScannerHttpRequest.
+  """
+
+  def __init__(self, executor: futures.Executor):
+    self._executor = executor
+
+  async def execute(self, request: http.HttpRequest) -> Any:
+    # the thread sees the negative cache scope of the crawler
+    return await asyncio.get_running_loop().run_in_executor(
+        self._executor, contextvars.copy_context().run, request.execute
+    )
+
+  async def close(self):
+    pass
+
+
+class AsyncEngine:
+  """Crawls discovered projects on a single event loop."""
+
+  def __init__(self, project_worker_count: int, resource_worker_count: int,
+               max_connections: int = DEFAULT_MAX_CONNECTIONS):
+    """Initialize the engine.
+
+    Args:
+      project_worker_count: number of projects crawled at once.
+      resource_worker_count: number of threads per project running
+        synchronous crawlers.
+      max_connections: number of pooled HTTP connections.
+    """
+
+    self.project_worker_count = project_worker_count
+    self.max_connections = max_connections
+    # synchronous crawlers get as many threads as in the threaded engine
+    self._executor = futures.ThreadPoolExecutor(
+        max_workers=project_worker_count * resource_worker_count,
+        thread_name_prefix='async-adapter',
+    )
+    self._transport = None
+
+  def _make_transport(self):
+    if aiohttp is None:
+      logging.warning('aiohttp is not installed, requests of async crawlers '
+                      'run on a thread pool')
+      return ExecutorTransport(self._executor)
+    return AiohttpTransport(self.max_connections)
+
+  async def _in_thread(self, func, *args):
+    # the thread sees the objects of the running scan
+    return await asyncio.get_running_loop().run_in_executor(
+        self._executor,
+        functools.partial(contextvars.copy_context().run, func, *args),
+    )
+
+  async def crawl(self, crawler_name: str, project: models.ProjectInfo,
+                  gcs_output_path) -> Any:
+    """Runs a crawler, on the event loop if it supports it."""
+
+    project_id = project.project['projectId']
+    if crawler_name in scanner.CRAWL_CLIENT_MAP:
+      crawler = CrawlerFactory.create_crawler(crawler_name)
+      if isinstance(crawler, IAsyncCrawler):
+        if scanner.api_disabled(crawler, project_id, project.credentials):
+          return None
+        with negative_cache.scope(project.credentials, project_id), \
+            scanner.service_pool.lease(
+                scanner.CRAWL_CLIENT_MAP[crawler_name], project.credentials
+            ) as client:
+          return await crawler.crawl_async(
+              project_id,
+              client,
+              self._transport,
+              scanner.crawler_config_for(
+                  crawler_name, project.scan_config, gcs_output_path,
+                  project.light_scan,
+              ),
+          )
+
+    # adapter for synchronous crawlers
+    return await self._in_thread(
+        scanner.crawl_resource,
+        crawler_name,
+        project_id,
+        project.credentials,
+        project.scan_config,
+        gcs_output_path,
+        project.light_scan,
+        project.billing_index,
+    )
+
+  async def crawl_project(self, project: models.ProjectInfo) -> Optional[str]:
+    """Crawls the data of a project and saves the results.
+
+    Args:
+      project: class to store project scan configration
+
+    Returns:
+      Path of the output file, None if the project was skipped.
+    """
+
+    try:
+      return await self._crawl_project(project)
+    finally:
+      scanner.service_pool.release(project.credentials)
+
+  async def _crawl_project(self, project: models.ProjectInfo) -> Optional[str]:
+    if (
+        project.target_project
+        and project.target_project not in project.project['projectId']
+    ):
+      return None
+
+    project_id = project.project['projectId']
+    print(f'Inspecting project {project_id}')
+    lazy_import.mark('first project crawl started')
+    project_result = scanner.new_project_result(project)
+    output_path, gcs_output_path = scanner.project_output_paths(project)
+    scanner.create_output_file(output_path)
+
+    crawler_names = scanner.project_crawlers(project.scan_config)
+    results = await asyncio.gather(
+        *[self.crawl(name, project, gcs_output_path) for name in crawler_names],
+        return_exceptions=True,
+    )
+    for crawler_name, res in zip(crawler_names, results):
+      if isinstance(res, Exception):
+        logging.error('Crawler %s failed for project %s', crawler_name,
+                      project_id)
+        logging.error(res)
+        continue
+      if res is not None and len(res) != 0:
+        project_result[crawler_name] = res
+
+    # waiting for impersonation and dumping JSON must not block the loop
+    await self._in_thread(
+        scanner.save_project_result, project, project_result, output_path
+    )
+    return str(output_path)
+
+  async def crawl_projects(self, project_queue: queue.Queue) -> Dict[str, str]:
+    """Crawls projects from project_queue until a None entry.
+
+    Args:
+      project_queue: the queue discovered models.ProjectInfo objects come from
+
+    Returns:
+      Output file names by project ID.
+    """
+
+    loop = asyncio.get_running_loop()
+    self._transport = self._make_transport()
+    semaphore = asyncio.Semaphore(self.project_worker_count)
+
+    async def limited(project_obj):
+      async with semaphore:
+        return await self.crawl_project(project_obj)
+
+    project_ids = list()
+    tasks = list()
+    try:
+      while True:
+        project_obj = await loop.run_in_executor(None, project_queue.get)
+        if project_obj is None:
+          break
+        logging.info('Scheduling project %s (%d so far)',
+                     project_obj.project['projectId'], len(tasks) + 1)
+        project_ids.append(project_obj.project['projectId'])
+        tasks.append(asyncio.ensure_future(limited(project_obj)))
+      results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+      await self._transport.close()
+
+    output_files = dict()
+    for project_id, res in zip(project_ids, results):
+      if isinstance(res, Exception):
+        logging.error('Failed to crawl project %s', project_id)
+        logging.error(res)
+      elif res is not None:
+        output_files[project_id] = os.path.basename(res)
+    return output_files
+
+  def run(self, project_queue: queue.Queue) -> Dict[str, str]:
+    """Runs crawl_projects on a new event loop."""
+
+    try:
+      return asyncio.run(self.crawl_projects(project_queue))
+    except Exception:
+      logging.error('Async engine failed')
+      logging.error(sys.exc_info()[1])
+      return dict()
+    finally:
+      self._executor.shutdown()
@@ -29,6 +29,7 @@
 from googleapiclient import discovery
 from httplib2 import Credentials
 
+from .discovery_documents import build_service
 from .interface_client import IClient
 
 
@@ -44,9 +45,8 @@ class AppEngineClient(IClient):
     Returns:
       An object of discovery.Resource
     """
-    return discovery.build(
+    return build_service(
       "appengine",
       "v1",
-      credentials=credentials,
-      cache_discovery=False,
+      credentials,
     )
@@ -15,6 +15,7 @@
 from googleapiclient import discovery
 from httplib2 import Credentials
 
+from .discovery_documents import build_service
 from .interface_client import IClient
 
 
@@ -30,9 +31,8 @@ class BQClient(IClient):
     Returns:
       An object of discovery.Resource
     """
-    return discovery.build(
+    return build_service(
       "bigquery",
       "v2",
-      credentials=credentials,
-      cache_discovery=False,
+      credentials,
     )
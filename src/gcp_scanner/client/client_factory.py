@@ -14,55 +14,36 @@
 
 import logging
 
-from gcp_scanner.client.appengine_client import AppEngineClient
-from gcp_scanner.client.bigquery_client import BQClient
-from gcp_scanner.client.bigtable_client import BigTableClient
-from gcp_scanner.client.cloud_billing_client import CloudBillingClient
-from gcp_scanner.client.cloud_functions_client import CloudFunctionsClient
-from gcp_scanner.client.cloud_resource_manager_client import CloudResourceManagerClient
-from gcp_scanner.client.compute_client import ComputeClient
-from gcp_scanner.client.datastore_client import DatastoreClient
-from gcp_scanner.client.dns_client import DNSClient
-from gcp_scanner.client.domains_client import DomainsClient
-from gcp_scanner.client.filestore_client import FilestoreClient
-from gcp_scanner.client.firestore_client import FirestoreClient
-from gcp_scanner.client.iam_client import IAMClient
-from gcp_scanner.client.kms_client import CloudKMSClient
-from gcp_scanner.client.pubsub_client import PubSubClient
-from gcp_scanner.client.service_management_client import ServiceManagementClient
-from gcp_scanner.client.serviceusage_client import ServiceUsageClient
-from gcp_scanner.client.sourcerepo_client import SourceRepoClient
-from gcp_scanner.client.spanner_client import SpannerClient
-from gcp_scanner.client.sql_client import SQLClient
-from gcp_scanner.client.storage_client import StorageClient
+from gcp_scanner.lazy_import import LazyRegistry
 
 
 class ClientFactory:
   """Factory class for creating clients."""
 
-  clients = {
-    "appengine": AppEngineClient,
-    "bigquery": BQClient,
-    "bigtableadmin": BigTableClient,
-    "cloudbilling": CloudBillingClient,
-    "cloudfunctions": CloudFunctionsClient,
-    "cloudkms": CloudKMSClient,
-    "cloudresourcemanager": CloudResourceManagerClient,
-    "compute": ComputeClient,
-    "datastore": DatastoreClient,
-    "domains": DomainsClient,
-    "dns": DNSClient,
-    "firestore": FirestoreClient,
-    "file": FilestoreClient,
-    "iam": IAMClient,
-    "pubsub": PubSubClient,
-    "servicemanagement": ServiceManagementClient,
-    "serviceusage": ServiceUsageClient,
-    "sourcerepo": SourceRepoClient,
-    "spanner": SpannerClient,
-    "sqladmin": SQLClient,
-    "storage": StorageClient,
-  }
+  # client modules are imported when a client is first requested
+  clients = LazyRegistry({
+    "appengine": "gcp_scanner.client.appengine_client:AppEngineClient",
+    "bigquery": "gcp_scanner.client.bigquery_client:BQClient",
+    "bigtableadmin": "gcp_scanner.client.bigtable_client:BigTableClient",
+    "cloudbilling": "gcp_scanner.client.cloud_billing_client:CloudBillingClient",
+    "cloudfunctions": "gcp_scanner.client.cloud_functions_client:CloudFunctionsClient",
+    "cloudkms": "gcp_scanner.client.kms_client:CloudKMSClient",
+    "cloudresourcemanager": "gcp_scanner.client.cloud_resource_manager_client:CloudResourceManagerClient",
+    "compute": "gcp_scanner.client.compute_client:ComputeClient",
+    "datastore": "gcp_scanner.client.datastore_client:DatastoreClient",
+    "domains": "gcp_scanner.client.domains_client:DomainsClient",
+    "dns": "gcp_scanner.client.dns_client:DNSClient",
+    "firestore": "gcp_scanner.client.firestore_client:FirestoreClient",
+    "file": "gcp_scanner.client.filestore_client:FilestoreClient",
+    "iam": "gcp_scanner.client.iam_client:IAMClient",
+    "pubsub": "gcp_scanner.client.pubsub_client:PubSubClient",
+    "servicemanagement": "gcp_scanner.client.service_management_client:ServiceManagementClient",
+    "serviceusage": "gcp_scanner.client.serviceusage_client:ServiceUsageClient",
+    "sourcerepo": "gcp_scanner.client.sourcerepo_client:SourceRepoClient",
+    "spanner": "gcp_scanner.client.spanner_client:SpannerClient",
+    "sqladmin": "gcp_scanner.client.sql_client:SQLClient",
+    "storage": "gcp_scanner.client.storage_client:StorageClient",
+  })
 
   @classmethod
   def get_client(cls, name):
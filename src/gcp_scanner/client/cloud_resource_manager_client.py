@@ -15,6 +15,7 @@
 from googleapiclient import discovery
 from httplib2 import Credentials
 
+from .discovery_documents import build_service
 from .interface_client import IClient
 
 
@@ -30,9 +31,8 @@ class CloudResourceManagerClient(IClient):
     Returns:
       An object of discovery.Resource
     """
-    return discovery.build(
+    return build_service(
       "cloudresourcemanager",
       "v1",
-      credentials=credentials,
-      cache_discovery=False,
+      credentials,
     )
@@ -16,6 +16,7 @@
 from googleapiclient import discovery
 from httplib2 import Credentials
 
+from .discovery_documents import build_service
 from .interface_client import IClient
 
 
@@ -31,9 +32,8 @@ class ComputeClient(IClient):
     Returns:
       An object of discovery.Resource
     """
-    return discovery.build(
+    return build_service(
       'compute',
       'v1',
-      credentials=credentials,
-      cache_discovery=False,
+      credentials,
     )
@@ -0,0 +1,269 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import google.auth.credentials
+import google_auth_httplib2
+from googleapiclient import discovery
+from googleapiclient import discovery_cache
+from httplib2 import Credentials
+import httplib2
+import requests
+
+from gcp_scanner import transport
+
+from .http_request import ScannerHttpRequest
+
+BUNDLED = "bundled"
+LIVE = "live"
+
+DISCOVERY_URL = (
+    "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+)
+
+
+class DiscoveryDocumentCache:
+  """A cache of parsed discovery documents keyed by (api, version).
+
+  Documents are parsed once per process and shared by every service built
+  from them. They are looked up in the documents bundled with
+  google-api-python-client (pinned together with the library version), in
+  an on-disk cache and on the discovery endpoint. With prefer_live, fresh
+  documents from the disk cache or the endpoint are used before the bundled
+  ones.
+  """
+
+  def __init__(self, cache_dir: Optional[str] = None, ttl: float = 86400,
+               prefer_live: bool = False, timeout: float = 60):
+    """Initialize the cache.
+
+    Args:
+      cache_dir: directory to keep downloaded documents in (Optional).
+      ttl: number of seconds a downloaded document is fresh for.
+      prefer_live: whether to prefer downloaded documents to bundled ones.
+      timeout: timeout of the requests to the discovery endpoint in seconds.
+    """
+
+    self.cache_dir = cache_dir
+    self.ttl = ttl
+    self.prefer_live = prefer_live
+    self.timeout = timeout
+    self._documents: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+    self._locks: Dict[Tuple[str, str], threading.Lock] = dict()
+    self._lock = threading.Lock()
+
+  def get(self, api: str, version: str) -> Dict[str, Any]:
+    """Returns the parsed discovery document of the API."""
+
+    key = (api, version)
+    document = self._documents.get(key)
+    if document is not None:
+      return document
+
+    with self._lock:
+      key_lock = self._locks.setdefault(key, threading.Lock())
+    # documents are loaded once even if many threads need them at once
+    with key_lock:
+      document = self._documents.get(key)
+      if document is None:
+        document = json.loads(self._load(api, version))
+        _prepare(document)
+        self._documents[key] = document
+    return document
+
+  def _load(self, api: str, version: str) -> str:
+    if self.prefer_live:
+      sources = (self._fresh_disk, self._download, self._bundled,
+                 self._stale_disk)
+    else:
+      sources = (self._bundled, self._fresh_disk, self._download,
+                 self._stale_disk)
+    for source in sources:
+      try:
+        content = source(api, version)
+      except Exception:
+        logging.info("Failed to load discovery document of %s %s", api,
+                     version)
+        logging.info(sys.exc_info()[1])
+        continue
+      if content is not None:
+        return content
+    raise ValueError(f"No discovery document of {api} {version}")
+
+  def _bundled(self, api: str, version: str) -> Optional[str]:
+    return discovery_cache.get_static_doc(api, version)
+
+  def _disk_path(self, api: str, version: str) -> Optional[str]:
+    if self.cache_dir is None:
+      return None
+    return os.path.join(self.cache_dir, "discovery", f"{api}.{version}.json")
+
+  def _fresh_disk(self, api: str, version: str) -> Optional[str]:
+    path = self._disk_path(api, version)
+    if path is None or not os.path.exists(path):
+      return None
+    if os.path.getmtime(path) + self.ttl < time.time():
+      return None
+    return self._stale_disk(api, version)
+
+  def _stale_disk(self, api: str, version: str) -> Optional[str]:
+    path = self._disk_path(api, version)
+    if path is None or not os.path.exists(path):
+      return None
+    with open(path, "r", encoding="utf-8") as f:
+      return f.read()
+
+  def _download(self, api: str, version: str) -> Optional[str]:
+    logging.info("Downloading discovery document of %s %s", api, version)
+    response = requests.get(DISCOVERY_URL.format(api=api, version=version),
+                            timeout=self.timeout)
+    response.raise_for_status()
+    content = response.text
+
+    path = self._disk_path(api, version)
+    if path is not None:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      tmp_path = f"{path}.tmp"
+      with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+      os.replace(tmp_path, path)
+    return content
+
+
+def _prepare(document: Dict[str, Any]):
+  """Builds every resource of the document once.
+
+  build_from_document() adds library-specific parameters to the method
+  descriptions the first time a resource is built. Doing it upfront means
+  later builds sharing the document between threads only read it.
+  """
+
+  def visit(resource, resource_desc):
+    for name, desc in resource_desc.get("resources", {}).items():
+      visit(getattr(resource, discovery.fix_method_name(name))(), desc)
+
+  visit(
+      discovery.build_from_document(
+          document, http=httplib2.Http(), requestBuilder=ScannerHttpRequest
+      ),
+      document,
+  )
+
+
+_cache = DiscoveryDocumentCache()
+
+_scoped: Dict[Tuple[Credentials, Tuple[str, ...]], Credentials] = dict()
+_scoped_lock = threading.Lock()
+
+
+def _scoped_credentials(credentials: Credentials,
+                        scopes: List[str]) -> Credentials:
+  """Scopes credentials that require it, e.g. service account keys.
+
+  Scoped credentials are reused, so their token is not fetched again for
+  every service.
+  """
+
+  if not (
+      isinstance(credentials, google.auth.credentials.Scoped)
+      and credentials.requires_scopes
+  ):
+    return credentials
+  key = (credentials, tuple(scopes))
+  with _scoped_lock:
+    if key not in _scoped:
+      _scoped[key] = google.auth.credentials.with_scopes_if_required(
+          credentials, scopes
+      )
+    return _scoped[key]
+
+
+def configure(cache_dir: Optional[str] = None, ttl: float = 86400,
+              prefer_live: bool = False):
+  """Replaces the process-wide discovery document cache."""
+  global _cache
+  _cache = DiscoveryDocumentCache(cache_dir, ttl, prefer_live)
+
+
+def build_service(api: str, version: str,
+                  credentials: Credentials) -> discovery.Resource:
+  """Builds a discovery service from the cached document of the API.
+
+  Args:
+    api: name of the API, e.g. compute.
+    version: version of the API, e.g. v1.
+    credentials: An google.oauth2.credentials.Credentials object.
+
+  Returns:
+    An object of discovery.Resource
+  """
+
+  document = _cache.get(api, version)
+  # the same as build_from_document does when building its own transport
+  scopes = list(
+      document.get("auth", {}).get("oauth2", {}).get("scopes", {}).keys()
+  )
+  credentials = _scoped_credentials(credentials, scopes)
+  # requests of every service share the pooled keep-alive connections
+  http = google_auth_httplib2.AuthorizedHttp(
+      credentials, http=transport.http_pool()
+  )
+  return discovery.build_from_document(
+      document,
+      http=http,
+      requestBuilder=ScannerHttpRequest,
+  )
+
+
+def method_description(api: str, version: str,
+                       method_path: str) -> Dict[str, Any]:
+  """Returns the description of an API method from its discovery document.
+
+  Args:
+    api: name of the API, e.g. compute.
+    version: version of the API, e.g. v1.
+    method_path: resource path of the method, e.g. instances.aggregatedList.
+
+  Returns:
+    The method description, e.g. with its id and parameters.
+  """
+
+  resource = _cache.get(api, version)
+  *resource_names, method_name = method_path.split(".")
+  for resource_name in resource_names:
+    resource = resource["resources"][resource_name]
+  return resource["methods"][method_name]
+
+
+def method_parameters(api: str, version: str,
+                      method_path: str) -> Dict[str, Dict[str, Any]]:
+  """Returns the parameters of an API method from its discovery document.
+
+  Args:
+    api: name of the API, e.g. compute.
+    version: version of the API, e.g. v1.
+    method_path: resource path of the method, e.g. instances.aggregatedList.
+
+  Returns:
+    Descriptions of the method parameters by name.
+  """
+
+  return method_description(api, version, method_path).get("parameters", {})
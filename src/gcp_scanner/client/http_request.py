@@ -0,0 +1,53 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import time
+
+from googleapiclient import http
+
+from gcp_scanner import negative_cache
+from gcp_scanner import request_budget
+from gcp_scanner import retry
+
+
+class ScannerHttpRequest(http.HttpRequest):
+  """HttpRequest that waits for a slot in the request budget before running.
+
+  It is passed to discovery.build as requestBuilder, so every execute() call
+  made by the crawlers goes through the budget and the retry policy without
+  changing them. Transient errors are retried with backoff, the slot is
+  released while waiting. Requests of an API disabled for the current
+  credentials and project fail without a round trip.
+  """
+
+  @property
+  def api_name(self) -> str:
+    """Name of the API the request belongs to, e.g. compute."""
+    return (self.methodId or "").split(".")[0]
+
+  def execute(self, http=None, num_retries=0):
+    negative_cache.check(self.api_name)
+    attempt = 0
+    while True:
+      attempt += 1
+      try:
+        with request_budget.slot(self.api_name):
+          return super().execute(http=http, num_retries=num_retries)
+      except Exception as e:  # pylint: disable=broad-except
+        delay = retry.on_error(self.api_name, self.methodId or "", self.uri,
+                               e, attempt)
+        if delay is None:
+          negative_cache.record(self.api_name, e)
+          raise
+      time.sleep(delay)
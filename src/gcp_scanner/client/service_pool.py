@@ -0,0 +1,105 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import collections
+import contextlib
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from googleapiclient import discovery
+from httplib2 import Credentials
+
+
+class ServicePool:
+  """A pool of discovery services keyed by (credentials, client name).
+
+  A discovery service owns an httplib2 transport, which is not thread-safe,
+  so a service is leased to a single thread at a time and returned to the
+  pool afterwards. The pool builds as many services per key as are used at
+  once and reuses them for every project scanned with the credentials.
+
+  Credentials are retained while projects scanned with them are pending.
+  Once the last one is released, the idle services of the credentials are
+  dropped.
+  """
+
+  def __init__(self, build_fn: Callable[[str, Credentials],
+                                        discovery.Resource]):
+    """Initialize the pool.
+
+    Args:
+      build_fn: function building a service from a client name, e.g.
+        compute, and credentials.
+    """
+
+    self._build_fn = build_fn
+    self._idle: Dict[Tuple[Credentials, str],
+                     List[discovery.Resource]] = collections.defaultdict(list)
+    self._refs: Dict[Credentials, int] = collections.Counter()
+    self._lock = threading.Lock()
+    self.builds = 0
+    self.reuses = 0
+
+  @contextlib.contextmanager
+  def lease(self, client_name: str,
+            credentials: Credentials) -> Iterator[discovery.Resource]:
+    """Leases a service of the client for the current thread.
+
+    Args:
+      client_name: name of the client, e.g. compute.
+      credentials: credentials of the service.
+
+    Yields:
+      An object of discovery.Resource
+    """
+
+    key = (credentials, client_name)
+    with self._lock:
+      idle = self._idle.get(key)
+      service = idle.pop() if idle else None
+      if service is not None:
+        self.reuses += 1
+    if service is None:
+      service = self._build_fn(client_name, credentials)
+      with self._lock:
+        self.builds += 1
+
+    try:
+      yield service
+    finally:
+      with self._lock:
+        # services of released credentials are not kept
+        if self._refs.get(credentials, 0) > 0:
+          self._idle[key].append(service)
+
+  def retain(self, credentials: Credentials):
+    """Marks that a project scanned with the credentials is pending."""
+    with self._lock:
+      self._refs[credentials] += 1
+
+  def release(self, credentials: Credentials):
+    """Marks that a project scanned with the credentials is finished."""
+
+    with self._lock:
+      self._refs[credentials] -= 1
+      if self._refs[credentials] > 0:
+        return
+      del self._refs[credentials]
+      for key in [key for key in self._idle if key[0] is credentials]:
+        del self._idle[key]
+
+  def log_report(self):
+    logging.info('Built %d discovery services, reused them %d times',
+                 self.builds, self.reuses)
@@ -0,0 +1,350 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to distribute (project, crawler) tasks between scan workers.
+
+"""
+
+from http import server
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib import request
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  project TEXT NOT NULL,
+  crawler TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  state TEXT NOT NULL,
+  worker TEXT,
+  lease_expires REAL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  result TEXT,
+  error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);
+CREATE INDEX IF NOT EXISTS tasks_project ON tasks (project);
+'''
+
+
+class JobQueue:
+  """A SQLite-backed queue of (project, crawler) tasks.
+
+  Workers lease the oldest queued task for lease_seconds and extend the
+  lease with heartbeats. Tasks whose lease expired, e.g. because the worker
+  died or hangs, are queued again, so slow workers do not hold back the
+  scan. A task that failed max_attempts times is marked as failed.
+
+  Tasks are grouped by a project key, which identifies a single project scan
+  (the same project may be scanned with different credentials).
+  """
+
+  def __init__(self, path: str = ':memory:', lease_seconds: float = 300,
+               max_attempts: int = 3):
+    """Initialize the queue.
+
+    Args:
+      path: path to the SQLite database.
+      lease_seconds: number of seconds a task is leased for.
+      max_attempts: number of times a task is run before giving up.
+    """
+
+    self.lease_seconds = lease_seconds
+    self.max_attempts = max_attempts
+    self._closed = False
+    self._lock = threading.Lock()
+    self._db = sqlite3.connect(path, check_same_thread=False,
+                               isolation_level=None)
+    self._db.executescript(_SCHEMA)
+
+  def add(self, project: str, crawler: str, payload: Dict[str, Any]) -> int:
+    """Queues a task and returns its ID."""
+
+    with self._lock:
+      cursor = self._db.execute(
+          'INSERT INTO tasks (project, crawler, payload, state) '
+          'VALUES (?, ?, ?, ?)',
+          (project, crawler, json.dumps(payload), QUEUED),
+      )
+      return cursor.lastrowid
+
+  def close(self):
+    """Marks that no more tasks will be added."""
+    with self._lock:
+      self._closed = True
+
+  def lease(self, worker: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Leases the oldest queued task.
+
+    Args:
+      worker: ID of the worker taking the task.
+
+    Returns:
+      A tuple of the task (None if no task is queued) and a flag telling
+      whether the whole scan is over.
+    """
+
+    self.requeue_expired()
+    with self._lock:
+      self._db.execute('BEGIN IMMEDIATE')
+      try:
+        row = self._db.execute(
+            'SELECT id, project, crawler, payload FROM tasks '
+            'WHERE state = ? ORDER BY id LIMIT 1',
+            (QUEUED,),
+        ).fetchone()
+        if row is not None:
+          self._db.execute(
+              'UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, '
+              'attempts = attempts + 1 WHERE id = ?',
+              (LEASED, worker, time.time() + self.lease_seconds, row[0]),
+          )
+      finally:
+        self._db.execute('COMMIT')
+      if row is None:
+        return None, self._closed and self._unfinished() == 0
+
+    task_id, project, crawler, payload = row
+    return {
+        'id': task_id,
+        'project': project,
+        'crawler': crawler,
+        'payload': json.loads(payload),
+    }, False
+
+  def heartbeat(self, task_id: int, worker: str) -> bool:
+    """Extends the lease of a task.
+
+    Returns:
+      False if the task is no longer leased by the worker.
+    """
+
+    with self._lock:
+      cursor = self._db.execute(
+          'UPDATE tasks SET lease_expires = ? '
+          'WHERE id = ? AND worker = ? AND state = ?',
+          (time.time() + self.lease_seconds, task_id, worker, LEASED),
+      )
+      return cursor.rowcount == 1
+
+  def complete(self, task_id: int, worker: str, result: Any) -> bool:
+    """Stores the result of a task.
+
+    The first result wins. It is accepted even if the lease has expired in
+    the meantime, since the work is done either way.
+
+    Returns:
+      False if the task was already finished.
+    """
+
+    with self._lock:
+      cursor = self._db.execute(
+          'UPDATE tasks SET state = ?, worker = ?, result = ?, error = NULL '
+          'WHERE id = ? AND state IN (?, ?)',
+          (DONE, worker, json.dumps(result), task_id, QUEUED, LEASED),
+      )
+      return cursor.rowcount == 1
+
+  def fail(self, task_id: int, worker: str, error: str) -> bool:
+    """Records a failed attempt and queues the task again, if allowed.
+
+    Returns:
+      False if the task is no longer leased by the worker.
+    """
+
+    with self._lock:
+      cursor = self._db.execute(
+          'UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+          'worker = NULL, lease_expires = NULL, error = ? '
+          'WHERE id = ? AND worker = ? AND state = ?',
+          (self.max_attempts, FAILED, QUEUED, error, task_id, worker, LEASED),
+      )
+      return cursor.rowcount == 1
+
+  def requeue_expired(self) -> int:
+    """Queues tasks whose lease expired again and returns their number."""
+
+    with self._lock:
+      cursor = self._db.execute(
+          'UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+          'worker = NULL, lease_expires = NULL, error = ? '
+          'WHERE state = ? AND lease_expires < ?',
+          (self.max_attempts, FAILED, QUEUED, 'lease expired', LEASED,
+           time.time()),
+      )
+      if cursor.rowcount:
+        logging.info('Re-queued %d tasks with expired leases', cursor.rowcount)
+      return cursor.rowcount
+
+  def _unfinished(self, project: Optional[str] = None) -> int:
+    query = 'SELECT COUNT(*) FROM tasks WHERE state IN (?, ?)'
+    params = [QUEUED, LEASED]
+    if project is not None:
+      query += ' AND project = ?'
+      params.append(project)
+    return self._db.execute(query, params).fetchone()[0]
+
+  def project_finished(self, project: str) -> bool:
+    """Checks whether all tasks of a project are done or failed."""
+    with self._lock:
+      return self._unfinished(project) == 0
+
+  def results(self, project: str) -> Dict[str, Any]:
+    """Returns results of the finished tasks of a project by crawler."""
+
+    with self._lock:
+      rows = self._db.execute(
+          'SELECT crawler, state, result, error FROM tasks '
+          'WHERE project = ? ORDER BY id',
+          (project,),
+      ).fetchall()
+
+    results = dict()
+    for crawler, state, result, error in rows:
+      if state == DONE:
+        results[crawler] = json.loads(result)
+      elif state == FAILED:
+        logging.error('Crawler %s failed for project %s: %s', crawler,
+                      project, error)
+    return results
+
+  def counts(self) -> Dict[str, int]:
+    """Returns the number of tasks in every state."""
+    with self._lock:
+      return dict(self._db.execute(
+          'SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+
+
+class _Handler(server.BaseHTTPRequestHandler):
+  """Serves the JobQueue methods as JSON POST endpoints."""
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    job_queue: JobQueue = self.server.job_queue
+    try:
+      body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+      if self.path == '/lease':
+        task, finished = job_queue.lease(body['worker'])
+        response = {'task': task, 'finished': finished,
+                    'lease_seconds': job_queue.lease_seconds}
+      elif self.path == '/heartbeat':
+        response = {'ok': job_queue.heartbeat(body['id'], body['worker'])}
+      elif self.path == '/complete':
+        response = {'ok': job_queue.complete(body['id'], body['worker'],
+                                             body['result'])}
+      elif self.path == '/fail':
+        response = {'ok': job_queue.fail(body['id'], body['worker'],
+                                         body['error'])}
+      else:
+        self.send_error(404)
+        return
+    except Exception as ex:  # pylint: disable=broad-except
+      logging.error('Failed to handle %s request', self.path)
+      logging.error(ex)
+      self.send_error(400)
+      return
+
+    data = json.dumps(response).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+    logging.debug(format, *args)
+
+
+class CoordinatorServer(server.ThreadingHTTPServer):
+  """An HTTP server handing out tasks of a JobQueue to the workers.
+
+  The server has no authentication, so it should only listen on localhost
+  or on a private network.
+  """
+
+  daemon_threads = True
+
+  def __init__(self, address: Tuple[str, int], job_queue: JobQueue):
+    super().__init__(address, _Handler)
+    self.job_queue = job_queue
+
+  @property
+  def url(self) -> str:
+    host, port = self.server_address[:2]
+    return f'http://{host}:{port}'
+
+  def start(self) -> threading.Thread:
+    """Serves requests in a background thread."""
+    thread = threading.Thread(target=self.serve_forever, name='coordinator',
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+class CoordinatorClient:
+  """A client of the CoordinatorServer used by the workers."""
+
+  def __init__(self, url: str, worker: str, timeout: float = 60):
+    """Initialize the client.
+
+    Args:
+      url: URL of the coordinator, e.g. http://localhost:8000.
+      worker: ID of the worker.
+      timeout: timeout of the requests to the coordinator in seconds.
+    """
+
+    if '://' not in url:
+      url = f'http://{url}'
+    self.url = url.rstrip('/')
+    self.worker = worker
+    self.timeout = timeout
+
+  def _call(self, method: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    body = dict(body, worker=self.worker)
+    req = request.Request(
+        f'{self.url}/{method}',
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    with request.urlopen(req, timeout=self.timeout) as response:
+      return json.loads(response.read())
+
+  def lease(self) -> Dict[str, Any]:
+    return self._call('lease', {})
+
+  def heartbeat(self, task_id: int) -> bool:
+    return self._call('heartbeat', {'id': task_id})['ok']
+
+  def complete(self, task_id: int, result: Any) -> bool:
+    return self._call('complete', {'id': task_id, 'result': result})['ok']
+
+  def fail(self, task_id: int, error: str) -> bool:
+    return self._call('fail', {'id': task_id, 'error': error})['ok']
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+  """Parses a host:port address the coordinator listens on."""
+
+  host, _, port = address.rpartition(':')
+  return host or 'localhost', int(port)
@@ -19,11 +19,14 @@ from typing import Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class AppServicesCrawler(ICrawler):
   '''Handle crawling of App Services data.'''
 
+  _list_method = ("appengine", "v1", "apps.services.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
     '''Retrieve a list of AppEngine instances available in the project.
@@ -47,14 +50,12 @@ class AppServicesCrawler(ICrawler):
                                        response["defaultHostname"],
                                        response["servingStatus"])
 
-      request = service.apps().services().list(appsId=project_name)
+      request = service.apps().services().list(
+        appsId=project_name, **self._list_kwargs(config))
 
       app_services["services"] = list()
-      while request is not None:
-        response = request.execute()
+      for response in paginate(request, service.apps().services().list_next):
         app_services["services"].extend(response.get("services", []))
-        request = service.apps().services().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to retrieve App services for project %s", project_name)
       logging.info(sys.exc_info())
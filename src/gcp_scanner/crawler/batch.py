@@ -0,0 +1,131 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import functools
+import logging
+import sys
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from googleapiclient import discovery
+from googleapiclient import http
+
+from gcp_scanner import negative_cache
+from gcp_scanner import request_budget
+from gcp_scanner import retry
+
+# The maximum number of calls the batch endpoints accept in one request.
+MAX_BATCH_SIZE = 100
+
+NextRequestFn = Callable[[http.HttpRequest, Dict[str, Any]],
+                         Optional[http.HttpRequest]]
+
+
+def _store_result(results: Dict[int, Tuple[Any, Optional[Exception]]],
+                  request_id: str, response: Any,
+                  exception: Optional[Exception]):
+  results[int(request_id)] = (response, exception)
+
+
+def execute_batched(
+    service: discovery.Resource,
+    requests: Dict[Hashable, http.HttpRequest],
+    next_request: Optional[NextRequestFn] = None,
+    batch_size: int = MAX_BATCH_SIZE,
+) -> Tuple[Dict[Hashable, List[Dict[str, Any]]], Dict[Hashable, Exception]]:
+  """Executes independent requests in batches of up to batch_size calls.
+
+  Follow-up pages are requested in the next batches, so every round trip
+  stays full. A failed call only fails its key. Calls failed with transient
+  errors, or all calls of a failed batch, are retried one by one through
+  the retry policy of execute(). Like single requests, every call takes a
+  slot of the request budget, and calls of an API cached as disabled fail
+  without a round trip.
+
+  Args:
+    service: the service the requests were built with.
+    requests: requests to execute by a key identifying them.
+    next_request: function returning the request of the next page from the
+      previous request and response, e.g. service.tables().list_next
+      (Optional).
+    batch_size: maximum number of calls per round trip.
+
+  Returns:
+    A tuple of the response pages by key and the errors by key. Keys that
+    failed on a later page keep their previous pages.
+  """
+
+  pages: Dict[Hashable, List[Dict[str, Any]]] = {key: [] for key in requests}
+  failed: Dict[Hashable, Exception] = dict()
+  pending = list(requests.items())
+
+  def on_response(key, request, response):
+    pages[key].append(response)
+    if next_request is not None:
+      following = next_request(request, response)
+      if following is not None:
+        pending.append((key, following))
+
+  while pending:
+    chunk = pending[:batch_size]
+    del pending[:batch_size]
+    if len(chunk) == 1:
+      key, request = chunk[0]
+      try:
+        on_response(key, request, request.execute())
+      except Exception as e:  # pylint: disable=broad-except
+        failed[key] = e
+      continue
+
+    api_name = (chunk[0][1].methodId or "").split(".")[0]
+    try:
+      negative_cache.check(api_name)
+    except Exception as e:  # pylint: disable=broad-except
+      for key, _ in chunk:
+        failed[key] = e
+      continue
+
+    results = dict()
+    batch = service.new_batch_http_request(
+      callback=functools.partial(_store_result, results))
+    for i, (_, request) in enumerate(chunk):
+      batch.add(request, request_id=str(i))
+    try:
+      with request_budget.slot(api_name, len(chunk)):
+        batch.execute()
+    except Exception:
+      logging.info("Batch of %d %s calls failed, executing them one by one",
+                   len(chunk), api_name)
+      logging.info(sys.exc_info())
+      results.clear()
+      for i, (_, request) in enumerate(chunk):
+        try:
+          results[i] = (request.execute(), None)
+        except Exception as e:  # pylint: disable=broad-except
+          results[i] = (None, e)
+
+    for i, (key, request) in enumerate(chunk):
+      response, exception = results.get(
+          i, (None, RuntimeError("No response in the batch")))
+      if exception is not None and retry.is_retryable(exception):
+        try:
+          response, exception = request.execute(), None
+        except Exception as e:  # pylint: disable=broad-except
+          exception = e
+      if exception is not None:
+        negative_cache.record(api_name, exception)
+        failed[key] = exception
+      else:
+        on_response(key, request, response)
+
+  return pages, failed
@@ -12,20 +12,30 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import collections
 import logging
 import sys
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Mapping, Union
 
 from googleapiclient import discovery
 
+from gcp_scanner import spool
+from gcp_scanner.crawler import batch
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
+from gcp_scanner.scheduler import BoundedExecutor
+
+# Number of dataset pages whose tables are listed at the same time.
+TABLE_LISTING_WORKERS = 4
 
 
 class BigQueryCrawler(ICrawler):
   '''Handle crawling of BigQuery data.'''
 
+  _list_method = ("bigquery", "v2", "datasets.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
-            config: Dict[str, Union[bool, str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+            config: Dict[str, Union[bool, str]] = None) -> Mapping[str, List[Dict[str, Any]]]:
     '''Retrieve a list of BigQuery datasets available in the project.
 
     Args:
@@ -34,51 +44,65 @@ class BigQueryCrawler(ICrawler):
       config: Configuration options for the crawler (Optional).
 
     Returns:
-      A list of resource objects representing the crawled data.
+      Lists of tables by dataset name, spooled to disk as the tables of each
+      dataset page are listed.
     '''
 
     logging.info("Retrieving BigQuery Datasets")
-    bq_datasets = dict()
+    bq_datasets = spool.SpooledDict()
+    pending = collections.deque()
     try:
-      request = service.datasets().list(projectId=project_id)
-      while request is not None:
-        response = request.execute()
-
-        for dataset in response.get("datasets", []):
-          dataset_id = dataset["datasetReference"]["datasetId"]
-          bq_datasets[dataset_id] = self.get_bq_tables(project_id, dataset_id, service)
-
-        request = service.datasets().list_next(
-          previous_request=request, previous_response=response)
+      with BoundedExecutor(TABLE_LISTING_WORKERS, f"{project_id}-bq") as executor:
+        request = service.datasets().list(
+          projectId=project_id, **self._list_kwargs(config))
+        for response in paginate(request, service.datasets().list_next):
+          dataset_ids = [dataset["datasetReference"]["datasetId"]
+                         for dataset in response.get("datasets", [])]
+          # tables of several dataset pages are listed at the same time
+          pending.append(executor.submit(
+            self.get_bq_tables, project_id, dataset_ids, service))
+          # finished pages go to the output in dataset order, at most
+          # TABLE_LISTING_WORKERS pages are held in memory
+          while pending and (pending[0].done()
+                             or len(pending) > TABLE_LISTING_WORKERS):
+            bq_datasets.update(pending.popleft().result())
+        while pending:
+          bq_datasets.update(pending.popleft().result())
     except Exception:
       logging.info("Failed to retrieve BQ datasets for project %s", project_id)
       logging.info(sys.exc_info())
     return bq_datasets
 
-  def get_bq_tables(self, project_id: str, dataset_id: str,
-                    bq_service: discovery.Resource) -> List[Dict[str, Any]]:
-    """Retrieve a list of BigQuery tables available in the dataset.
+  def get_bq_tables(self, project_id: str, dataset_ids: List[str],
+                    bq_service: discovery.Resource) -> Dict[str, List[Dict[str, Any]]]:
+    """Retrieve lists of BigQuery tables available in the datasets.
+
+    Tables of all datasets are listed in batched requests.
 
     Args:
       project_id: A name of a project to query info about.
-      dataset_id: A name of dataset to query data from.
-      bq_service: I do not know.
+      dataset_ids: Names of datasets to query data from.
+      bq_service: A resource object for interacting with the BigQuery API.
 
     Returns:
-      A list of BigQuery tables in the dataset.
+      A dict with lists of BigQuery tables by dataset name.
     """
 
-    logging.info("Retrieving BigQuery Tables for dataset %s", dataset_id)
-    list_of_tables = list()
-    try:
-      request = bq_service.tables().list(
+    logging.info("Retrieving BigQuery Tables for %d datasets", len(dataset_ids))
+    responses, failed = batch.execute_batched(
+      bq_service,
+      {dataset_id: bq_service.tables().list(
         projectId=project_id, datasetId=dataset_id)
-      while request is not None:
-        response = request.execute()
-        list_of_tables.extend(response.get("tables", []))
-        request = bq_service.tables().list_next(
-          previous_request=request, previous_response=response)
-    except Exception:
-      logging.info("Failed to retrieve BQ tables for dataset %s", dataset_id)
-      logging.info(sys.exc_info())
-    return list_of_tables
+       for dataset_id in dataset_ids},
+      next_request=bq_service.tables().list_next,
+    )
+    tables = dict()
+    for dataset_id in dataset_ids:
+      if dataset_id in failed:
+        logging.info("Failed to retrieve BQ tables for dataset %s", dataset_id)
+        logging.info(failed[dataset_id])
+      tables[dataset_id] = [
+        table for response in responses[dataset_id]
+        for table in response.get("tables", [])
+      ]
+    return tables
@@ -14,35 +14,108 @@
 
 import logging
 import sys
-from typing import Dict, Any, Union
+import threading
+from typing import Any, Dict, List, Optional, Union
 
 from googleapiclient import discovery
 
+from gcp_scanner.crawler import batch
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
+
+
+class BillingIndex:
+  '''Billing info of all projects linked to the accessible billing accounts.
+
+  billingAccounts.projects.list returns the billing info of all projects of
+  an account at once, so the index is built with a few calls per account
+  instead of one getBillingInfo call per project.
+  '''
+
+  def __init__(self):
+    self._projects: Dict[str, Dict[str, Any]] = dict()
+    self._built = False
+    self._lock = threading.Lock()
+
+  def build(self, service: discovery.Resource):
+    '''Lists the billing accounts and their projects, once.
+
+    Args:
+      service: A resource object for interacting with the Cloud Billing API.
+    '''
+
+    with self._lock:
+      if self._built:
+        return
+      self._built = True
+      try:
+        account_names = list()
+        request = service.billingAccounts().list(
+          fields="nextPageToken,billingAccounts(name)")
+        for response in paginate(request, service.billingAccounts().list_next):
+          for account in response.get("billingAccounts", []):
+            account_names.append(account["name"])
+
+        projects = service.billingAccounts().projects()
+        responses, failed = batch.execute_batched(
+          service,
+          {name: projects.list(name=name) for name in account_names},
+          next_request=projects.list_next,
+        )
+        for account_name in account_names:
+          if account_name in failed:
+            logging.info("Failed to list projects of billing account %s",
+                         account_name)
+            logging.info(failed[account_name])
+          for response in responses[account_name]:
+            for info in response.get("projectBillingInfo", []):
+              self._projects[info["projectId"]] = info
+      except Exception:
+        logging.info("Failed to list billing accounts")
+        logging.info(sys.exc_info())
+      logging.info("Indexed billing info of %d projects", len(self._projects))
+
+  def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+    '''Returns the billing info of the project, None if it is not indexed.'''
+    return self._projects.get(project_id)
 
 
 class CloudBillingAccountCrawler(ICrawler):
   '''Handle crawling of Cloud Billing Account data.'''
 
+  _config_dependency = True # the config carries the billing index
+
   def crawl(self, project_id: str, service: discovery.Resource,
-            config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
+            config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     '''Retrieve the Cloud Billing Account associated with the project.
 
-  Args:
-    project_id: A name of a project to query info about.
-    service: A resource object for interacting with the Cloud Billing API.
-    config: Configuration options for the crawler (Optional).
+    Scans of several projects pass a BillingIndex as billing_index in the
+    config, which is built on the first crawl. Projects on billing accounts
+    the credentials cannot list, or without billing, and scans of a single
+    project are looked up one by one.
+
+    Args:
+      project_id: A name of a project to query info about.
+      service: A resource object for interacting with the Cloud Billing API.
+      config: Configuration options for the crawler (Optional).
 
     Returns:
-      A list of resource objects representing the crawled data.
+      A list with the billing info of the project.
     '''
 
     logging.info("Retrieving CloudBillingAccount")
     billing_account = list()
     try:
-      request = service.projects().getBillingInfo(name=f"projects/{project_id}")
-      if request is not None:
-        response = request.execute()
+      info = None
+      index = (config or {}).get("billing_index")
+      if index is not None:
+        index.build(service)
+        info = index.get(project_id)
+      if info is not None:
+        billing_account.append(info)
+      else:
+        response = service.projects().getBillingInfo(
+          name=f"projects/{project_id}").execute()
         billing_account.append(response)
     except Exception:
       logging.info("Failed to retrieve CloudBillingAccount for project %s", project_id)
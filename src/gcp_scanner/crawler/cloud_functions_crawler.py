@@ -19,11 +19,14 @@ from typing import Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class CloudFunctionsCrawler(ICrawler):
   '''Handle crawling of Cloud Functions data.'''
 
+  _list_method = ("cloudfunctions", "v1", "projects.locations.functions.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
     '''Retrieve a list of Cloud Functions available in the project.
@@ -41,12 +44,11 @@ class CloudFunctionsCrawler(ICrawler):
     functions_list = list()
     try:
       request = service.projects().locations().functions().list(
-        parent=f"projects/{project_id}/locations/-")
-      while request is not None:
-        response = request.execute()
+        parent=f"projects/{project_id}/locations/-",
+        **self._list_kwargs(config))
+      for response in paginate(
+        request, service.projects().locations().functions().list_next):
         functions_list.extend(response.get("functions", []))
-        request = service.projects().locations().functions().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to retrieve CloudFunctions for project %s", project_id)
       logging.info(sys.exc_info())
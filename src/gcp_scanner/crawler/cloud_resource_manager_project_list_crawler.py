@@ -14,21 +14,26 @@
 
 import logging
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class CloudResourceManagerProjectListCrawler(ICrawler):
   '''Handle crawling of Cloud Resource Manager Project List data.'''
 
-  def crawl(self, service: discovery.Resource) -> List[Dict[str, Any]]:
+  _list_method = ("cloudresourcemanager", "v1", "projects.list")
+
+  def crawl(self, service: discovery.Resource,
+            config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     '''Retrieve a list of projects accessible by credentials provided.
 
     Args:
       service: A resource object for interacting with the Cloud Source API.
+      config: Configuration options for the crawler (Optional).
 
     Returns:
       A list of resource objects representing the crawled data.
@@ -37,12 +42,9 @@ class CloudResourceManagerProjectListCrawler(ICrawler):
     logging.info("Retrieving projects list")
     project_list = list()
     try:
-      request = service.projects().list()
-      while request is not None:
-        response = request.execute()
+      request = service.projects().list(**self._list_kwargs(config))
+      for response in paginate(request, service.projects().list_next):
         project_list.extend(response.get("projects",[]))
-        request = service.projects().list_next(
-            previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to enumerate projects")
       logging.info(sys.exc_info())
@@ -17,19 +17,25 @@ from typing import List, Dict, Any, Union
 
 from googleapiclient import discovery
 
-from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.interface_async_crawler import IAsyncCrawler
+from gcp_scanner.crawler.pagination import paginate_async
 
 
-class ComputeDisksCrawler(ICrawler):
+class ComputeDisksCrawler(IAsyncCrawler):
   """Handle crawling of compute disks data."""
 
-  def crawl(self, project_name: str, service: discovery.Resource,
-            config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
+  _list_method = ("compute", "v1", "disks.aggregatedList")
+
+  async def crawl_async(self, project_name: str, service: discovery.Resource,
+                        transport: Any,
+                        config: Dict[str, Union[bool, str]] = None
+                        ) -> List[Dict[str, Any]]:
     """Retrieve a list of Compute disks available in the project.
 
      Args:
          project_name: The name of the project to query information about.
          service: A resource object for interacting with the GCP API.
+         transport: Executes the requests, see IAsyncCrawler.
          config: Configuration options for the crawler (Optional).
 
      Returns:
@@ -38,16 +44,15 @@ class ComputeDisksCrawler(ICrawler):
     logging.info("Retrieving list of Compute Disk names")
     disk_names_list = list()
     try:
-      request = service.disks().aggregatedList(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.disks().aggregatedList(
+        project=project_name, **self._list_kwargs(config))
+      async for response in paginate_async(
+        request, service.disks().aggregatedList_next, transport):
         if response.get("items", None) is not None:
           disk_names_list.extend([
             disk for _, disks_scoped_list in response["items"].items()
             for disk in disks_scoped_list.get("disks", [])
           ])
-        request = service.disks().aggregatedList_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to enumerate compute disks in the %s", project_name)
       logging.info(sys.exc_info())
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ComputeFirewallRulesCrawler(ICrawler):
   """Handle crawling of compute firewall rules data."""
 
+  _list_method = ("compute", "v1", "firewalls.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of firewall rules in the project.
@@ -38,13 +41,11 @@ class ComputeFirewallRulesCrawler(ICrawler):
     logging.info("Retrieving Firewall Rules")
     firewall_rules_list = list()
     try:
-      request = service.firewalls().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.firewalls().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.firewalls().list_next):
         firewall_rules_list.extend([(firewall["name"],)
                                for firewall in response.get("items", [])])
-        request = service.firewalls().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get firewall rules in the %s", project_name)
       logging.info(sys.exc_info())
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ComputeImagesCrawler(ICrawler):
   """Handle crawling of compute images data."""
 
+  _list_method = ("compute", "v1", "images.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of Compute images available in the project.
@@ -39,12 +42,10 @@ class ComputeImagesCrawler(ICrawler):
     logging.info("Retrieving list of Compute Image names")
     images_result = list()
     try:
-      request = service.images().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.images().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.images().list_next):
         images_result.extend(response.get("items", []))
-        request = service.images().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to enumerate compute images in the %s", project_name)
       logging.info(sys.exc_info())
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ComputeSecurityPoliciesCrawler(ICrawler):
   """Handle crawling of compute security policies data."""
 
+  _list_method = ("compute", "v1", "securityPolicies.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of Compute security policies available in the project.
@@ -38,12 +41,10 @@ class ComputeSecurityPoliciesCrawler(ICrawler):
     logging.info("Retrieving list of Compute Security Policies")
     security_policies_list = list()
     try:
-      request = service.securityPolicies().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.securityPolicies().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.securityPolicies().list_next):
         security_policies_list.extend(response.get("items", []))
-        request = service.securityPolicies().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to enumerate compute security policies in the %s", project_name)
       logging.info(sys.exc_info())
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ComputeSnapshotsCrawler(ICrawler):
   """Handle crawling of compute snapshot data."""
 
+  _list_method = ("compute", "v1", "snapshots.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of Compute snapshots available in the project.
@@ -40,12 +43,10 @@ class ComputeSnapshotsCrawler(ICrawler):
     logging.info("Retrieving Compute Snapshots")
     snapshots_list = list()
     try:
-      request = service.snapshots().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.snapshots().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.snapshots().list_next):
         snapshots_list.extend(response.get("items", []))
-        request = service.snapshots().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get compute snapshots in the %s", project_name)
       logging.info(sys.exc_info())
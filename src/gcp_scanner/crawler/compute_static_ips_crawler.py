@@ -17,19 +17,25 @@ from typing import List, Dict, Any, Union
 
 from googleapiclient import discovery
 
-from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.interface_async_crawler import IAsyncCrawler
+from gcp_scanner.crawler.pagination import paginate_async
 
 
-class ComputeStaticIPsCrawler(ICrawler):
+class ComputeStaticIPsCrawler(IAsyncCrawler):
   """Handle crawling of static ips data."""
 
-  def crawl(self, project_name: str, service: discovery.Resource,
-            config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
+  _list_method = ("compute", "v1", "addresses.aggregatedList")
+
+  async def crawl_async(self, project_name: str, service: discovery.Resource,
+                        transport: Any,
+                        config: Dict[str, Union[bool, str]] = None
+                        ) -> List[Dict[str, Any]]:
     """Retrieve a list of static IPs available in the project.
 
     Args:
         project_name: The name of the project to query information about.
         service: A resource object for interacting with the GCP API.
+        transport: Executes the requests, see IAsyncCrawler.
         config: Configuration options for the crawler (Optional).
 
     Returns:
@@ -39,14 +45,13 @@ class ComputeStaticIPsCrawler(ICrawler):
 
     ips_list = list()
     try:
-      request = service.addresses().aggregatedList(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.addresses().aggregatedList(
+        project=project_name, **self._list_kwargs(config))
+      async for response in paginate_async(
+        request, service.addresses().aggregatedList_next, transport):
         ips_list.extend([{name: addresses_scoped_list}
                     for name, addresses_scoped_list in response["items"].items()
                     if addresses_scoped_list.get("addresses", None) is not None])
-        request = service.addresses().aggregatedList_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get static IPs in the %s", project_name)
       logging.info(sys.exc_info())
@@ -17,19 +17,25 @@ from typing import List, Dict, Any, Union
 
 from googleapiclient import discovery
 
-from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.interface_async_crawler import IAsyncCrawler
+from gcp_scanner.crawler.pagination import paginate_async
 
 
-class ComputeSubnetsCrawler(ICrawler):
+class ComputeSubnetsCrawler(IAsyncCrawler):
   """Handle crawling of compute subnets data."""
 
-  def crawl(self, project_name: str, service: discovery.Resource,
-            config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
+  _list_method = ("compute", "v1", "subnetworks.aggregatedList")
+
+  async def crawl_async(self, project_name: str, service: discovery.Resource,
+                        transport: Any,
+                        config: Dict[str, Union[bool, str]] = None
+                        ) -> List[Dict[str, Any]]:
     """Retrieve a list of subnets available in the project.
 
      Args:
          project_name: The name of the project to query information about.
          service: A resource object for interacting with the GCP API.
+         transport: Executes the requests, see IAsyncCrawler.
          config: Configuration options for the crawler (Optional).
 
      Returns:
@@ -38,13 +44,12 @@ class ComputeSubnetsCrawler(ICrawler):
     logging.info("Retrieving Subnets")
     subnets_list = list()
     try:
-      request = service.subnetworks().aggregatedList(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.subnetworks().aggregatedList(
+        project=project_name, **self._list_kwargs(config))
+      async for response in paginate_async(
+        request, service.subnetworks().aggregatedList_next, transport):
         if response.get("items", None) is not None:
           subnets_list.extend(list(response["items"].items()))
-        request = service.subnetworks().aggregatedList_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get subnets in the %s", project_name)
       logging.info(sys.exc_info())
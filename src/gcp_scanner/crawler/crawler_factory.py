@@ -14,73 +14,43 @@
 
 import logging
 
-from gcp_scanner.crawler.app_services_crawler import AppServicesCrawler
-from gcp_scanner.crawler.bigquery_crawler import BigQueryCrawler
-from gcp_scanner.crawler.bigtable_instances_crawler import BigTableInstancesCrawler
-from gcp_scanner.crawler.cloud_billing_account_crawler import CloudBillingAccountCrawler
-from gcp_scanner.crawler.cloud_functions_crawler import CloudFunctionsCrawler
-from gcp_scanner.crawler.cloud_resource_manager_iam_policy_crawler import CloudResourceManagerIAMPolicyCrawler
-from gcp_scanner.crawler.cloud_resource_manager_project_info_crawler import CloudResourceManagerProjectInfoCrawler
-from gcp_scanner.crawler.cloud_resource_manager_project_list_crawler import CloudResourceManagerProjectListCrawler
-from gcp_scanner.crawler.compute_disks_crawler import ComputeDisksCrawler
-from gcp_scanner.crawler.compute_firewall_rules_crawler import ComputeFirewallRulesCrawler
-from gcp_scanner.crawler.compute_images_crawler import ComputeImagesCrawler
-from gcp_scanner.crawler.compute_instances_crawler import ComputeInstancesCrawler
-from gcp_scanner.crawler.compute_security_policies_crawler import ComputeSecurityPoliciesCrawler
-from gcp_scanner.crawler.compute_snapshots_crawler import ComputeSnapshotsCrawler
-from gcp_scanner.crawler.compute_static_ips_crawler import ComputeStaticIPsCrawler
-from gcp_scanner.crawler.compute_subnets_crawler import ComputeSubnetsCrawler
-from gcp_scanner.crawler.datastore_crawler import DatastoreCrawler
-from gcp_scanner.crawler.dns_managed_zones_crawler import DNSManagedZonesCrawler
-from gcp_scanner.crawler.dns_policies_crawler import DNSPoliciesCrawler
-from gcp_scanner.crawler.domains_crawler import DomainsCrawler
-from gcp_scanner.crawler.endpoints_crawler import EndpointsCrawler
-from gcp_scanner.crawler.filestore_instances_crawler import FilestoreInstancesCrawler
-from gcp_scanner.crawler.firestore_collections_crawler import FirestoreCollectionsCrawler
-from gcp_scanner.crawler.kms_keys_crawler import KMSKeysCrawler
-from gcp_scanner.crawler.machine_images_crawler import ComputeMachineImagesCrawler
-from gcp_scanner.crawler.pubsub_subscriptions_crawler import PubSubSubscriptionsCrawler
-from gcp_scanner.crawler.service_accounts_crawler import ServiceAccountsCrawler
-from gcp_scanner.crawler.service_usage_crawler import ServiceUsageCrawler
-from gcp_scanner.crawler.source_repo_crawler import CloudSourceRepoCrawler
-from gcp_scanner.crawler.spanner_instances_crawler import SpannerInstancesCrawler
-from gcp_scanner.crawler.sql_instances_crawler import SQLInstancesCrawler
-from gcp_scanner.crawler.storage_buckets_crawler import StorageBucketsCrawler
+from gcp_scanner.lazy_import import LazyRegistry
 
-service_crawler_map = {
-  "app_services": AppServicesCrawler,
-  "bigtable_instances": BigTableInstancesCrawler,
-  "bq": BigQueryCrawler,
-  "cloud_billing_account": CloudBillingAccountCrawler,
-  "cloud_functions": CloudFunctionsCrawler,
-  "compute_disks": ComputeDisksCrawler,
-  "compute_images": ComputeImagesCrawler,
-  "compute_instances": ComputeInstancesCrawler,
-  "compute_security_policies": ComputeSecurityPoliciesCrawler,
-  "compute_snapshots": ComputeSnapshotsCrawler,
-  "datastore_kinds": DatastoreCrawler,
-  "dns_policies": DNSPoliciesCrawler,
-  "endpoints": EndpointsCrawler,
-  "filestore_instances": FilestoreInstancesCrawler,
-  "firestore_collections": FirestoreCollectionsCrawler,
-  "firewall_rules": ComputeFirewallRulesCrawler,
-  "iam_policy": CloudResourceManagerIAMPolicyCrawler,
-  "kms": KMSKeysCrawler,
-  "machine_images": ComputeMachineImagesCrawler,
-  "managed_zones": DNSManagedZonesCrawler,
-  "project_info": CloudResourceManagerProjectInfoCrawler,
-  "project_list": CloudResourceManagerProjectListCrawler,
-  "pubsub_subs": PubSubSubscriptionsCrawler,
-  "registered_domains": DomainsCrawler,
-  "services": ServiceUsageCrawler,
-  "service_accounts": ServiceAccountsCrawler,
-  "sourcerepos": CloudSourceRepoCrawler,
-  "spanner_instances": SpannerInstancesCrawler,
-  "sql_instances": SQLInstancesCrawler,
-  "static_ips": ComputeStaticIPsCrawler,
-  "storage_buckets": StorageBucketsCrawler,
-  "subnets": ComputeSubnetsCrawler,
-}
+# Crawler modules are imported when a crawler is first created.
+service_crawler_map = LazyRegistry({
+  "app_services": "gcp_scanner.crawler.app_services_crawler:AppServicesCrawler",
+  "bigtable_instances": "gcp_scanner.crawler.bigtable_instances_crawler:BigTableInstancesCrawler",
+  "bq": "gcp_scanner.crawler.bigquery_crawler:BigQueryCrawler",
+  "cloud_billing_account": "gcp_scanner.crawler.cloud_billing_account_crawler:CloudBillingAccountCrawler",
+  "cloud_functions": "gcp_scanner.crawler.cloud_functions_crawler:CloudFunctionsCrawler",
+  "compute_disks": "gcp_scanner.crawler.compute_disks_crawler:ComputeDisksCrawler",
+  "compute_images": "gcp_scanner.crawler.compute_images_crawler:ComputeImagesCrawler",
+  "compute_instances": "gcp_scanner.crawler.compute_instances_crawler:ComputeInstancesCrawler",
+  "compute_security_policies": "gcp_scanner.crawler.compute_security_policies_crawler:ComputeSecurityPoliciesCrawler",
+  "compute_snapshots": "gcp_scanner.crawler.compute_snapshots_crawler:ComputeSnapshotsCrawler",
+  "datastore_kinds": "gcp_scanner.crawler.datastore_crawler:DatastoreCrawler",
+  "dns_policies": "gcp_scanner.crawler.dns_policies_crawler:DNSPoliciesCrawler",
+  "endpoints": "gcp_scanner.crawler.endpoints_crawler:EndpointsCrawler",
+  "filestore_instances": "gcp_scanner.crawler.filestore_instances_crawler:FilestoreInstancesCrawler",
+  "firestore_collections": "gcp_scanner.crawler.firestore_collections_crawler:FirestoreCollectionsCrawler",
+  "firewall_rules": "gcp_scanner.crawler.compute_firewall_rules_crawler:ComputeFirewallRulesCrawler",
+  "iam_policy": "gcp_scanner.crawler.cloud_resource_manager_iam_policy_crawler:CloudResourceManagerIAMPolicyCrawler",
+  "kms": "gcp_scanner.crawler.kms_keys_crawler:KMSKeysCrawler",
+  "machine_images": "gcp_scanner.crawler.machine_images_crawler:ComputeMachineImagesCrawler",
+  "managed_zones": "gcp_scanner.crawler.dns_managed_zones_crawler:DNSManagedZonesCrawler",
+  "project_info": "gcp_scanner.crawler.cloud_resource_manager_project_info_crawler:CloudResourceManagerProjectInfoCrawler",
+  "project_list": "gcp_scanner.crawler.cloud_resource_manager_project_list_crawler:CloudResourceManagerProjectListCrawler",
+  "pubsub_subs": "gcp_scanner.crawler.pubsub_subscriptions_crawler:PubSubSubscriptionsCrawler",
+  "registered_domains": "gcp_scanner.crawler.domains_crawler:DomainsCrawler",
+  "services": "gcp_scanner.crawler.service_usage_crawler:ServiceUsageCrawler",
+  "service_accounts": "gcp_scanner.crawler.service_accounts_crawler:ServiceAccountsCrawler",
+  "sourcerepos": "gcp_scanner.crawler.source_repo_crawler:CloudSourceRepoCrawler",
+  "spanner_instances": "gcp_scanner.crawler.spanner_instances_crawler:SpannerInstancesCrawler",
+  "sql_instances": "gcp_scanner.crawler.sql_instances_crawler:SQLInstancesCrawler",
+  "static_ips": "gcp_scanner.crawler.compute_static_ips_crawler:ComputeStaticIPsCrawler",
+  "storage_buckets": "gcp_scanner.crawler.storage_buckets_crawler:StorageBucketsCrawler",
+  "subnets": "gcp_scanner.crawler.compute_subnets_crawler:ComputeSubnetsCrawler",
+})
 
 
 class CrawlerFactory:
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class DNSManagedZonesCrawler(ICrawler):
   """Handle crawling of dns managed zones data."""
 
+  _list_method = ("dns", "v1", "managedZones.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of DNS zones available in the project.
@@ -39,12 +42,10 @@ class DNSManagedZonesCrawler(ICrawler):
     zones_list = list()
 
     try:
-      request = service.managedZones().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.managedZones().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.managedZones().list_next):
         zones_list.extend(response.get("managedZones", []))
-        request = service.managedZones().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to enumerate DNS zones for project %s", project_name)
       logging.info(sys.exc_info())
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class DNSPoliciesCrawler(ICrawler):
   """Handle crawling of dns policies data."""
 
+  _list_method = ("dns", "v1", "policies.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of cloud DNS policies in the project.
@@ -40,17 +43,11 @@ class DNSPoliciesCrawler(ICrawler):
 
     request = service.policies().list(
       project=project_name,
-      maxResults=500
+      **self._list_kwargs(config, maxResults=500)
     )
     try:
-      while request is not None:
-        response = request.execute()
+      for response in paginate(request, service.policies().list_next):
         list_of_policies.extend(response.get("policies", None))
-
-        request = service.policies().list_next(
-          previous_request=request,
-          previous_response=response
-        )
     except Exception:
       logging.info("Failed to retrieve DNS policies for project %s", project_name)
       logging.info(sys.exc_info())
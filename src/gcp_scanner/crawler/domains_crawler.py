@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class DomainsCrawler(ICrawler):
   """Handle crawling of cloud domains data."""
 
+  _list_method = ("domains", "v1", "projects.locations.registrations.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of cloud domains available in the project.
@@ -39,15 +42,12 @@ class DomainsCrawler(ICrawler):
     registered_domains_list = list()
     parent = f"projects/{project_name}/locations/-"
     try:
-      request = service.projects().locations().registrations().list(parent=parent)
-      while request is not None:
-        response = request.execute()
+      request = service.projects().locations().registrations().list(
+        parent=parent, **self._list_kwargs(config))
+      for response in paginate(
+        request, service.projects().locations().registrations().list_next):
         if response.get("registrations", None) is not None:
           registered_domains_list.extend([registration['name'] for registration in response.get("registrations")])
-        request = service.projects().locations().registrations().list_next(
-          previous_request=request,
-          previous_response=response,
-        )
     except Exception:
       logging.info("Failed to enumerate cloud domains in the %s", project_name)
       logging.info(sys.exc_info())
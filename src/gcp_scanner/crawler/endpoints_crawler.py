@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class EndpointsCrawler(ICrawler):
   """Handle crawling of endpoints data."""
 
+  _list_method = ("servicemanagement", "v1", "services.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of Endpoints available in the project.
@@ -38,12 +41,10 @@ class EndpointsCrawler(ICrawler):
     logging.info("Retrieving info about endpoints")
     endpoints_list = list()
     try:
-      request = service.services().list(producerProjectId=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.services().list(
+        producerProjectId=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.services().list_next):
         endpoints_list.extend(response.get("services", []))
-        request = service.services().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to retrieve endpoints list for project %s", project_name)
       logging.info(sys.exc_info())
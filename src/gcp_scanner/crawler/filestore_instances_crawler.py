@@ -19,11 +19,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class FilestoreInstancesCrawler(ICrawler):
   '''Handle crawling of Filestore Instances data.'''
 
+  _list_method = ("file", "v1", "projects.locations.instances.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     '''Retrieve a list of Filestore instances available in the project.
@@ -41,12 +44,11 @@ class FilestoreInstancesCrawler(ICrawler):
     filestore_instances_list = list()
     try:
       request = service.projects().locations().instances().list(
-        parent=f"projects/{project_id}/locations/-")
-      while request is not None:
-        response = request.execute()
+        parent=f"projects/{project_id}/locations/-",
+        **self._list_kwargs(config))
+      for response in paginate(
+        request, service.projects().locations().instances().list_next):
         filestore_instances_list.extend(response.get("instances", []))
-        request = service.projects().locations().instances().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get filestore instances for project %s", project_id)
       logging.info(sys.exc_info())
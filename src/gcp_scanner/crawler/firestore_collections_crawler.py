@@ -19,6 +19,7 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class FirestoreCollectionsCrawler(ICrawler):
@@ -73,13 +74,11 @@ class FirestoreCollectionsCrawler(ICrawler):
         parent=f"{parent}/documents/*/**"
       )
       request.uri = request.uri.replace('/*/**', '')
-      while request is not None:
-        response = request.execute()
+      for response in paginate(
+        request,
+        service.projects().databases().documents().listCollectionIds_next,
+      ):
         list_of_collections_ids.extend(response.get("collectionIds", None))
-        request = service.projects().databases().documents().listCollectionIds_next(
-          previous_request=request,
-          previous_response=response,
-        )
     except Exception as ex:
       logging.info("Failed to retrieve Firestore collections for %s", parent)
       logging.info(sys.exc_info())
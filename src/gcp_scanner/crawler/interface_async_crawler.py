@@ -0,0 +1,91 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import asyncio
+import threading
+from abc import abstractmethod
+from typing import Any, Dict, List, Union
+
+from googleapiclient import discovery
+from googleapiclient import http
+
+from gcp_scanner import scheduler
+from gcp_scanner.crawler.interface_crawler import ICrawler
+
+# Event loops of the threads running async crawlers in the threaded engine.
+_loops = threading.local()
+
+
+def _thread_loop() -> asyncio.AbstractEventLoop:
+  loop = getattr(_loops, "loop", None)
+  if loop is None:
+    loop = asyncio.new_event_loop()
+    _loops.loop = loop
+  return loop
+
+
+class BlockingTransport:
+  """Transport executing requests on the request executor of the scan.
+
+  It is used when an async crawler runs in the threaded engine. The calling
+  thread waits for the request, while the next page fetched by
+  paginate_async() downloads on another thread.
+  """
+
+  async def execute(self, request: http.HttpRequest) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(
+        scheduler.request_executor(), request.execute)
+
+
+class IAsyncCrawler(ICrawler):
+  """Interface for Crawler Classes running on an asyncio event loop.
+
+  Async crawlers do not execute requests themselves. They build the requests
+  with the discovery service and await transport.execute(), so the asyncio
+  engine can keep thousands of paginated list calls in flight on one thread.
+
+  The synchronous crawl() method runs crawl_async() with a blocking
+  transport on an event loop kept per thread, so async crawlers still work
+  in the threaded engine.
+  """
+
+  @abstractmethod
+  async def crawl_async(self, project_name: str, service: discovery.Resource,
+                        transport: Any,
+                        config: Dict[str, Union[bool, str]] = None
+                        ) -> List[Dict[str, Any]]:
+    """Crawl resource data of the given project.
+
+    Args:
+        project_name: The name of the project to query information about.
+        service: A resource object for interacting with the GCP API.
+        transport: An object with an async execute(request) method returning
+          the deserialized response.
+        config: Configuration options for the crawler (Optional).
+
+    Returns:
+        A list of resource objects representing the crawled data.
+    """
+
+    raise NotImplementedError(
+        "Child class must implement the crawl_async() method.")
+
+  def crawl(self, project_name: str, service: discovery.Resource,
+            config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
+    loop = _thread_loop()
+    try:
+      return loop.run_until_complete(self.crawl_async(
+          project_name, service, BlockingTransport(), config))
+    finally:
+      loop.run_until_complete(loop.shutdown_asyncgens())
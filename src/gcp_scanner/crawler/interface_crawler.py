@@ -13,10 +13,18 @@
 #   limitations under the License.
 
 from abc import ABCMeta, abstractmethod
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 from googleapiclient import discovery
 
+from gcp_scanner.client.discovery_documents import method_description
+from gcp_scanner.client.discovery_documents import method_parameters
+
+# Options of the scan config sections passed to the main list request.
+LIST_OPTIONS = ("page_size", "filter", "fields")
+# Names of the page size parameter in the discovery documents.
+PAGE_SIZE_PARAMS = ("maxResults", "pageSize")
+
 
 class ICrawler(metaclass=ABCMeta):
   """Interface for Crawler Classes.
@@ -32,6 +40,14 @@ class ICrawler(metaclass=ABCMeta):
   """
   _config_dependency = False
 
+  """API, version and resource path of the main list request of the crawler,
+  e.g. ("compute", "v1", "instances.aggregatedList"). Its parameters decide
+  which LIST_OPTIONS the scan config may set.
+
+  Access Type: Private
+  """
+  _list_method: Optional[Tuple[str, str, str]] = None
+
   @staticmethod
   @abstractmethod
   def crawl(project_name: str, service: discovery.Resource,
@@ -60,7 +76,84 @@ class ICrawler(metaclass=ABCMeta):
   def has_config_dependency(self) -> bool:
     """Checks if the class needs a config file
 
+    Crawlers with a list request always get their config for LIST_OPTIONS.
+
     Returns:
         bool: Returns config_dependency private variable which is False by default.
     """
-    return self._config_dependency
\ No newline at end of file
+    return self._config_dependency or self._list_method is not None
+
+  def list_parameters(self) -> Dict[str, Dict[str, Any]]:
+    """Returns the parameters the main list request of the crawler supports.
+
+    Returns:
+        Descriptions of the parameters by name, empty if the crawler has no
+        list request.
+    """
+    if self._list_method is None:
+      return {}
+    return method_parameters(*self._list_method)
+
+  def list_api_name(self) -> Optional[str]:
+    """Returns the API name of the list request, e.g. sql for sqladmin.
+
+    It is the prefix of the method ID, as in ScannerHttpRequest.api_name.
+    """
+    if self._list_method is None:
+      return None
+    return method_description(*self._list_method)["id"].split(".")[0]
+
+  def page_size_param(self) -> Optional[str]:
+    """Returns the name of the page size parameter of the list request."""
+    parameters = self.list_parameters()
+    for name in PAGE_SIZE_PARAMS:
+      if name in parameters:
+        return name
+    return None
+
+  def _list_kwargs(self, config: Dict[str, Union[bool, str]] = None,
+                   **defaults: Any) -> Dict[str, Any]:
+    """Returns the arguments of the main list request.
+
+    Args:
+        config: Configuration options for the crawler (Optional).
+        defaults: Arguments used unless the config overrides them.
+
+    Returns:
+        A dict with the defaults updated with page_size, filter and fields
+        from the config. nextPageToken is added to fields of paginated
+        requests, so the mask does not stop the crawler after one page.
+    """
+    kwargs = dict(defaults)
+    if config is None:
+      return kwargs
+    if config.get("page_size"):
+      kwargs[self.page_size_param()] = int(config["page_size"])
+    if config.get("filter"):
+      kwargs["filter"] = config["filter"]
+    if config.get("fields"):
+      kwargs["fields"] = config["fields"]
+      if ("pageToken" in self.list_parameters()
+          and not {"*", "nextPageToken"} & _top_level_fields(
+              config["fields"])):
+        kwargs["fields"] += ",nextPageToken"
+    return kwargs
+
+
+def _top_level_fields(fields: str) -> Set[str]:
+  """Returns the top-level field names of a partial response mask.
+
+  E.g. {"items", "kind"} for items(name,zone),kind.
+  """
+  names, name, depth = set(), "", 0
+  for char in fields + ",":
+    if char == "(":
+      depth += 1
+    elif char == ")":
+      depth -= 1
+    elif depth == 0 and char == ",":
+      names.add(name.strip().split("/")[0])
+      name = ""
+    elif depth == 0:
+      name += char
+  return names
@@ -18,12 +18,21 @@ from typing import List, Dict, Any, Union
 
 from googleapiclient import discovery
 
+from gcp_scanner import location_cache
+from gcp_scanner import scheduler
+from gcp_scanner.crawler import batch
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
+
+# Resource type of KMS keyrings in the location cache.
+KEYRINGS_CACHE_TYPE = "kms_keyrings"
 
 
 class KMSKeysCrawler(ICrawler):
   '''Handle crawling of KMS Keys data.'''
 
+  _list_method = ("cloudkms", "v1", "projects.locations.keyRings.cryptoKeys.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     '''Retrieve a list of KMS Keys available in the project.
@@ -43,33 +52,75 @@ class KMSKeysCrawler(ICrawler):
       # list all possible locations
       locations_list = list()
       request = service.projects().locations().list(name=f"projects/{project_id}")
-      while request is not None:
-        response = request.execute()
+      for response in paginate(
+        request, service.projects().locations().list_next):
         for location in response.get("locations", []):
           locations_list.append(location["locationId"])
-        request = service.projects().locations().list_next(
-          previous_request=request, previous_response=response)
-
-      for location_id in locations_list:
-        request_loc = service.projects().locations().keyRings().list(
-          parent=f"projects/{project_id}/locations/{location_id}")
-        while request_loc is not None:
-          response_loc = request_loc.execute()
-          for keyring in response_loc.get("keyRings", []):
-            request = service.projects().locations().keyRings().cryptoKeys().list(
-              parent=keyring["name"])
-            while request is not None:
-              response = request.execute()
-              for key in response.get("cryptoKeys", []):
-                kms_keys_list.append(key)
-
-              request = service.projects().locations().keyRings().cryptoKeys(
-              ).list_next(
-                previous_request=request, previous_response=response)
-
-          request_loc = service.projects().locations().keyRings().list_next(
-            previous_request=request, previous_response=response)
+
+      # keyrings of all locations are listed in parallel on the request
+      # executor of the scan, populated locations first. Empty locations
+      # found by earlier crawls are skipped for a while.
+      locations_list = location_cache.plan(project_id, KEYRINGS_CACHE_TYPE,
+                                           locations_list)
+      executor = scheduler.request_executor()
+      pending = [
+        (location_id, executor.submit(
+          self.get_keyring_names, project_id, location_id, service))
+        for location_id in locations_list
+      ]
+      keyring_names = list()
+      for location_id, future in pending:
+        try:
+          found = future.result()
+        except Exception:
+          logging.info("Failed to retrieve KMS keyrings in location %s",
+                       location_id)
+          logging.info(sys.exc_info())
+          continue
+        location_cache.record(project_id, KEYRINGS_CACHE_TYPE, location_id,
+                              bool(found))
+        keyring_names.extend(found)
+
+      # keys of all keyrings are listed in batched requests
+      crypto_keys = service.projects().locations().keyRings().cryptoKeys()
+      responses, failed = batch.execute_batched(
+        service,
+        {name: crypto_keys.list(parent=name, **self._list_kwargs(config))
+         for name in keyring_names},
+        next_request=crypto_keys.list_next,
+      )
+      for keyring_name in keyring_names:
+        if keyring_name in failed:
+          logging.info("Failed to retrieve KMS keys for keyring %s",
+                       keyring_name)
+          logging.info(failed[keyring_name])
+        for response in responses[keyring_name]:
+          kms_keys_list.extend(response.get("cryptoKeys", []))
     except Exception:
       logging.info("Failed to retrieve KMS keys for project %s", project_id)
       logging.info(sys.exc_info())
     return kms_keys_list
+
+  @staticmethod
+  def get_keyring_names(project_id: str, location_id: str,
+                        service: discovery.Resource) -> List[str]:
+    '''Retrieve the names of the KMS keyrings in a location.
+
+    It runs on the request executor, so pages are not prefetched.
+
+    Args:
+      project_id: A name of a project to query info about.
+      location_id: A location of the project, e.g. us-central1.
+      service: A resource object for interacting with KMS API.
+
+    Returns:
+      A list of keyring names.
+    '''
+
+    keyrings = service.projects().locations().keyRings()
+    request = keyrings.list(
+      parent=f"projects/{project_id}/locations/{location_id}")
+    return [keyring["name"]
+            for response in paginate(request, keyrings.list_next,
+                                     prefetch=False)
+            for keyring in response.get("keyRings", [])]
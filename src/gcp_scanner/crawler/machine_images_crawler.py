@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ComputeMachineImagesCrawler(ICrawler):
   """Handle crawling of machine images data."""
 
+  _list_method = ("compute", "v1", "machineImages.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of Machine Images Resources available in the project.
@@ -38,13 +41,10 @@ class ComputeMachineImagesCrawler(ICrawler):
     logging.info("Retrieving list of Machine Images Resources")
     machine_images_list = list()
     try:
-      request = service.machineImages().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.machineImages().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.machineImages().list_next):
         machine_images_list.extend(response.get("items", []))
-        request = service.machineImages().list_next(
-          previous_request=request, previous_response=response
-        )
     except Exception:
       logging.info("Failed to enumerate machine images in the %s", project_name)
       logging.info(sys.exc_info())
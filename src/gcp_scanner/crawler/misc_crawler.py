@@ -16,16 +16,19 @@ This module provides miscellaneous crawler methods to crawl GCP resources using
 """
 import logging
 import sys
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, TYPE_CHECKING
 
-import requests
-from google.cloud import container_v1
 from requests.auth import HTTPBasicAuth
 
+from gcp_scanner import transport
+
+if TYPE_CHECKING:
+  from google.cloud import container_v1
+
 
 def get_gke_clusters(
-  project_name: str, gke_client: container_v1.services.cluster_manager.client
-  .ClusterManagerClient
+  project_name: str,
+  gke_client: "container_v1.services.cluster_manager.client.ClusterManagerClient"
 ) -> List[Tuple[str, str]]:
   """Retrieve a list of GKE clusters available in the project.
 
@@ -67,9 +70,10 @@ def get_gke_images(project_name: str, access_token: str) -> Dict[str, Any]:
   for region in regions:
     gcr_url = f"https://{region}gcr.io/v2/{project_name}/tags/list"
     try:
-      res = requests.get(
-        gcr_url, auth=HTTPBasicAuth("oauth2accesstoken", access_token),
-        timeout=120)
+      with transport.session() as session:
+        res = session.get(
+          gcr_url, auth=HTTPBasicAuth("oauth2accesstoken", access_token),
+          timeout=120)
       if not res.ok:
         logging.info("Failed to retrieve gcr images list. Status code: %d",
                      res.status_code)
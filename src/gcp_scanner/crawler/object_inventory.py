@@ -0,0 +1,335 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import gzip
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from googleapiclient import discovery
+
+from gcp_scanner.scheduler import BoundedExecutor
+
+# Fields of the listed objects.
+OBJECT_FIELDS = "nextPageToken,items(bucket,name,size,contentType,timeCreated)"
+
+# Number of buckets and prefix shards listed at the same time.
+DEFAULT_WORKERS = 8
+
+# Number of listed pages waiting for the writer.
+DEFAULT_QUEUE_SIZE = 16
+
+# Number of seconds between saves of the resume state.
+STATE_SAVE_INTERVAL = 5
+
+# Number of pages after which a prefix shard is split by its sub-prefixes.
+DEFAULT_SPLIT_AFTER_PAGES = 100
+
+
+def _shard(prefix: str = "", start_offset: str = "", depth: int = 0,
+           delimited: bool = False) -> Dict[str, Any]:
+  """Returns a shard listing objects of a bucket under prefix.
+
+  Delimited shards list the objects directly under the prefix and turn its
+  sub-prefixes into new shards. Other shards list all objects under the
+  prefix from start_offset.
+  """
+  return {"prefix": prefix, "start_offset": start_offset, "depth": depth,
+          "delimited": delimited, "page_token": None, "done": False}
+
+
+def _shard_key(shard: Dict[str, Any]) -> str:
+  return json.dumps([shard["prefix"], shard["start_offset"],
+                     shard["delimited"]])
+
+
+class ObjectInventory:
+  """Lists objects of buckets in parallel into an NDJSON file.
+
+  Buckets are listed by a pool of workers. With prefix_depth set, a bucket
+  is split into shards by the prefixes of object names up to that depth,
+  e.g. logs/2023/, and the shards are listed in parallel. A shard still
+  unfinished after split_after_pages pages lists the rest of its prefix
+  delimited by / instead, so its sub-prefixes become new shards.
+
+  Pages go through a bounded queue to a single writer thread, which writes
+  one compact JSON object per line, optionally gzip compressed. Every few
+  seconds the writer flushes the output, ending the current gzip member,
+  and saves the size of the output with the next page token of each shard
+  into a state file next to the output. A later run with the same output
+  path truncates the output to the saved size, dropping pages written
+  after the last save and a gzip member cut by a crash, then skips
+  finished buckets and continues the others from their last saved pages.
+  """
+
+  def __init__(self, service: discovery.Resource, output_path: str,
+               workers: int = DEFAULT_WORKERS,
+               max_objects_per_bucket: Optional[int] = None,
+               compress: bool = False,
+               prefix_depth: int = 0,
+               split_after_pages: int = DEFAULT_SPLIT_AFTER_PAGES,
+               queue_size: int = DEFAULT_QUEUE_SIZE):
+    """Initialize the inventory and load the state of an earlier run.
+
+    Args:
+      service: A resource object for interacting with the storage API.
+      output_path: Path of the NDJSON file. .gz is appended if compressed.
+      workers: Number of buckets and shards listed at the same time.
+      max_objects_per_bucket: Maximum number of objects listed per bucket,
+        0 or None for all of them.
+      compress: Whether to gzip the output.
+      prefix_depth: Number of / delimited prefix levels buckets are split
+        into shards by, 0 to list every bucket as a whole.
+      split_after_pages: Number of pages after which a shard is split by
+        its sub-prefixes. Used only when prefix_depth is set.
+      queue_size: Number of listed pages waiting for the writer.
+    """
+
+    self.service = service
+    self.output_path = str(output_path) + (".gz" if compress else "")
+    self.state_path = f"{self.output_path}.state.json"
+    self.max_objects_per_bucket = max_objects_per_bucket
+    self.compress = compress
+    self.prefix_depth = prefix_depth
+    self.split_after_pages = split_after_pages if prefix_depth else 0
+    self._pages: queue.Queue = queue.Queue(maxsize=queue_size)
+    # shards waiting for a worker, workers add the shards they discover
+    self._shards: queue.Queue = queue.Queue()
+    self._state: Dict[str, Dict[str, Any]] = dict()
+    # size of the output when the state was saved
+    self._offset = 0
+    # objects listed so far by bucket, to stop at max_objects_per_bucket
+    self._counts: Dict[str, int] = dict()
+    self._lock = threading.Lock()
+    self._idle = threading.Condition(self._lock)
+    self._scheduled = 0
+    self._load_state()
+    # a run without state starts a new file, otherwise the last run is
+    # continued after its last saved page
+    if self._state and os.path.exists(self.output_path):
+      self._out = open(self.output_path, "r+b")
+      self._out.truncate(self._offset)
+      self._out.seek(self._offset)
+    else:
+      self._state, self._counts, self._offset = dict(), dict(), 0
+      self._out = open(self.output_path, "wb")
+    # the gzip member written since the last save
+    self._member: Optional[gzip.GzipFile] = None
+    # the writer and the workers run in the crawler's context, e.g. its
+    # negative cache scope
+    self._workers = max(1, int(workers))
+    self._executor = BoundedExecutor(self._workers + 1, "gcs-objects")
+    self._writer = self._executor.submit(self._write)
+    self._worker_futures = [self._executor.submit(self._work)
+                            for _ in range(self._workers)]
+
+  def _load_state(self):
+    if not os.path.exists(self.state_path):
+      return
+    try:
+      with open(self.state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+      self._offset = state["offset"]
+      self._state = state["buckets"]
+    except Exception:
+      logging.error("Failed to load object inventory state from %s",
+                    self.state_path)
+      logging.error(sys.exc_info()[1])
+      return
+    for bucket_name, bucket_state in self._state.items():
+      self._counts[bucket_name] = bucket_state["count"]
+    logging.info("Resuming object inventory of %d buckets from %s",
+                 len(self._state), self.state_path)
+
+  def _save_state(self):
+    with self._lock:
+      data = json.dumps({"offset": self._offset, "buckets": self._state})
+    tmp_path = f"{self.state_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      f.write(data)
+    os.replace(tmp_path, self.state_path)
+
+  def add_bucket(self, bucket_name: str):
+    """Schedules listing of a bucket."""
+
+    with self._lock:
+      bucket_state = self._state.get(bucket_name)
+      if bucket_state is None:
+        shards = [_shard(delimited=self.prefix_depth > 0)]
+      else:
+        shards = [dict(shard) for shard in bucket_state["shards"].values()
+                  if not shard["done"]]
+    for shard in shards:
+      self._schedule(bucket_name, shard)
+
+  def _schedule(self, bucket_name: str, shard: Dict[str, Any]):
+    with self._lock:
+      self._scheduled += 1
+    self._shards.put((bucket_name, shard))
+
+  def _work(self):
+    while True:
+      task = self._shards.get()
+      if task is None:
+        return
+      try:
+        self._list_shard(*task)
+      finally:
+        with self._idle:
+          self._scheduled -= 1
+          self._idle.notify_all()
+
+  def _take(self, bucket_name: str, items: List[Any]) -> Optional[List[Any]]:
+    """Counts listed objects, returns None once the bucket cap is reached."""
+
+    with self._lock:
+      count = self._counts.get(bucket_name, 0)
+      if self.max_objects_per_bucket:
+        if count >= self.max_objects_per_bucket:
+          return None
+        items = items[:self.max_objects_per_bucket - count]
+      self._counts[bucket_name] = count + len(items)
+    return items
+
+  def _list_shard(self, bucket_name: str, shard: Dict[str, Any]):
+    shard = dict(shard)
+    pages = 0
+    try:
+      while True:
+        kwargs = dict()
+        if shard["prefix"]:
+          kwargs["prefix"] = shard["prefix"]
+        if shard["start_offset"]:
+          kwargs["startOffset"] = shard["start_offset"]
+        if shard["page_token"]:
+          kwargs["pageToken"] = shard["page_token"]
+        fields = OBJECT_FIELDS
+        if shard["delimited"]:
+          kwargs["delimiter"] = "/"
+          fields += ",prefixes"
+        response = self.service.objects().list(
+          bucket=bucket_name, fields=fields, **kwargs).execute()
+        pages += 1
+
+        items = self._take(bucket_name, response.get("items", []))
+        if items is None:
+          logging.info("Listed the first %d objects of the bucket %s",
+                       self.max_objects_per_bucket, bucket_name)
+          items, children = [], []
+          shard.update(page_token=None, done=True)
+        else:
+          children = list()
+          if shard["delimited"]:
+            depth = shard["depth"] + 1
+            children = [
+              _shard(prefix, shard["start_offset"], depth,
+                     depth < self.prefix_depth)
+              for prefix in response.get("prefixes", [])
+            ]
+          page_token = response.get("nextPageToken")
+          shard.update(page_token=page_token, done=page_token is None)
+          if (not shard["done"] and not shard["delimited"] and items
+              and self.split_after_pages
+              and pages >= self.split_after_pages):
+            # the rest of the prefix is listed by its direct objects and
+            # sub-prefixes, which become shards listed in parallel
+            children = [_shard(shard["prefix"], items[-1]["name"] + "\0",
+                               shard["depth"], True)]
+            shard.update(page_token=None, done=True)
+
+        # the state is saved by the writer once the page is written
+        self._pages.put((bucket_name, items, _shard_key(shard), dict(shard),
+                         children))
+        for child in children:
+          self._schedule(bucket_name, child)
+        if shard["done"]:
+          return
+    except Exception:
+      logging.info("Failed to read the bucket %s", bucket_name)
+      logging.info(sys.exc_info())
+
+  def _write(self):
+    last_save = time.monotonic()
+    while True:
+      page = self._pages.get()
+      if page is None:
+        break
+      bucket_name, items, key, shard, children = page
+      try:
+        data = "".join(json.dumps(item, separators=(",", ":")) + "\n"
+                       for item in items).encode("utf-8")
+        if self.compress:
+          if self._member is None:
+            self._member = gzip.GzipFile(fileobj=self._out, mode="wb")
+          self._member.write(data)
+        else:
+          self._out.write(data)
+        with self._lock:
+          bucket_state = self._state.setdefault(
+            bucket_name, {"count": 0, "shards": {}})
+          bucket_state["count"] += len(items)
+          bucket_state["shards"][key] = shard
+          for child in children:
+            bucket_state["shards"].setdefault(_shard_key(child), child)
+        if time.monotonic() - last_save >= STATE_SAVE_INTERVAL:
+          self._checkpoint()
+          last_save = time.monotonic()
+      except Exception:
+        logging.error("Failed to write objects of the bucket %s", bucket_name)
+        logging.error(sys.exc_info()[1])
+    try:
+      self._checkpoint()
+    except Exception:
+      logging.error("Failed to save object inventory state to %s",
+                    self.state_path)
+      logging.error(sys.exc_info()[1])
+
+  def _checkpoint(self):
+    # the state must never be ahead of the output, and the saved size must
+    # end a complete gzip member
+    if self._member is not None:
+      self._member.close()
+      self._member = None
+    self._out.flush()
+    self._offset = self._out.tell()
+    self._save_state()
+
+  def close(self):
+    """Waits for scheduled buckets and closes the output."""
+
+    with self._idle:
+      while self._scheduled:
+        self._idle.wait()
+    for _ in range(self._workers):
+      self._shards.put(None)
+    for worker in self._worker_futures:
+      worker.result()
+    self._pages.put(None)
+    self._writer.result()
+    self._executor.shutdown(wait=True)
+    if self._member is not None:
+      self._member.close()
+    self._out.close()
+
+  def __enter__(self) -> "ObjectInventory":
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+    return False
@@ -0,0 +1,104 @@
+#  Copyright 2023 Google LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from googleapiclient import http
+
+from gcp_scanner import scheduler
+
+NextRequestFn = Callable[[http.HttpRequest, Dict[str, Any]],
+                         Optional[http.HttpRequest]]
+
+
+def paginate(request: http.HttpRequest, next_request: NextRequestFn,
+             prefetch: bool = True) -> Iterator[Dict[str, Any]]:
+  """Yields the response of the request and of its following pages.
+
+  The next page is requested in the background as soon as the page token
+  is known, so it downloads while the caller processes the current page.
+  Pages are fetched on the request executor of the scan, so tasks of that
+  executor must pass prefetch=False.
+
+  Args:
+    request: request of the first page.
+    next_request: function returning the request of the next page from the
+      previous request and response, e.g. service.instances().list_next.
+    prefetch: whether to fetch the next page in the background.
+
+  Yields:
+    Deserialized responses, one per page.
+  """
+
+  future = None
+  try:
+    response = request.execute()
+    while True:
+      following = next_request(request, response)
+      if following is not None and prefetch:
+        future = scheduler.request_executor().submit(following.execute)
+      yield response
+      if following is None:
+        return
+      if future is not None:
+        response = future.result()
+        future = None
+      else:
+        response = following.execute()
+      request = following
+  finally:
+    # the caller stopped early, the prefetched page is not needed
+    if future is not None:
+      future.cancel()
+
+
+async def paginate_async(request: http.HttpRequest,
+                         next_request: NextRequestFn,
+                         transport: Any) -> AsyncIterator[Dict[str, Any]]:
+  """Yields the response of the request and of its following pages.
+
+  The asyncio counterpart of paginate(), for IAsyncCrawler crawlers. The
+  next page is requested as a task while the caller processes the current
+  page.
+
+  Args:
+    request: request of the first page.
+    next_request: function returning the request of the next page.
+    transport: an object with an async execute(request) method, see
+      IAsyncCrawler.
+
+  Yields:
+    Deserialized responses, one per page.
+  """
+
+  task = None
+  try:
+    response = await transport.execute(request)
+    while True:
+      following = next_request(request, response)
+      if following is not None:
+        task = asyncio.ensure_future(transport.execute(following))
+        # the request is sent before the caller gets the page, since the
+        # caller may not await anything while processing it
+        await asyncio.sleep(0)
+      yield response
+      if following is None:
+        return
+      response = await task
+      task = None
+      request = following
+  finally:
+    if task is not None:
+      task.cancel()
@@ -19,11 +19,14 @@ from typing import Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class PubSubSubscriptionsCrawler(ICrawler):
   '''Handle crawling of PubSub Subscriptions data.'''
 
+  _list_method = ("pubsub", "v1", "projects.subscriptions.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
     '''Retrieve a list of PubSub subscriptions available in the project.
@@ -42,12 +45,10 @@ class PubSubSubscriptionsCrawler(ICrawler):
     try:
 
       request = service.projects().subscriptions().list(
-        project=f"projects/{project_id}")
-      while request is not None:
-        response = request.execute()
+        project=f"projects/{project_id}", **self._list_kwargs(config))
+      for response in paginate(
+        request, service.projects().subscriptions().list_next):
         pubsubs_list.extend(response.get("subscriptions", []))
-        request = service.projects().subscriptions().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get PubSubs for project %s", project_id)
       logging.info(sys.exc_info())
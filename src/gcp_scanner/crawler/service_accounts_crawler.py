@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ServiceAccountsCrawler(ICrawler):
   """Handle crawling of service accounts data."""
 
+  _list_method = ("iam", "v1", "projects.serviceAccounts.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of service accounts in the project.
@@ -41,15 +44,13 @@ class ServiceAccountsCrawler(ICrawler):
     name = f"projects/{project_name}"
 
     try:
-      request = service.projects().serviceAccounts().list(name=name)
-      while request is not None:
-        response = request.execute()
+      request = service.projects().serviceAccounts().list(
+        name=name, **self._list_kwargs(config))
+      for response in paginate(
+        request, service.projects().serviceAccounts().list_next):
         service_accounts.extend([(service_account["email"],
                              service_account.get("description", ""))
                             for service_account in response.get("accounts", [])])
-
-        request = service.projects().serviceAccounts().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to retrieve SA list for project %s", project_name)
       logging.info(sys.exc_info())
@@ -18,11 +18,14 @@ from typing import List, Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class ServiceUsageCrawler(ICrawler):
   """Handle crawling of service usage data."""
 
+  _list_method = ("serviceusage", "v1", "services.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> List[Dict[str, Any]]:
     """Retrieve a list of services enabled in the project.
@@ -39,14 +42,11 @@ class ServiceUsageCrawler(ICrawler):
     list_of_services = list()
 
     request = service.services().list(
-      parent="projects/" + project_name, pageSize=200, filter="state:ENABLED")
+      parent="projects/" + project_name,
+      **self._list_kwargs(config, pageSize=200, filter="state:ENABLED"))
     try:
-      while request is not None:
-        response = request.execute()
+      for response in paginate(request, service.services().list_next):
         list_of_services.extend(response.get("services", []))
-
-        request = service.services().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to retrieve services for project %s", project_name)
       logging.info(sys.exc_info())
@@ -19,11 +19,14 @@ from typing import Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class CloudSourceRepoCrawler(ICrawler):
   '''Handle crawling of Cloud Source Repo data.'''
 
+  _list_method = ("sourcerepo", "v1", "projects.repos.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
     """Retrieve a list of cloud source repositories enabled in the project.
@@ -42,17 +45,11 @@ class CloudSourceRepoCrawler(ICrawler):
 
     request = service.projects().repos().list(
       name="projects/" + project_id,
-      pageSize=500
+      **self._list_kwargs(config, pageSize=500)
     )
     try:
-      while request is not None:
-        response = request.execute()
+      for response in paginate(request, service.projects().repos().list_next):
         list_of_repos.extend(response.get("repos", None))
-
-        request = service.projects().repos().list_next(
-          previous_request=request,
-          previous_response=response
-        )
     except Exception:
       logging.info("Failed to retrieve source repos for project %s", project_id)
       logging.info(sys.exc_info())
@@ -19,11 +19,14 @@ from typing import Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class SpannerInstancesCrawler(ICrawler):
   '''Handle crawling of Spanner Instances data.'''
 
+  _list_method = ("spanner", "v1", "projects.instances.list")
+
   def crawl(self, project_id: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
     '''Retrieve a list of Spanner instances available in the project.
@@ -41,12 +44,10 @@ class SpannerInstancesCrawler(ICrawler):
     spanner_instances_list = list()
     try:
       request = service.projects().instances().list(
-        parent=f"projects/{project_id}")
-      while request is not None:
-        response = request.execute()
+        parent=f"projects/{project_id}", **self._list_kwargs(config))
+      for response in paginate(
+        request, service.projects().instances().list_next):
         spanner_instances_list.extend(response.get("instances", []))
-        request = service.projects().instances().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to retrieve Spanner instances for project %s",
                    project_id)
@@ -19,11 +19,14 @@ from typing import Dict, Any, Union
 from googleapiclient import discovery
 
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class SQLInstancesCrawler(ICrawler):
   '''Handle crawling of SQL Instances data.'''
 
+  _list_method = ("sqladmin", "v1beta4", "instances.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Any]:
     '''Retrieve a list of SQL instances available in the project.
@@ -40,12 +43,10 @@ class SQLInstancesCrawler(ICrawler):
     logging.info("Retrieving CloudSQL Instances")
     sql_instances_list = list()
     try:
-      request = service.instances().list(project=project_name)
-      while request is not None:
-        response = request.execute()
+      request = service.instances().list(
+        project=project_name, **self._list_kwargs(config))
+      for response in paginate(request, service.instances().list_next):
         sql_instances_list.extend(response.get("items", []))
-        request = service.instances().list_next(
-          previous_request=request, previous_response=response)
     except Exception:
       logging.info("Failed to get SQL instances for project %s", project_name)
       logging.info(sys.exc_info())
@@ -11,14 +11,17 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
-import json
 import logging
 import sys
-from typing import List, Dict, Any, Union, Tuple, TextIO, Optional
+from typing import List, Dict, Any, Union, Tuple, Optional
 
-from googleapiclient import discovery, errors
+from googleapiclient import discovery
 
+from gcp_scanner.crawler import batch
+from gcp_scanner.crawler import object_inventory
+from gcp_scanner.crawler.object_inventory import ObjectInventory
 from gcp_scanner.crawler.interface_crawler import ICrawler
+from gcp_scanner.crawler.pagination import paginate
 
 
 class StorageBucketsCrawler(ICrawler):
@@ -26,6 +29,8 @@ class StorageBucketsCrawler(ICrawler):
 
   _config_dependency = True # Define that config file is needed
 
+  _list_method = ("storage", "v1", "buckets.list")
+
   def crawl(self, project_name: str, service: discovery.Resource,
             config: Dict[str, Union[bool, str]] = None) -> Dict[str, Tuple[Any, List[Any]]]:
     """Retrieve a list of buckets available in the project.
@@ -40,44 +45,31 @@ class StorageBucketsCrawler(ICrawler):
      """
     logging.info("Retrieving GCS Buckets")
     # prepare additional configs
-    dump_fd = self._get_dump_file_dir(config=config)
+    inventory = self._get_object_inventory(service, config=config)
     is_dump_iam_policies = self._get_is_dump_iam_policies(config=config)
     # output dict
     buckets_dict = dict()
     # Make an authenticated API request
-    request = service.buckets().list(project=project_name)
-    while request is not None:
-      try:
-        response = request.execute()
-      except Exception:
-        logging.info("Failed to list buckets in the %s", project_name)
-        logging.info(sys.exc_info())
-        break
-
-      for bucket in response.get("items", []):
-        buckets_dict[bucket["name"]] = bucket
+    request = service.buckets().list(
+      project=project_name, **self._list_kwargs(config))
+    try:
+      for response in paginate(request, service.buckets().list_next):
+        buckets = response.get("items", [])
         if is_dump_iam_policies is True:
-          buckets_dict[bucket["name"]]["iam_policy"] = self._get_bucket_iam(bucket["name"], service)
-        if dump_fd is not None:
-          ret_fields = "nextPageToken,items(bucket,name,size,contentType, timeCreated)"
-          req = service.objects().list(bucket=bucket["name"], fields=ret_fields)
-
-          while req:
-            try:
-              resp = req.execute()
-              for item in resp.get("items", []):
-                dump_fd.write(json.dumps(item, indent=2, sort_keys=False))
-
-              req = service.objects().list_next(req, resp)
-            except errors.HttpError:
-              logging.info("Failed to read the bucket %s", bucket["name"])
-              logging.info(sys.exc_info())
-              break
-
-      request = service.buckets().list_next(
-        previous_request=request, previous_response=response)
-    if dump_fd is not None:
-      dump_fd.close()
+          bucket_iam_policies = self._get_buckets_iam(
+            [bucket["name"] for bucket in buckets], service)
+        for bucket in buckets:
+          buckets_dict[bucket["name"]] = bucket
+          if is_dump_iam_policies is True:
+            buckets_dict[bucket["name"]]["iam_policy"] = bucket_iam_policies[bucket["name"]]
+          if inventory is not None:
+            # objects are listed in the background while buckets are crawled
+            inventory.add_bucket(bucket["name"])
+    except Exception:
+      logging.info("Failed to list buckets in the %s", project_name)
+      logging.info(sys.exc_info())
+    if inventory is not None:
+      inventory.close()
     return buckets_dict
   
   @property
@@ -90,46 +82,64 @@ class StorageBucketsCrawler(ICrawler):
     return self._config_dependency
 
   @classmethod
-  def _get_bucket_iam(cls, bucket_name: str, service: discovery.Resource) -> List[Any]:
-    """Retrieve IAM policies in the bucket.
+  def _get_buckets_iam(cls, bucket_names: List[str],
+                       service: discovery.Resource) -> Dict[str, List[Any]]:
+    """Retrieve IAM policies of the buckets in batched requests.
 
     Args:
-      bucket_name: A name of bucket to query info about.
+      bucket_names: Names of buckets to query info about.
       service: An authenticated API request.
     Returns:
-      A list with bucket IAM policies.
+      A dict with bucket IAM policies by bucket name.
     """
 
-    logging.info("Retrieving GCS Bucket %s IAM Policy", bucket_name)
-    bucket_iam_policies = list()
-    request = service.buckets().getIamPolicy(bucket=bucket_name)
-    try:
-      response = request.execute()
-    except Exception:
-      logging.info("Failed to IAM Policy in the %s", bucket_name)
-      logging.info(sys.exc_info())
-      return []
-
-    for bucket_iam_policy in response.get("bindings", []):
-      bucket_iam_policies.append(bucket_iam_policy)
+    logging.info("Retrieving IAM Policies of %d GCS Buckets", len(bucket_names))
+    responses, failed = batch.execute_batched(
+      service,
+      {name: service.buckets().getIamPolicy(bucket=name) for name in bucket_names},
+    )
+    bucket_iam_policies = dict()
+    for bucket_name in bucket_names:
+      if bucket_name in failed:
+        logging.info("Failed to IAM Policy in the %s", bucket_name)
+        logging.info(failed[bucket_name])
+        bucket_iam_policies[bucket_name] = []
+        continue
+      bucket_iam_policies[bucket_name] = [
+        binding for response in responses[bucket_name]
+        for binding in response.get("bindings", [])
+      ]
 
     return bucket_iam_policies
 
   @classmethod
-  def _get_dump_file_dir(cls, config: Dict[str, Union[bool, str]]) -> Optional[TextIO]:
-    """Get the dump file directory based on the provided configuration.
+  def _get_object_inventory(cls, service: discovery.Resource,
+                            config: Dict[str, Union[bool, str]]) -> Optional[ObjectInventory]:
+    """Get the object inventory based on the provided configuration.
 
     Args:
-        config: Configuration dictionary with keys 'fetch_file_names' (bool) and 'gcs_output_path' (str).
+        service: A resource object for interacting with the GCP API.
+        config: Configuration dictionary with keys 'fetch_file_names' (bool), 'gcs_output_path' (str),
+          'file_names_workers' (int), 'max_file_names_per_bucket' (int), 'compress_file_names' (bool),
+          'file_names_prefix_depth' (int) and 'file_names_split_after_pages' (int).
 
     Returns:
-        TextIO object for the dump file if 'fetch_file_names' is True and 'gcs_output_path' is provided. Otherwise, None.
+        ObjectInventory writing to 'gcs_output_path' if 'fetch_file_names' is True. Otherwise, None.
     """
-    dump_file_names = None
-    if config is not None and config.get('fetch_file_names', False) is True:
-      gcs_output_path = config.get('gcs_output_path', '')  # think a good fallback if gcs_output_path is not set
-      dump_file_names = open(gcs_output_path, 'w', encoding='utf-8')
-    return dump_file_names
+    if config is None or config.get('fetch_file_names', False) is not True:
+      return None
+    gcs_output_path = config.get('gcs_output_path', '')  # think a good fallback if gcs_output_path is not set
+    return ObjectInventory(
+      service,
+      gcs_output_path,
+      workers=config.get('file_names_workers', object_inventory.DEFAULT_WORKERS),
+      max_objects_per_bucket=config.get('max_file_names_per_bucket'),
+      compress=config.get('compress_file_names', False) is True,
+      prefix_depth=config.get('file_names_prefix_depth', 0),
+      split_after_pages=config.get(
+        'file_names_split_after_pages',
+        object_inventory.DEFAULT_SPLIT_AFTER_PAGES),
+    )
 
   @classmethod
   def _get_is_dump_iam_policies(cls, config: Dict[str, Union[bool, str]]) -> bool:
@@ -0,0 +1,138 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to keep access token credentials fresh during long scans.
+
+"""
+
+import datetime
+import logging
+import threading
+from typing import Callable, List, Optional, Tuple
+import weakref
+
+from google.auth import _helpers
+from google.auth import exceptions
+from google.oauth2 import credentials
+
+# Tokens are re-minted once they have less than this much time left.
+DEFAULT_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# A function returning a new (access token, naive UTC expiry) pair.
+Minter = Callable[[], Tuple[str, Optional[datetime.datetime]]]
+
+
+class ManagedCredentials(credentials.Credentials):
+  """Access token credentials that are re-minted before they expire.
+
+  The token is refreshed by calling the minter, e.g. generateAccessToken for
+  impersonated service accounts. Only one thread refreshes at a time. Threads
+  that were waiting for the refresh reuse the new token instead of minting
+  their own. Credentials without a minter cannot be refreshed and fail with
+  RefreshError once expired.
+  """
+
+  def __init__(self, token: str, expiry: Optional[datetime.datetime],
+               scopes: Optional[List[str]], name: str,
+               minter: Optional[Minter] = None,
+               refresh_margin: datetime.timedelta = DEFAULT_REFRESH_MARGIN):
+    """Initialize the credentials.
+
+    Args:
+      token: the current access token.
+      expiry: naive UTC expiry of the token, None if unknown.
+      scopes: OAuth scopes of the token.
+      name: name of the identity, used in logs.
+      minter: function minting a new token (Optional).
+      refresh_margin: how long before expiry the token is re-minted.
+    """
+
+    super().__init__(token, expiry=expiry, scopes=scopes)
+    self.name = name
+    self._minter = minter
+    self._refresh_margin = refresh_margin
+    self._refresh_lock = threading.Lock()
+    self._generation = 0
+    self.refresh_count = 0
+
+  @property
+  def expired(self) -> bool:
+    if not self.expiry:
+      return False
+    # tokens that cannot be re-minted are used until they actually expire
+    margin = self._refresh_margin if self.refreshable else datetime.timedelta()
+    return _helpers.utcnow() >= self.expiry - margin
+
+  @property
+  def refreshable(self) -> bool:
+    return self._minter is not None
+
+  def refresh(self, request):
+    """Re-mints the token, unless another thread has just done it."""
+
+    generation = self._generation
+    with self._refresh_lock:
+      if generation != self._generation:
+        # refreshed by another thread while we were waiting for the lock
+        return
+      if self._minter is None:
+        raise exceptions.RefreshError(
+            f'The access token of {self.name} expired and cannot be refreshed.'
+        )
+      logging.info('Refreshing access token of %s', self.name)
+      self.token, self.expiry = self._minter()
+      self._generation += 1
+      self.refresh_count += 1
+
+
+class CredentialManager:
+  """Issues ManagedCredentials and keeps track of their expiry."""
+
+  def __init__(self, refresh_margin: datetime.timedelta =
+               DEFAULT_REFRESH_MARGIN):
+    self.refresh_margin = refresh_margin
+    self._issued = weakref.WeakSet()
+    self._lock = threading.Lock()
+
+  def issue(self, token: str, expiry: Optional[datetime.datetime],
+            scopes: Optional[List[str]], name: str,
+            minter: Optional[Minter] = None) -> ManagedCredentials:
+    """Creates tracked credentials. See ManagedCredentials for arguments."""
+
+    creds = ManagedCredentials(token, expiry, scopes, name, minter,
+                               self.refresh_margin)
+    with self._lock:
+      self._issued.add(creds)
+    return creds
+
+  def issued(self) -> List[ManagedCredentials]:
+    with self._lock:
+      return list(self._issued)
+
+  def log_report(self):
+    """Logs the expiry status of every issued credential."""
+
+    for creds in self.issued():
+      if creds.expiry is None:
+        logging.info('Token of %s: expiry unknown', creds.name)
+      elif not creds.refreshable and creds.expired:
+        logging.warning('Token of %s expired at %s and cannot be refreshed',
+                        creds.name, creds.expiry)
+      else:
+        logging.info('Token of %s: expires at %s, refreshed %d times',
+                     creds.name, creds.expiry, creds.refresh_count)
+
+
+manager = CredentialManager()
@@ -24,28 +24,59 @@ import logging
 import os
 import sqlite3
 import sys
-from typing import List, Dict, Tuple, Optional, Mapping, Union
+from typing import List, Dict, Tuple, Optional, Mapping, TYPE_CHECKING, Union
 
-from google.cloud.iam_credentials_v1.services.iam_credentials.client import IAMCredentialsClient
 from google.oauth2 import credentials
 from google.oauth2 import service_account
 from httplib2 import Credentials
 import requests
 
+from . import credential_manager
+from . import transport
+
+if TYPE_CHECKING:
+  from google.cloud.iam_credentials_v1.services.iam_credentials.client import IAMCredentialsClient
+
 credentials_db_search_places = ["/home/", "/root/"]
 
+IMPERSONATION_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+METADATA_URL = "http://metadata.google.internal/computeMetadata/v1/instance/\
+service-accounts/default/"
+METADATA_HEADERS = {"Metadata-Flavor": "Google"}
+
 
 def credentials_from_token(access_token: str, refresh_token: Optional[str],
                            token_uri: Optional[str], client_id: Optional[str],
                            client_secret: Optional[str],
-                           scopes_user: Optional[str]) -> Credentials:
+                           scopes_user: Optional[str],
+                           expiry: Optional[datetime.datetime] = None
+                           ) -> Credentials:
   return credentials.Credentials(
     access_token,
     refresh_token=refresh_token,
     token_uri=token_uri,
     client_id=client_id,
     client_secret=client_secret,
-    scopes=scopes_user)
+    scopes=scopes_user,
+    expiry=expiry)
+
+
+def expiry_to_timestamp(
+    expiry: Optional[datetime.datetime]) -> Optional[float]:
+  """Converts a naive UTC credentials expiry into a POSIX timestamp."""
+  if expiry is None:
+    return None
+  return expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def timestamp_to_expiry(
+    timestamp: Optional[float]) -> Optional[datetime.datetime]:
+  """Converts a POSIX timestamp into a naive UTC credentials expiry."""
+  if timestamp is None:
+    return None
+  return datetime.datetime.fromtimestamp(
+    timestamp, datetime.timezone.utc).replace(tzinfo=None)
 
 
 def get_creds_from_file(file_path: str) -> Tuple[str, Credentials]:
@@ -87,29 +118,21 @@ def get_creds_from_metadata() -> Tuple[Optional[str], Optional[Credentials]]:
 
   print("Retrieving access token from instance metadata")
 
-  token_url = "http://metadata.google.internal/computeMetadata/v1/instance/\
-service-accounts/default/token"
-  scope_url = "http://metadata.google.internal/computeMetadata/v1/instance/\
-service-accounts/default/scopes"
-  email_url = "http://metadata.google.internal/computeMetadata/v1/instance/\
-service-accounts/default/email"
-  headers = {"Metadata-Flavor": "Google"}
   try:
-    res = requests.get(token_url, headers=headers, timeout=120)
-    if not res.ok:
-      logging.error("Failed to retrieve instance token. Status code %d",
-                    res.status_code)
-      return None, None
-    token = res.json()["access_token"]
+    token, expiry = get_token_from_metadata()
 
-    res = requests.get(scope_url, headers=headers, timeout=120)
+    with transport.session() as session:
+      res = session.get(METADATA_URL + "scopes", headers=METADATA_HEADERS,
+                        timeout=120)
     if not res.ok:
       logging.error("Failed to retrieve instance scopes. Status code %d",
                     res.status_code)
       return None, None
     instance_scopes = res.content.decode("utf-8")
 
-    res = requests.get(email_url, headers=headers, timeout=120)
+    with transport.session() as session:
+      res = session.get(METADATA_URL + "email", headers=METADATA_HEADERS,
+                        timeout=120)
     if not res.ok:
       logging.error("Failed to retrieve instance email. Status code %d",
                     res.status_code)
@@ -125,8 +148,35 @@ service-accounts/default/email"
   logging.info("Access token length: %d", len(token))
   logging.info("Instance email: %s", email)
   logging.info("Instance scopes: %s", instance_scopes)
-  return email, credentials_from_token(token, None, None, None, None,
-                                       instance_scopes)
+  # the metadata server hands out a new token before the current one expires
+  return email, credential_manager.manager.issue(
+    token, expiry, instance_scopes, email, get_token_from_metadata)
+
+
+def get_token_from_metadata() -> Tuple[str, Optional[datetime.datetime]]:
+  """Retrieves an access token of the instance service account.
+
+  Returns:
+    str: An access token.
+    datetime.datetime: Naive UTC expiry of the token, None if unknown.
+
+  Raises:
+    requests.HTTPError: If the metadata server returns an error.
+  """
+
+  with transport.session() as session:
+    res = session.get(METADATA_URL + "token", headers=METADATA_HEADERS,
+                      timeout=120)
+  if not res.ok:
+    logging.error("Failed to retrieve instance token. Status code %d",
+                  res.status_code)
+  res.raise_for_status()
+  token_info = res.json()
+  expiry = None
+  if "expires_in" in token_info:
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(
+      seconds=token_info["expires_in"])
+  return token_info["access_token"], expiry
 
 
 def get_creds_from_data(access_token: str,
@@ -290,27 +340,46 @@ def get_account_creds_list(
   return accounts
 
 
-def impersonate_sa(iam_client: IAMCredentialsClient,
-                   target_account: str) -> Credentials:
+def sa_resource_name(account: str) -> str:
+  """Returns the IAM Credentials resource name of a service account."""
+  if account.startswith("projects/"):
+    return account
+  return f"projects/-/serviceAccounts/{account}"
+
+
+def impersonate_sa(iam_client: 'IAMCredentialsClient',
+                   target_account: str,
+                   timeout: Optional[float] = None,
+                   delegates: Optional[List[str]] = None) -> Credentials:
   """The function is used to impersonate SA.
 
   Args:
     iam_client: google.cloud.iam_credentials_v1.services.iam_credentials.
       client.IAMCredentialsClient object.
     target_account: Name of a service account to impersonate.
+    timeout: Timeout of the generateAccessToken call in seconds (Optional).
+    delegates: Service accounts of the delegation chain between the
+      identity of iam_client and target_account (Optional). Each of them
+      must be able to impersonate the next one.
 
   Returns:
     google.auth.service_account.Credentials: The constructed credentials.
   """
 
-  scopes_sa = ["https://www.googleapis.com/auth/cloud-platform"]
   intermediate_access_token = iam_client.generate_access_token(
-    name=target_account, scope=scopes_sa, retry=None
+    name=sa_resource_name(target_account),
+    delegates=[sa_resource_name(delegate) for delegate in delegates or []],
+    scope=IMPERSONATION_SCOPES, retry=None, timeout=timeout
     # lifetime = "43200"
   )
 
+  expiry = None
+  expire_time = intermediate_access_token.expire_time
+  if expire_time is not None and expire_time.timestamp() > 0:
+    expiry = timestamp_to_expiry(expire_time.timestamp())
+
   return credentials_from_token(intermediate_access_token.access_token, None,
-                                None, None, None, scopes_sa)
+                                None, None, None, IMPERSONATION_SCOPES, expiry)
 
 
 def creds_from_access_token(access_token_file):
@@ -331,6 +400,9 @@ def creds_from_access_token(access_token_file):
         ]
       }
 
+    An optional "expiry" entry holds the ISO 8601 expiry time of the token.
+    The token cannot be refreshed, so the scanner warns once it expires.
+
   Returns:
     google.auth.service_account.Credentials: The constructed credentials.
   """
@@ -342,13 +414,17 @@ def creds_from_access_token(access_token_file):
   if user_scopes is None:
     user_scopes = ["https://www.googleapis.com/auth/cloud-platform"]
 
-  return credentials_from_token(
+  expiry = None
+  if creds_dict.get("expiry"):
+    expiry = datetime.datetime.fromisoformat(creds_dict["expiry"])
+    if expiry.tzinfo is not None:
+      expiry = expiry.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+  return credential_manager.manager.issue(
     creds_dict["access_token"],
-    None,
-    None,
-    None,
-    None,
-    user_scopes)
+    expiry,
+    user_scopes,
+    os.path.basename(access_token_file))
 
 
 def creds_from_refresh_token(refresh_token_file):
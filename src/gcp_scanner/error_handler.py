@@ -21,5 +21,7 @@
 # Error code 1 is reserved for all other kinds of errors
 # Error code 2 is reserved for command line errors
 ERROR_CODES = {
-  "InvalidDirError": 3
+  "InvalidDirError": 3,
+  "InvalidShardError": 4,
+  "InvalidScanConfigError": 5
 }
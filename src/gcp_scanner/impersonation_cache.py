@@ -0,0 +1,163 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to memoize service account impersonation attempts.
+
+"""
+
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Successful attempts are reused only while the token has at least this many
+# seconds left.
+TOKEN_EXPIRY_MARGIN = 300
+
+
+class CachedImpersonationFailure(Exception):
+  """Raised when an impersonation attempt is known to fail."""
+
+
+class ImpersonationCache:
+  """A cache of impersonation results keyed by (source identity, target SA).
+
+  Successes are kept together with the access token until the token expires.
+  Failures (e.g. 403 or 404 returned by generateAccessToken) are kept for
+  failure_ttl seconds. The least recently used entries are evicted once the
+  cache grows beyond max_entries. The cache is optionally persisted to disk,
+  so repeated scans of the same organization skip known attempts.
+  """
+
+  def __init__(self, path: Optional[str] = None, failure_ttl: float = 86400,
+               max_entries: int = 10000):
+    """Initialize the cache and load persisted entries, if any.
+
+    Args:
+      path: path to a JSON file to persist the cache in (Optional).
+      failure_ttl: number of seconds failures are kept for.
+      max_entries: maximum number of entries kept in the cache.
+    """
+
+    self.path = path
+    self.failure_ttl = failure_ttl
+    self.max_entries = max_entries
+    self._entries: collections.OrderedDict = collections.OrderedDict()
+    self._lock = threading.Lock()
+    if path is not None:
+      self.load()
+
+  def get(self, source: str, target: str) -> Optional[Dict[str, Any]]:
+    """Returns the live entry for (source, target) or None."""
+
+    key = (source, target)
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      if entry['expires_at'] <= time.time():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return dict(entry)
+
+  def record_success(self, source: str, target: str, token: str,
+                     token_expiry: Optional[float]):
+    """Remembers a successful attempt.
+
+    Args:
+      source: the impersonating identity.
+      target: the impersonated service account.
+      token: the access token returned by generateAccessToken.
+      token_expiry: expiry time of the token as a POSIX timestamp. Tokens
+        without known expiry are not cached.
+    """
+
+    if token_expiry is None:
+      return
+    self._put(source, target, {
+        'status': 'success',
+        'token': token,
+        'token_expiry': token_expiry,
+        'expires_at': token_expiry - TOKEN_EXPIRY_MARGIN,
+    })
+
+  def record_failure(self, source: str, target: str, reason: str):
+    """Remembers a failed attempt for failure_ttl seconds."""
+
+    self._put(source, target, {
+        'status': 'failure',
+        'reason': reason,
+        'expires_at': time.time() + self.failure_ttl,
+    })
+
+  def _put(self, source: str, target: str, entry: Dict[str, Any]):
+    key = (source, target)
+    with self._lock:
+      self._entries[key] = entry
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def load(self):
+    """Loads live entries persisted in self.path."""
+
+    if not os.path.exists(self.path):
+      return
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    except Exception:
+      logging.error('Failed to load impersonation cache from %s', self.path)
+      logging.error(sys.exc_info()[1])
+      return
+
+    now = time.time()
+    with self._lock:
+      for record in records:
+        if record['expires_at'] <= now:
+          continue
+        key = (record.pop('source'), record.pop('target'))
+        self._entries[key] = record
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+    logging.info('Loaded %d impersonation results from %s',
+                 len(self._entries), self.path)
+
+  def save(self):
+    """Persists live entries into self.path, if set.
+
+    The file contains access tokens, so it is only readable by its owner.
+    """
+
+    if self.path is None:
+      return
+    now = time.time()
+    with self._lock:
+      records = [
+          dict(entry, source=source, target=target)
+          for (source, target), entry in self._entries.items()
+          if entry['expires_at'] > now
+      ]
+
+    tmp_path = f'{self.path}.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+      json.dump(records, f)
+    os.replace(tmp_path, self.path)
@@ -0,0 +1,138 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to import crawlers, clients and gRPC libraries on first use.
+
+A scan only needs the modules of the crawlers enabled in its config, so
+they are imported when first requested instead of at startup. Import times
+are recorded for the --startup-profile report.
+"""
+
+import importlib
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, TextIO, Tuple
+
+# Roughly when the package started importing.
+_START = time.perf_counter()
+
+_lock = threading.Lock()
+_marks: List[Tuple[str, float]] = list()
+_imports: List[Tuple[str, float]] = list()
+
+
+def timed_import(name: str) -> Any:
+  """Imports a module, recording the time if it was not imported yet."""
+
+  module = sys.modules.get(name)
+  if module is not None:
+    return module
+  start = time.perf_counter()
+  module = importlib.import_module(name)
+  with _lock:
+    _imports.append((name, time.perf_counter() - start))
+  return module
+
+
+def import_object(path: str) -> Any:
+  """Imports an object by its path, e.g. package.module:ClassName."""
+
+  module_name, object_name = path.split(':')
+  return getattr(timed_import(module_name), object_name)
+
+
+class LazyModule:
+  """A module imported on the first access to one of its attributes.
+
+  Attributes are also set and deleted on the imported module, so the lazy
+  module can be patched in tests like the real one.
+  """
+
+  def __init__(self, name: str):
+    object.__setattr__(self, '_name', name)
+
+  def _module(self) -> Any:
+    return timed_import(object.__getattribute__(self, '_name'))
+
+  def __getattr__(self, attr: str) -> Any:
+    return getattr(self._module(), attr)
+
+  def __setattr__(self, attr: str, value: Any):
+    setattr(self._module(), attr, value)
+
+  def __delattr__(self, attr: str):
+    delattr(self._module(), attr)
+
+
+class LazyRegistry(Mapping):
+  """A read-only mapping of names to classes imported on first lookup."""
+
+  def __init__(self, paths: Dict[str, str]):
+    """Initialize the registry.
+
+    Args:
+      paths: import paths of the classes by name, e.g.
+        {'compute': 'gcp_scanner.client.compute_client:ComputeClient'}.
+    """
+
+    self._paths = paths
+    self._resolved: Dict[str, Any] = dict()
+
+  @property
+  def paths(self) -> Dict[str, str]:
+    """Import paths of the classes by name."""
+    return dict(self._paths)
+
+  def __getitem__(self, name: str) -> Any:
+    cls = self._resolved.get(name)
+    if cls is None:
+      # KeyError for unknown names, like a dict
+      cls = import_object(self._paths[name])
+      self._resolved[name] = cls
+    return cls
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._paths)
+
+  def __len__(self) -> int:
+    return len(self._paths)
+
+  def __contains__(self, name: object) -> bool:
+    return name in self._paths
+
+
+def mark(event: str):
+  """Records the time an event of the startup first happened at."""
+  seconds = time.perf_counter() - _START
+  with _lock:
+    if event not in (recorded for recorded, _ in _marks):
+      _marks.append((event, seconds))
+
+
+def report(out: TextIO = sys.stderr):
+  """Writes the startup profile: startup events and deferred imports."""
+
+  with _lock:
+    marks = list(_marks)
+    imports = sorted(_imports, key=lambda item: item[1], reverse=True)
+  print('Startup profile (seconds since the package was imported):',
+        file=out)
+  for event, seconds in marks:
+    print(f'  {seconds:8.3f}  {event}', file=out)
+  print(f'Deferred imports ({sum(t for _, t in imports):.3f}s in total):',
+        file=out)
+  for name, seconds in imports:
+    print(f'  {seconds:8.3f}  {name}', file=out)
@@ -0,0 +1,195 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to remember which locations of a project hold resources.
+
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Empty locations are probed on every scan unless a TTL is set, since new
+# resources may have been created there since the last scan.
+DEFAULT_EMPTY_LOCATION_TTL = 0
+
+
+class LocationCache:
+  """Locations with and without resources by (project, resource type).
+
+  Regional resources such as KMS keyrings are listed location by location,
+  while most locations of a project are empty. Populated locations are
+  probed first. With empty_ttl set, empty ones are probed again only after
+  empty_ttl seconds, and the cache is optionally persisted to disk, so
+  repeated scans of the same organization skip known empty locations.
+  """
+
+  def __init__(self, path: Optional[str] = None,
+               empty_ttl: float = DEFAULT_EMPTY_LOCATION_TTL):
+    """Initialize the cache and load persisted entries, if any.
+
+    Args:
+      path: path to a JSON file to persist the cache in (Optional).
+      empty_ttl: number of seconds a location is known to be empty for. 0
+        probes every location on every scan.
+    """
+
+    self.path = path
+    self.empty_ttl = empty_ttl
+    # checked_at and populated by location by (project, resource type)
+    self._entries: Dict[Tuple[str, str], Dict[str, Dict]] = dict()
+    self._lock = threading.Lock()
+    if path is not None:
+      self.load()
+
+  def plan(self, project_id: str, resource_type: str,
+           locations: List[str]) -> List[str]:
+    """Returns the locations to probe, populated ones first.
+
+    Args:
+      project_id: ID of the project.
+      resource_type: type of the listed resources, e.g. kms_keyrings.
+      locations: all locations of the project.
+
+    Returns:
+      The locations except those recently found empty. Populated locations
+      come first, then unknown ones, then empty ones to probe again.
+    """
+
+    now = time.time()
+    populated, unknown, stale = list(), list(), list()
+    with self._lock:
+      entries = self._entries.get((project_id, resource_type), {})
+      for location in locations:
+        entry = entries.get(location)
+        if entry is None:
+          unknown.append(location)
+        elif entry['populated']:
+          populated.append(location)
+        elif now - entry['checked_at'] >= self.empty_ttl:
+          stale.append(location)
+    return populated + unknown + stale
+
+  def record(self, project_id: str, resource_type: str, location: str,
+             populated: bool):
+    """Remembers whether a location had resources when it was listed."""
+
+    with self._lock:
+      entries = self._entries.setdefault((project_id, resource_type), {})
+      entries[location] = {'populated': populated, 'checked_at': time.time()}
+
+  def _read(self) -> Dict[Tuple[str, str], Dict[str, Dict]]:
+    """Returns the entries persisted in self.path, empty if it is missing."""
+
+    if not os.path.exists(self.path):
+      return dict()
+    with open(self.path, 'r', encoding='utf-8') as f:
+      records = json.load(f)
+    return {(record['project'], record['resource_type']): record['locations']
+            for record in records}
+
+  def load(self):
+    """Loads entries persisted in self.path."""
+
+    try:
+      entries = self._read()
+    except Exception:
+      logging.error('Failed to load location cache from %s', self.path)
+      logging.error(sys.exc_info()[1])
+      return
+
+    with self._lock:
+      self._entries.update(entries)
+    logging.info('Loaded locations of %d projects from %s', len(entries),
+                 self.path)
+
+  def save(self):
+    """Persists the entries into self.path, if set.
+
+    Shard processes of a scan share the file, so entries saved there in the
+    meantime are merged in, the latest check of a location winning, before
+    the file is replaced.
+    """
+
+    if self.path is None:
+      return
+    with self._lock:
+      entries = {key: dict(locations)
+                 for key, locations in self._entries.items()}
+    try:
+      saved = self._read()
+    except Exception:
+      logging.error('Failed to merge location cache from %s', self.path)
+      logging.error(sys.exc_info()[1])
+      saved = dict()
+    for key, locations in saved.items():
+      merged = entries.setdefault(key, {})
+      for location, entry in locations.items():
+        if (location not in merged
+            or merged[location]['checked_at'] < entry['checked_at']):
+          merged[location] = entry
+
+    records = [
+        {'project': project_id, 'resource_type': resource_type,
+         'locations': locations}
+        for (project_id, resource_type), locations in entries.items()
+    ]
+    tmp_path = f'{self.path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump(records, f)
+    os.replace(tmp_path, self.path)
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the cache the one of crawlers run in the block."""
+
+    token = _current.set(self)
+    try:
+      yield
+    finally:
+      _current.reset(token)
+
+
+# The cache of the running scan, see SpiderContext.activate().
+_current: 'contextvars.ContextVar[LocationCache]' = contextvars.ContextVar(
+    'location_cache', default=LocationCache())
+
+
+def plan(project_id: str, resource_type: str,
+         locations: List[str]) -> List[str]:
+  """Returns the locations to probe with the cache of the running scan."""
+  return _current.get().plan(project_id, resource_type, locations)
+
+
+def record(project_id: str, resource_type: str, location: str,
+           populated: bool):
+  """Records a listed location in the cache of the running scan."""
+  _current.get().record(project_id, resource_type, location, populated)
+
+
+def save():
+  """Persists the cache of the running scan, if it has a path."""
+  cache = _current.get()
+  try:
+    cache.save()
+  except Exception:
+    logging.error('Failed to save location cache to %s', cache.path)
+    logging.error(sys.exc_info()[1])
@@ -17,26 +17,167 @@
 
 """
 
+from concurrent import futures
+import contextlib
 import queue
-from typing import List, Tuple
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from httplib2 import Credentials
 
+from .impersonation_cache import ImpersonationCache
+from .request_budget import RequestBudget
+from .location_cache import LocationCache
+from .negative_cache import NegativeCache
+from .retry import RetryPolicy
+from .scheduler import BoundedExecutor
+from .scheduler import DEFAULT_REQUEST_WORKERS
+from .transport import HttpPool
+
 
 class SpiderContext:
   """A simple class to initialize the context with a list of root SAs
   """
 
-  def __init__(self, sa_tuples: List[Tuple[str, Credentials, List[str]]]):
+  def __init__(
+    self,
+    sa_tuples: List[Tuple[str, Credentials, List[str]]],
+    impersonation_worker_count: int = 1,
+    impersonation_timeout: Optional[float] = None,
+    impersonation_cache: Optional[ImpersonationCache] = None,
+    request_budget: Optional[RequestBudget] = None,
+    http_pool: Optional[HttpPool] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    negative_cache: Optional[NegativeCache] = None,
+    location_cache: Optional[LocationCache] = None,
+    request_executor: Optional[BoundedExecutor] = None,
+  ):
     """Initialize the context with a list of the root service accounts.
 
     Args:
       sa_tuples: [(sa_name, sa_object, chain_so_far)]
+      impersonation_worker_count: number of impersonation attempts to run in
+        parallel
+      impersonation_timeout: timeout in seconds of a single impersonation
+        attempt
+      impersonation_cache: cache of impersonation results. An in-memory
+        cache is used if not set.
+      request_budget: limits of API requests in flight. Requests are not
+        limited if not set.
+      http_pool: keep-alive transports of the discovery clients. A pool of
+        the default size is used if not set.
+      retry_policy: policy for transient errors of API requests. The
+        default policy without an error report file is used if not set.
+      negative_cache: APIs found disabled in projects during the scan. An
+        empty cache is used if not set.
+      location_cache: locations of projects with and without resources. An
+        empty cache probing every location is used if not set.
+      request_executor: threads of API requests made in the background,
+        e.g. prefetched pages. DEFAULT_REQUEST_WORKERS threads are used if
+        not set.
     """
 
     self.service_account_queue = queue.Queue()
+    # credentials of the root identities the scan starts from
+    self.root_credentials: Dict[str, Credentials] = dict()
     for sa_tuple in sa_tuples:
       self.service_account_queue.put(sa_tuple)
+      sa_name, credentials, chain_so_far = sa_tuple
+      if not chain_so_far:
+        self.root_credentials.setdefault(sa_name, credentials)
+
+    self.impersonation_timeout = impersonation_timeout
+    if impersonation_cache is None:
+      impersonation_cache = ImpersonationCache()
+    self.impersonation_cache = impersonation_cache
+    if request_budget is None:
+      request_budget = RequestBudget()
+    self.request_budget = request_budget
+    if http_pool is None:
+      http_pool = HttpPool()
+    self.http_pool = http_pool
+    if retry_policy is None:
+      retry_policy = RetryPolicy()
+    self.retry_policy = retry_policy
+    if negative_cache is None:
+      negative_cache = NegativeCache()
+    self.negative_cache = negative_cache
+    if location_cache is None:
+      location_cache = LocationCache()
+    self.location_cache = location_cache
+    if request_executor is None:
+      request_executor = BoundedExecutor(DEFAULT_REQUEST_WORKERS, 'request')
+    self.request_executor = request_executor
+    self._impersonation_executor = BoundedExecutor(
+      impersonation_worker_count, 'impersonation')
+    self._impersonation_attempts: Dict[Tuple[str, str], futures.Future] = {}
+    self._impersonation_lock = threading.Lock()
+
+  def impersonate(
+    self,
+    sa_name: str,
+    target_sa: str,
+    impersonate_fn: Callable[[str], Any],
+  ) -> futures.Future:
+    """Schedules an attempt to impersonate target_sa using sa_name.
+
+    Each (sa_name, target_sa) pair is attempted only once. Later calls for the
+    same pair return the future of the first attempt.
+
+    Args:
+      sa_name: name of the impersonating identity
+      target_sa: email of the service account to impersonate
+      impersonate_fn: function called with target_sa to make the attempt
+
+    Returns:
+      A future that is resolved once the attempt is over.
+    """
+
+    key = (sa_name, target_sa)
+    with self._impersonation_lock:
+      attempt = self._impersonation_attempts.get(key)
+      if attempt is not None:
+        return attempt
+      attempt = futures.Future()
+      self._impersonation_attempts[key] = attempt
+
+    def run():
+      try:
+        attempt.set_result(impersonate_fn(target_sa))
+      except Exception as ex:
+        attempt.set_exception(ex)
+
+    self._impersonation_executor.submit(run)
+    return attempt
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the objects shared by the scan the current ones in the block.
+
+    API requests and crawlers use them through the module functions, e.g.
+    request_budget.slot(). Threads of BoundedExecutor started in the block
+    get them as well.
+    """
+
+    with self.request_budget.activate(), self.http_pool.activate(), \
+        self.retry_policy.activate(), self.negative_cache.activate(), \
+        self.location_cache.activate(), self.request_executor.activate():
+      yield
+
+  def get_root_credentials(
+    self, chain_so_far: List[str]) -> Optional[Credentials]:
+    """Returns the credentials of the root of an impersonation chain.
+
+    Args:
+      chain_so_far: the impersonation chain, starting with the root identity
+
+    Returns:
+      Root credentials or None if the chain does not start with a root.
+    """
+
+    if not chain_so_far:
+      return None
+    return self.root_credentials.get(chain_so_far[0])
 
   def __repr__(self) -> str:
     return f"{list(self.service_account_queue.queue)}"
@@ -58,7 +199,8 @@ class ProjectInfo:
     sa_name,
     credentials,
     chain_so_far,
-    resource_worker_count
+    resource_worker_count,
+    billing_index=None,
   ):
     self.project = project
     self.sa_results = sa_results
@@ -71,3 +213,12 @@ class ProjectInfo:
     self.credentials = credentials
     self.chain_so_far = chain_so_far
     self.resource_worker_count = resource_worker_count
+    # billing info shared by the projects scanned with the credentials
+    self.billing_index = billing_index
+    # set once impersonation attempts for the project are over
+    self.impersonation_done = threading.Event()
+    # the saved project result, its service account edges are written once
+    # impersonation is over as well, see scanner.save_service_account_edges
+    self.output_path = None
+    self.edges_saved = False
+    self.edges_lock = threading.Lock()
@@ -0,0 +1,189 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to remember APIs a credential cannot use in a project.
+
+"""
+
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+from typing import Any, Dict, Hashable, Iterator, Optional, Set, Tuple
+
+from googleapiclient import errors
+
+SERVICE_DISABLED = 'SERVICE_DISABLED'
+PERMISSION_DENIED = 'PERMISSION_DENIED'
+
+# Reasons of 403 errors for an API that is not enabled in the project.
+SERVICE_DISABLED_REASONS = frozenset((
+    'SERVICE_DISABLED',
+    'accessNotConfigured',
+))
+
+# Reasons of 403 errors for a missing IAM permission.
+PERMISSION_DENIED_REASONS = frozenset((
+    'PERMISSION_DENIED',
+    'IAM_PERMISSION_DENIED',
+    'forbidden',
+    'insufficientPermissions',
+))
+
+# The credentials and the project the current crawler runs with.
+_scope: 'contextvars.ContextVar[Optional[Tuple[Any, str]]]' = (
+    contextvars.ContextVar('negative_cache_scope', default=None))
+
+
+def _reasons(exception: errors.HttpError) -> Set[str]:
+  try:
+    error = json.loads(exception.content.decode('utf-8')).get('error', {})
+  except Exception:  # pylint: disable=broad-except
+    return set()
+  reasons = {error.get('status', '')}
+  for detail in (error.get('errors') or []) + (error.get('details') or []):
+    if isinstance(detail, dict):
+      reasons.add(detail.get('reason', ''))
+  reasons.discard('')
+  return reasons
+
+
+def classify(exception: Exception) -> Optional[str]:
+  """Returns SERVICE_DISABLED or PERMISSION_DENIED for matching 403 errors."""
+
+  if (not isinstance(exception, errors.HttpError)
+      or exception.resp.status != 403):
+    return None
+  reasons = _reasons(exception)
+  if reasons & SERVICE_DISABLED_REASONS:
+    return SERVICE_DISABLED
+  if reasons & PERMISSION_DENIED_REASONS:
+    return PERMISSION_DENIED
+  return None
+
+
+class NegativeCache:
+  """APIs disabled in a project by (credentials, project, API).
+
+  An API disabled in a project fails every method, so SERVICE_DISABLED is
+  cached for the whole API and later requests of any crawler using it fail
+  right away. PERMISSION_DENIED is never cached: IAM policies are also set
+  on resources such as buckets, datasets and keyrings, so a request denied
+  for one resource may succeed for the next one.
+  """
+
+  def __init__(self):
+    self._entries: Dict[Tuple[Any, str, str], errors.HttpError] = dict()
+    self._lock = threading.Lock()
+    self.hits: Dict[str, int] = collections.Counter()
+
+  def lookup(self, credentials: Hashable, project_id: str,
+             api_name: str) -> Optional[errors.HttpError]:
+    """Returns the cached error of an API, if any."""
+
+    with self._lock:
+      exception = self._entries.get((credentials, project_id, api_name))
+      if exception is not None:
+        self.hits[api_name] += 1
+    return exception
+
+  def record(self, credentials: Hashable, project_id: str, api_name: str,
+             exception: Exception) -> bool:
+    """Caches the error of a request if the API is disabled.
+
+    Returns:
+      True if the error was cached.
+    """
+
+    if classify(exception) != SERVICE_DISABLED:
+      return False
+    with self._lock:
+      self._entries.setdefault((credentials, project_id, api_name),
+                               exception)
+    return True
+
+  def log_report(self):
+    with self._lock:
+      hits = sorted(self.hits.items())
+    for api_name, count in hits:
+      logging.info('%s: %d requests skipped after a cached 403 error',
+                   api_name, count)
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the cache the one of requests made in the block."""
+
+    token = _current.set(self)
+    try:
+      yield
+    finally:
+      _current.reset(token)
+
+
+# The cache of the running scan, see SpiderContext.activate().
+_current: 'contextvars.ContextVar[NegativeCache]' = contextvars.ContextVar(
+    'negative_cache', default=NegativeCache())
+
+
+@contextlib.contextmanager
+def scope(credentials: Hashable, project_id: str) -> Iterator[None]:
+  """Sets the credentials and the project of requests made in the block.
+
+  The scope is kept in a context variable, so it follows the crawler into
+  asyncio tasks, but not into threads unless the context is copied.
+  """
+
+  token = _scope.set((credentials, project_id))
+  try:
+    yield
+  finally:
+    _scope.reset(token)
+
+
+def check(api_name: str):
+  """Raises the cached error of an API in the current scope, if any."""
+
+  current = _scope.get()
+  if current is None:
+    return
+  exception = _current.get().lookup(*current, api_name)
+  if exception is not None:
+    raise errors.HttpError(exception.resp, exception.content,
+                           uri=exception.uri)
+
+
+def is_disabled(credentials: Hashable, project_id: str,
+                api_name: str) -> bool:
+  """Checks if api_name is known to be disabled for the project."""
+  return _current.get().lookup(credentials, project_id,
+                               api_name) is not None
+
+
+def record(api_name: str, exception: Exception):
+  """Caches a SERVICE_DISABLED error of a request in the current scope."""
+
+  current = _scope.get()
+  if current is None:
+    return
+  if _current.get().record(*current, api_name, exception):
+    logging.info('Caching %s of %s in project %s', SERVICE_DISABLED,
+                 api_name, current[1])
+
+
+def log_report():
+  """Logs the number of requests skipped per API."""
+  _current.get().log_report()
@@ -0,0 +1,155 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to limit the number of API requests in flight.
+
+"""
+
+import contextlib
+import contextvars
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class RequestBudget:
+  """A global budget of in-flight HTTP requests with per-API sub-budgets.
+
+  The budget is shared by all project and resource workers, so the total
+  number of concurrent API calls no longer depends on how worker counts
+  multiply. A limit of 0 (or None) means unlimited.
+  """
+
+  def __init__(self, max_inflight: Optional[int] = None,
+               max_inflight_per_api: Optional[int] = None):
+    """Initialize the budget.
+
+    Args:
+      max_inflight: maximum number of requests in flight across all APIs.
+      max_inflight_per_api: maximum number of requests in flight per API.
+    """
+
+    self.max_inflight = max_inflight
+    self.max_inflight_per_api = max_inflight_per_api
+    self._total = self._make_semaphore(max_inflight)
+    self._per_api_limit = max_inflight_per_api
+    self._per_api: Dict[str, threading.BoundedSemaphore] = dict()
+    self._lock = threading.Lock()
+    # only one caller at a time holds some of its slots while waiting for
+    # the others, so callers taking several slots cannot deadlock
+    self._multi_slot_lock = threading.Lock()
+
+  @staticmethod
+  def _make_semaphore(limit: Optional[int]):
+    if not limit or int(limit) <= 0:
+      return None
+    return threading.BoundedSemaphore(int(limit))
+
+  def _api_semaphore(self, api_name: str):
+    if not self._per_api_limit:
+      return None
+    with self._lock:
+      if api_name not in self._per_api:
+        self._per_api[api_name] = self._make_semaphore(self._per_api_limit)
+      return self._per_api[api_name]
+
+  def acquire(self, api_name: str, count: int = 1,
+              blocking: bool = True) -> Optional[List[Any]]:
+    """Takes count slots for requests to api_name.
+
+    The per-API slot is taken first so that requests waiting on a saturated
+    API do not hold global slots other APIs could use.
+
+    Args:
+      api_name: name of the API, e.g. compute or storage.
+      count: number of requests, e.g. the calls of a batch request. A count
+        above a limit takes all slots of that limit.
+      blocking: whether to wait for the slots to be free.
+
+    Returns:
+      The taken slots to pass to release(), None if blocking is False and
+      the slots are not free.
+    """
+
+    acquired = list()
+    try:
+      with (self._multi_slot_lock if count > 1
+            else contextlib.nullcontext()):
+        for semaphore, limit in (
+            (self._api_semaphore(api_name), self._per_api_limit),
+            (self._total, self.max_inflight)):
+          if semaphore is None:
+            continue
+          for _ in range(min(count, int(limit))):
+            if not semaphore.acquire(blocking):
+              self.release(acquired)
+              return None
+            acquired.append(semaphore)
+    except BaseException:
+      self.release(acquired)
+      raise
+    return acquired
+
+  @staticmethod
+  def release(acquired: List[Any]):
+    """Frees the slots taken by acquire()."""
+    for semaphore in reversed(acquired):
+      semaphore.release()
+
+  @contextlib.contextmanager
+  def slot(self, api_name: str, count: int = 1) -> Iterator[None]:
+    """Blocks until count requests to api_name are allowed to start.
+
+    Args:
+      api_name: name of the API, e.g. compute or storage.
+      count: number of requests, see acquire().
+    """
+
+    acquired = self.acquire(api_name, count)
+    try:
+      yield
+    finally:
+      self.release(acquired)
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the budget the one of requests started in the block."""
+
+    token = _current.set(self)
+    try:
+      yield
+    finally:
+      _current.reset(token)
+
+
+# The budget of the running scan, see SpiderContext.activate(). Requests
+# made outside of a scan are not limited.
+_current: 'contextvars.ContextVar[RequestBudget]' = contextvars.ContextVar(
+    'request_budget', default=RequestBudget())
+
+
+def slot(api_name: str, count: int = 1):
+  """Takes count slots in the current request budget for api_name."""
+  return _current.get().slot(api_name, count)
+
+
+def current() -> RequestBudget:
+  """Returns the request budget of the running scan."""
+  return _current.get()
+
+
+def limits() -> Tuple[Optional[int], Optional[int]]:
+  """Returns the global and per-API limits of the current budget."""
+  budget = _current.get()
+  return budget.max_inflight, budget.max_inflight_per_api
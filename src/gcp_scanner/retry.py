@@ -0,0 +1,254 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to retry failed API requests and report request errors.
+
+"""
+
+import asyncio
+import collections
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import random
+import socket
+import threading
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple
+from urllib import parse
+
+from googleapiclient import errors
+import httplib2
+
+# Statuses of transient errors worth retrying.
+RETRYABLE_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+# Reasons of 403 errors that are rate limits rather than missing access.
+RATE_LIMIT_REASONS = frozenset((
+    'rateLimitExceeded',
+    'userRateLimitExceeded',
+    'RATE_LIMIT_EXCEEDED',
+))
+
+# Exceptions of transient network failures.
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    socket.timeout,
+    TimeoutError,
+    asyncio.TimeoutError,
+    httplib2.ServerNotFoundError,
+)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BUDGET_PER_API = 1000
+
+RETRY = 'retry'
+GIVE_UP = 'give_up'
+
+
+def error_status(exception: Exception) -> Tuple[Optional[int], str]:
+  """Returns the HTTP status and the error reason of a failed request."""
+
+  if not isinstance(exception, errors.HttpError):
+    return None, type(exception).__name__
+  reason = ''
+  try:
+    content = json.loads(exception.content.decode('utf-8'))
+    error = content.get('error', {})
+    details = error.get('errors') or error.get('details') or [{}]
+    reason = details[0].get('reason', '') or error.get('status', '')
+  except Exception:  # pylint: disable=broad-except
+    pass
+  return exception.resp.status, reason
+
+
+def is_retryable(exception: Exception) -> bool:
+  """Checks if a request failed with a transient error.
+
+  429 and 5xx responses and network errors are transient. Other 4xx
+  responses, e.g. 403 for missing permissions or 404, fail fast, except 403
+  rate limit errors some APIs return instead of 429.
+  """
+
+  if isinstance(exception, TRANSIENT_ERRORS):
+    return True
+  status, reason = error_status(exception)
+  if status is None:
+    return False
+  if status == 403:
+    return reason in RATE_LIMIT_REASONS
+  return status in RETRYABLE_STATUSES
+
+
+class ErrorReport:
+  """A JSON lines report of retried and failed requests.
+
+  Every line is an object with the time, api, method, uri, status, reason,
+  attempt, action (retry or give_up) and the delay before a retry.
+  """
+
+  def __init__(self, out: Optional[TextIO] = None):
+    self._out = out
+    self._lock = threading.Lock()
+    self.counts: Dict[Tuple[str, str], int] = collections.Counter()
+
+  @classmethod
+  def to_file(cls, path: str) -> 'ErrorReport':
+    """Returns a report appending to the file at path, closed by close()."""
+    return cls(open(path, 'a', encoding='utf-8'))  # pylint: disable=consider-using-with
+
+  def record(self, action: str, api_name: str, method_id: str, uri: str,
+             exception: Exception, attempt: int, delay: float = 0):
+    status, reason = error_status(exception)
+    entry = {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'api': api_name,
+        'method': method_id,
+        # query parameters may carry page tokens or keys
+        'uri': parse.urlsplit(uri)._replace(query='').geturl(),
+        'status': status,
+        'reason': reason,
+        'attempt': attempt,
+        'action': action,
+        'delay': round(delay, 3),
+    }
+    with self._lock:
+      self.counts[(api_name, action)] += 1
+      if self._out is not None:
+        self._out.write(json.dumps(entry) + '\n')
+        self._out.flush()
+
+  def close(self):
+    with self._lock:
+      if self._out is not None:
+        self._out.close()
+        self._out = None
+
+  def log_report(self):
+    with self._lock:
+      counts = sorted(self.counts.items())
+    for (api_name, action), count in counts:
+      logging.info('%s: %d requests with action %s', api_name, count, action)
+
+
+class RetryPolicy:
+  """Exponential backoff with full jitter and a retry budget per API.
+
+  A request is attempted up to max_attempts times. Each API may retry
+  retry_budget_per_api times in total, so an API failing for every request
+  does not slow the scan down with backoffs. A limit of 0 (or None) means
+  unlimited.
+  """
+
+  def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               retry_budget_per_api: Optional[int] = (
+                   DEFAULT_RETRY_BUDGET_PER_API),
+               base_delay: float = 1, max_delay: float = 32,
+               report: Optional[ErrorReport] = None):
+    """Initialize the policy.
+
+    Args:
+      max_attempts: maximum number of attempts of a single request.
+      retry_budget_per_api: maximum number of retries per API.
+      base_delay: delay before the first retry in seconds, doubled for every
+        following retry.
+      max_delay: maximum delay before a retry in seconds.
+      report: report to record retries and give-ups in.
+    """
+
+    self.max_attempts = max(1, int(max_attempts))
+    self.retry_budget_per_api = retry_budget_per_api
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.report = report if report is not None else ErrorReport()
+    self._retries: Dict[str, int] = collections.Counter()
+    self._lock = threading.Lock()
+
+  def _take_retry(self, api_name: str) -> bool:
+    with self._lock:
+      if (self.retry_budget_per_api
+          and self._retries[api_name] >= self.retry_budget_per_api):
+        return False
+      self._retries[api_name] += 1
+      return True
+
+  def backoff(self, attempt: int) -> float:
+    """Returns a random delay before the retry after the given attempt."""
+    cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+  def on_error(self, api_name: str, method_id: str, uri: str,
+               exception: Exception, attempt: int) -> Optional[float]:
+    """Decides whether to retry a failed attempt.
+
+    Args:
+      api_name: name of the API, e.g. compute.
+      method_id: ID of the API method, e.g. compute.instances.list.
+      uri: URI of the request.
+      exception: the error of the attempt.
+      attempt: number of the failed attempt, starting from 1.
+
+    Returns:
+      Seconds to wait before the next attempt, None to give up.
+    """
+
+    if (is_retryable(exception) and attempt < self.max_attempts
+        and self._take_retry(api_name)):
+      delay = self.backoff(attempt)
+      self.report.record(RETRY, api_name, method_id, uri, exception, attempt,
+                         delay)
+      return delay
+    self.report.record(GIVE_UP, api_name, method_id, uri, exception, attempt)
+    return None
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the policy the one of requests failing in the block."""
+
+    token = _current.set(self)
+    try:
+      yield
+    finally:
+      _current.reset(token)
+
+
+# The policy of the running scan, see SpiderContext.activate().
+_current: 'contextvars.ContextVar[RetryPolicy]' = contextvars.ContextVar(
+    'retry_policy', default=RetryPolicy())
+
+
+def policy() -> RetryPolicy:
+  """Returns the retry policy of the running scan."""
+  return _current.get()
+
+
+def on_error(api_name: str, method_id: str, uri: str, exception: Exception,
+             attempt: int) -> Optional[float]:
+  """Decides whether to retry a failed attempt with the current policy."""
+  return _current.get().on_error(api_name, method_id, uri, exception, attempt)
+
+
+def log_report():
+  """Logs retry and give-up counts and closes the error report."""
+  report = _current.get().report
+  report.log_report()
+  report.close()
+
+
+def describe(request: Any) -> Tuple[str, str, str]:
+  """Returns the API name, method ID and URI of a discovery request."""
+  method_id = getattr(request, 'methodId', None) or ''
+  return method_id.split('.')[0], method_id, getattr(request, 'uri', '')
@@ -15,30 +15,54 @@
 
 """The main module that initiates scanning of GCP resources."""
 import collections
+from concurrent import futures
+import contextvars
 from datetime import datetime
 import json
 from json.decoder import JSONDecodeError
 import logging
 import os
 from pathlib import Path
+import queue
+import socket
 import sys
 import threading
 import time
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
 
 from google.auth.exceptions import MalformedError
-from google.cloud import container_v1
-from google.cloud import iam_credentials
-from google.cloud.iam_credentials_v1.services.iam_credentials.client import IAMCredentialsClient
 from httplib2 import Credentials
 
 from . import arguments
+from . import async_engine
+from . import coordinator
+from . import credential_manager
 from . import credsdb
+from . import lazy_import
+from . import location_cache
 from . import models
+from . import negative_cache
+from . import request_budget
+from . import retry
 from . import scanner
+from . import scheduler
+from . import sharding
+from . import spool
+from . import transport
+from .client import discovery_documents
 from .client.client_factory import ClientFactory
+from .client.service_pool import ServicePool
 from .crawler import misc_crawler
+from .crawler.cloud_billing_account_crawler import BillingIndex
 from .crawler.crawler_factory import CrawlerFactory
+from .crawler.interface_crawler import LIST_OPTIONS
+from .error_handler import ERROR_CODES
+from .impersonation_cache import CachedImpersonationFailure
+from .impersonation_cache import ImpersonationCache
+from .scheduler import BoundedExecutor
+
+if TYPE_CHECKING:
+  from google.cloud.iam_credentials_v1.services.iam_credentials.client import IAMCredentialsClient
 
 # We define the schema statically to make it easier for the user and avoid extra
 # config files.
@@ -87,6 +111,21 @@ LIGHT_VERSION_SCAN_SCHEMA = {
     'services': ['name'],
 }
 
+# Paths of the listed resources in the list responses of the crawlers in
+# LIGHT_VERSION_SCAN_SCHEMA, used to request only the light fields.
+LIGHT_SCAN_ITEMS_PATHS = {
+    'compute_instances': 'items/*/instances',
+    'compute_images': 'items',
+    'machine_images': 'items',
+    'compute_disks': 'items/*/disks',
+    'compute_snapshots': 'items',
+    'managed_zones': 'managedZones',
+    'sql_instances': 'items',
+    'cloud_functions': 'functions',
+    'kms': 'cryptoKeys',
+    'services': 'services',
+}
+
 # The following map is used to establish the relationship between
 # crawlers and clients. It determines the appropriate crawler and
 # client to be selected from the respective factory classes.
@@ -123,6 +162,18 @@ CRAWL_CLIENT_MAP = {
     'subnets': 'compute',
 }
 
+# gRPC-based clients pull in grpc and protobuf, so they are only imported
+# when a scan impersonates service accounts or crawls GKE.
+container_v1 = lazy_import.LazyModule('google.cloud.container_v1')
+exceptions = lazy_import.LazyModule('google.api_core.exceptions')
+iam_credentials = lazy_import.LazyModule('google.cloud.iam_credentials')
+
+# Crawlers that do not go through the CrawlerFactory.
+MISC_CRAWLERS = ['gke_clusters', 'gke_images']
+
+# Key of the service account edges, the last entry of a project result.
+EDGES_KEY = json.dumps('service_account_edges')
+
 
 def is_set(config: Optional[dict], config_setting: str) -> Union[dict, bool]:
   if config is None:
@@ -143,22 +194,37 @@ def save_results(res_data: Dict, res_path: str, is_light: bool):
   if is_light is True:
     # returning the light version of the scan based on predefined schema
     for gcp_resource, schema in LIGHT_VERSION_SCAN_SCHEMA.items():
-      projects = res_data.get('projects', {})
-      for project_name, project_data in projects.items():
-        scan_results = project_data.get(gcp_resource, {})
-        light_results = list()
-        for scan_result in scan_results:
-          light_results.append({key: scan_result.get(key) for key in schema})
+      scan_results = res_data.get(gcp_resource)
+      if scan_results is None:
+        continue
+      res_data[gcp_resource] = [
+          {key: scan_result.get(key) for key in schema}
+          for scan_result in scan_results
+      ]
 
-        project_data.update({gcp_resource: light_results})
-        projects.update({project_name: project_data})
-      res_data.update({'projects': projects})
+  # Write out results to json DB, spooled crawler results entry by entry
+  try:
+    with open(res_path, 'a', encoding='utf-8') as outfile:
+      spool.dump(res_data, outfile)
+  finally:
+    spool.close_all(res_data)
 
-  # Write out results to json DB
-  sa_results_data = json.dumps(res_data, indent=2, sort_keys=False)
 
-  with open(res_path, 'a', encoding='utf-8') as outfile:
-    outfile.write(sa_results_data)
+def light_scan_fields(crawler_name: str) -> Optional[str]:
+  """The function compiles the light scan schema of a crawler to a fields mask.
+
+  Args:
+    crawler_name: name of the crawler, e.g. compute_instances
+
+  Returns:
+    A partial response mask, e.g. nextPageToken,items(name,zone), or None if
+    the crawler has no light scan schema.
+  """
+
+  if crawler_name not in LIGHT_SCAN_ITEMS_PATHS:
+    return None
+  schema = ','.join(LIGHT_VERSION_SCAN_SCHEMA[crawler_name])
+  return f'nextPageToken,{LIGHT_SCAN_ITEMS_PATHS[crawler_name]}({schema})'
 
 
 def get_crawl(
@@ -166,50 +232,201 @@ def get_crawl(
     project_id: str,
     client: Any,
     crawler_config: dict,
-    scan_results: dict,
-    crawler_name: str,
 ):
-  """The function calls the crawler and returns result in dictionary
+  """The function calls the crawler and returns its result
 
   Args:
     crawler: crawler method to start
     project_id: id of a project to scan
     client: appropriate client method
     crawler_config: a dictionary containing specific parameters for a crawler
-    scan_results: a dictionary to save scanning results
-    crawler_name: name of a crawler
 
   Returns:
-    scan_result: a dictionary with scanning results
+    scan_result: crawled data returned by the crawler
   """
   if crawler.has_config_dependency:
-    res = crawler.crawl(project_id, client, crawler_config)
-  else:
-    res = crawler.crawl(project_id, client)
-  if res is not None and len(res) != 0:
-    scan_results[crawler_name] = res
-  return scan_results
+    return crawler.crawl(project_id, client, crawler_config)
+  return crawler.crawl(project_id, client)
 
 
-def get_resources(project: models.ProjectInfo):
-  """The function crawls the data for a project and stores the results in a
+def validate_scan_config(scan_config: Optional[dict]) -> List[str]:
+  """The function checks the list options of the scan config sections.
 
-     dictionary.
+  page_size, filter and fields are checked against the parameters of the
+  list request of the crawler in its API discovery document.
 
   Args:
-    project: class to store project scan configration
+    scan_config: scan configuration, if any
+
+  Returns:
+    A list of error messages, empty if the config is valid.
   """
 
-  if (
-      project.target_project
-      and project.target_project not in project.project['projectId']
-  ):
-    return
+  errors = list()
+  if scan_config is None:
+    return errors
+  for crawler_name, section in scan_config.items():
+    if not isinstance(section, dict):
+      continue
+    options = [option for option in LIST_OPTIONS if option in section]
+    if not options:
+      continue
+    crawler = CrawlerFactory.create_crawler(crawler_name)
+    parameters = crawler.list_parameters() if crawler is not None else {}
+    if not parameters:
+      errors.append(f'{crawler_name}: list options {options} are not '
+                    'supported by the crawler')
+      continue
 
-  project_id = project.project['projectId']
-  print(f'Inspecting project {project_id}')
-  project_result = dict()
+    if 'page_size' in section:
+      page_size = section['page_size']
+      page_size_param = crawler.page_size_param()
+      maximum = parameters.get(page_size_param, {}).get('maximum')
+      if page_size_param is None:
+        errors.append(f'{crawler_name}: page_size is not supported by the API')
+      elif (isinstance(page_size, bool) or not isinstance(page_size, int)
+            or page_size <= 0):
+        errors.append(f'{crawler_name}: page_size must be a positive integer')
+      elif maximum is not None and page_size > int(maximum):
+        errors.append(f'{crawler_name}: page_size must not exceed {maximum}')
+    if 'filter' in section:
+      if 'filter' not in parameters:
+        errors.append(f'{crawler_name}: filter is not supported by the API')
+      elif not isinstance(section['filter'], str):
+        errors.append(f'{crawler_name}: filter must be a string')
+    if 'fields' in section and not isinstance(section['fields'], str):
+      errors.append(f'{crawler_name}: fields must be a string')
+  return errors
+
+
+def project_crawlers(scan_config: Optional[dict]) -> List[str]:
+  """Lists the crawlers enabled by the scan config.
+
+  Args:
+    scan_config: scan configuration, if any
+
+  Returns:
+    Names of the crawlers to run for every project.
+  """
+
+  return [
+      crawler_name
+      for crawler_name in list(CRAWL_CLIENT_MAP) + MISC_CRAWLERS
+      if is_set(scan_config, crawler_name)
+  ]
 
+
+def crawl_resource(
+    crawler_name: str,
+    project_id: str,
+    credentials: Credentials,
+    scan_config: Optional[dict],
+    gcs_output_path: Union[Path, str],
+    light_scan: bool = False,
+    billing_index: Optional[BillingIndex] = None,
+) -> Any:
+  """The function runs a single crawler against a project.
+
+  Args:
+    crawler_name: name of the crawler, e.g. compute_instances
+    project_id: ID of the project to crawl
+    credentials: credentials to crawl the project with
+    scan_config: scan configuration, if any
+    gcs_output_path: path to save storage object listings in
+    light_scan: whether to request only the fields of the light scan
+    billing_index: billing info of the projects scanned with the
+      credentials, if more than one project is scanned
+
+  Returns:
+    scan_result: crawled data returned by the crawler
+  """
+
+  # Call other miscellaneous crawlers here
+  if crawler_name == 'gke_clusters':
+    return misc_crawler.get_gke_clusters(
+        project_id,
+        gke_client_for_credentials(credentials),
+    )
+  if crawler_name == 'gke_images':
+    return misc_crawler.get_gke_images(project_id, credentials.token)
+
+  crawler = CrawlerFactory.create_crawler(crawler_name)
+  if api_disabled(crawler, project_id, credentials):
+    return None
+  with negative_cache.scope(credentials, project_id), \
+      service_pool.lease(CRAWL_CLIENT_MAP[crawler_name], credentials) as client:
+    return get_crawl(
+        crawler,
+        project_id,
+        client,
+        crawler_config_for(crawler_name, scan_config, gcs_output_path,
+                           light_scan, billing_index),
+    )
+
+
+def api_disabled(crawler: Any, project_id: str,
+                 credentials: Credentials) -> bool:
+  """The function checks if the API of a crawler is disabled in a project.
+
+  Args:
+    crawler: crawler to run
+    project_id: ID of the project to crawl
+    credentials: credentials to crawl the project with
+
+  Returns:
+    True if an earlier request of the API failed with SERVICE_DISABLED for
+    the same credentials and project.
+  """
+
+  api_name = crawler.list_api_name()
+  if api_name is None:
+    return False
+  if negative_cache.is_disabled(credentials, project_id, api_name):
+    logging.info('Skipping %s in project %s, the %s API is disabled',
+                 type(crawler).__name__, project_id, api_name)
+    return True
+  return False
+
+
+def crawler_config_for(
+    crawler_name: str,
+    scan_config: Optional[dict],
+    gcs_output_path: Union[Path, str],
+    light_scan: bool = False,
+    billing_index: Optional[BillingIndex] = None,
+) -> Dict[str, Any]:
+  """Returns the config passed to a crawler."""
+
+  crawler_config = {}
+  if scan_config is not None:
+    # copy the section since the same config is shared between projects
+    crawler_config = dict(scan_config.get(crawler_name) or {})
+
+  # add gcs output path to the config.
+  # this path is used by the storage bucket crawler as of now.
+  crawler_config['gcs_output_path'] = gcs_output_path
+  if billing_index is not None and crawler_name == 'cloud_billing_account':
+    crawler_config['billing_index'] = billing_index
+  if light_scan:
+    fields = light_scan_fields(crawler_name)
+    if fields is not None:
+      # the server returns only the fields the light scan keeps, unless the
+      # scan config asks for its own fields
+      crawler_config.setdefault('fields', fields)
+  return crawler_config
+
+
+def new_project_result(project: models.ProjectInfo) -> Dict[str, Any]:
+  """The function creates the result of a project scan before crawling.
+
+  Args:
+    project: class to store project scan configration
+
+  Returns:
+    Dictionary with the project and service account details.
+  """
+
+  project_result = dict()
   project_result['project_info'] = project.project
   project_result['service_account_chain'] = project.sa_results[
       'service_account_chain'
@@ -218,14 +435,22 @@ def get_resources(project: models.ProjectInfo):
       'current_service_account'
   ]
   project_result['token_scopes'] = project.sa_results['token_scopes']
-  project_result['service_account_edges'] = project.sa_results[project_id][
-      'service_account_edges'
-  ]
+  return project_result
+
 
-  # Fail with error if the output file already exists
+def project_output_paths(project: models.ProjectInfo) -> Tuple[Path, Path]:
+  """Returns paths of the project results and storage object listings."""
+
+  project_id = project.project['projectId']
   output_file_name = f'{project_id}-{project.scan_time_suffix}.json'
-  output_path = Path(project.out_dir, output_file_name)
-  gcs_output_path = Path(project.out_dir, f'gcs-{output_file_name}')
+  return (
+      Path(project.out_dir, output_file_name),
+      Path(project.out_dir, f'gcs-{output_file_name}'),
+  )
+
+
+def create_output_file(output_path: Path):
+  """Fails with error if the output file already exists."""
 
   try:
     with open(output_path, 'x', encoding='utf-8'):
@@ -233,73 +458,153 @@ def get_resources(project: models.ProjectInfo):
 
   except FileExistsError:
     logging.error(
-        'Try removing the %s file and restart the scanner.', output_file_name
+        'Try removing the %s file and restart the scanner.', output_path.name
     )
 
-  threads_list = list()
-  for crawler_name, client_name in CRAWL_CLIENT_MAP.items():
-    if is_set(project.scan_config, crawler_name):
-      crawler_config = {}
-      if project.scan_config is not None:
-        crawler_config = project.scan_config.get(crawler_name)
 
-      # add gcs output path to the config.
-      # this path is used by the storage bucket crawler as of now.
-      crawler_config['gcs_output_path'] = gcs_output_path
+def save_project_result(
+    project: models.ProjectInfo,
+    project_result: Dict[str, Any],
+    output_path: Path,
+):
+  """Saves the project result without waiting for impersonation.
 
-      # crawl the data
-      crawler = CrawlerFactory.create_crawler(crawler_name)
-      client = ClientFactory.get_client(client_name).get_service(
-          project.credentials,
-      )
+  Service account edges are saved as an empty list at the end of the file
+  and filled in by save_service_account_edges().
 
-      t = threading.Thread(
-          target=get_crawl,
-          args=(
-              crawler,
-              project_id,
-              client,
-              crawler_config,
-              project_result,
-              crawler_name,
-          ),
-      )
-      t.daemon = True
-      t.start()
-      threads_list.append(t)
+  Args:
+    project: class to store project scan configration
+    project_result: crawled data of the project
+    output_path: path of the output file
+  """
 
-      while True:
-        active_threads = 0
-        for t in threads_list:
-          if t.is_alive():
-            active_threads += 1
-        if active_threads >= project.resource_worker_count:
-          time.sleep(0.1)
-        else:
-          break
+  project_id = project.project['projectId']
+  # the edges go last, so they are filled in without rewriting the file
+  project_result.pop('service_account_edges', None)
+  project_result['service_account_edges'] = []
 
-  for t in threads_list:
-    t.join()
+  logging.info('Saving results for %s into the file', project_id)
+  save_results(project_result, output_path, project.light_scan)
+  with project.edges_lock:
+    project.output_path = output_path
+  save_service_account_edges(project)
 
-  # Call other miscellaneous crawlers here
-  if is_set(project.scan_config, 'gke_clusters'):
-    gke_client = gke_client_for_credentials(project.credentials)
-    res = misc_crawler.get_gke_clusters(
-        project_id,
-        gke_client,
-    )
-    if res is not None and len(res) != 0:
-      project_result['gke_clusters'] = res
-  if is_set(project.scan_config, 'gke_images'):
-    res = misc_crawler.get_gke_images(
-        project_id,
-        project.credentials.token,
-    )
+
+def finish_impersonation(project: models.ProjectInfo):
+  """Marks impersonation attempts in the project as over.
+
+  Args:
+    project: class to store project scan configration
+  """
+
+  project.impersonation_done.set()
+  save_service_account_edges(project)
+
+
+def save_service_account_edges(project: models.ProjectInfo):
+  """Writes the service account edges into the saved project result.
+
+  Edges are found while the project is crawled, so they are written by
+  whichever of save_project_result() and finish_impersonation() is called
+  last.
+
+  Args:
+    project: class to store project scan configration
+  """
+
+  with project.edges_lock:
+    if (
+        project.edges_saved
+        or project.output_path is None
+        or not project.impersonation_done.is_set()
+    ):
+      return
+    project.edges_saved = True
+    project_id = project.project['projectId']
+    edges = project.sa_results['projects'][project_id].get(
+        'service_account_edges', [])
+    if not edges:
+      return
+    placeholder = f'{EDGES_KEY}: []\n}}'.encode('utf-8')
+    try:
+      with open(project.output_path, 'r+b') as outfile:
+        size = outfile.seek(0, os.SEEK_END)
+        outfile.seek(max(size - len(placeholder), 0))
+        if outfile.read() != placeholder:
+          raise ValueError('no service account edges at the end of the file')
+        outfile.seek(size - len(placeholder))
+        outfile.truncate()
+        edges_json = json.dumps(edges, indent=2).replace('\n', '\n  ')
+        outfile.write(f'{EDGES_KEY}: {edges_json}\n}}'.encode('utf-8'))
+    except Exception:
+      logging.error('Failed to save service account edges of %s', project_id)
+      logging.error(sys.exc_info()[1])
+
+
+def get_resources(project: models.ProjectInfo):
+  """The function crawls the data for a project and stores the results in a
+
+     dictionary.
+
+  Args:
+    project: class to store project scan configration
+
+  Returns:
+    Path of the output file, None if the project was skipped.
+  """
+
+  try:
+    return crawl_project(project)
+  finally:
+    service_pool.release(project.credentials)
+
+
+def crawl_project(project: models.ProjectInfo) -> Optional[str]:
+  """The function crawls the data for a project, see get_resources."""
+
+  if (
+      project.target_project
+      and project.target_project not in project.project['projectId']
+  ):
+    return None
+
+  project_id = project.project['projectId']
+  print(f'Inspecting project {project_id}')
+  lazy_import.mark('first project crawl started')
+  project_result = new_project_result(project)
+
+  output_path, gcs_output_path = project_output_paths(project)
+  create_output_file(output_path)
+
+  crawler_futures = list()
+  with BoundedExecutor(project.resource_worker_count,
+                       f'{project_id}-crawler') as executor:
+    for crawler_name in project_crawlers(project.scan_config):
+      future = executor.submit(
+          crawl_resource,
+          crawler_name,
+          project_id,
+          project.credentials,
+          project.scan_config,
+          gcs_output_path,
+          project.light_scan,
+          project.billing_index,
+      )
+      crawler_futures.append((crawler_name, future))
+
+  for crawler_name, future in crawler_futures:
+    try:
+      res = future.result()
+    except Exception:
+      logging.error('Crawler %s failed for project %s', crawler_name,
+                    project_id)
+      logging.error(sys.exc_info()[1])
+      continue
     if res is not None and len(res) != 0:
-      project_result['gke_images'] = res
+      project_result[crawler_name] = res
 
-  logging.info('Saving results for %s into the file', project_id)
-  save_results(project_result, output_path, project.light_scan)
+  save_project_result(project, project_result, output_path)
+  return str(output_path)
 
 
 def impersonate_service_accounts(
@@ -330,46 +635,190 @@ def impersonate_service_accounts(
   if impers is not None and impers.get('impersonate', False) is True:
     logging.info('Looking for impersonation options in %s', project_id)
     iam_client = iam_client_for_credentials(credentials)
-    if is_set(scan_config, 'iam_policy') is False:
+    # Chained identities are impersonated straight from the root credential
+    # with the rest of the chain passed as delegates.
+    delegated_iam_client, delegates = None, None
+    root_credentials = context.get_root_credentials(chain_so_far)
+    if root_credentials is not None:
+      delegated_iam_client = iam_client_for_credentials(root_credentials)
+      delegates = chain_so_far[1:] + [sa_name]
+    with service_pool.lease('cloudresourcemanager', credentials) as client:
       iam_policy = CrawlerFactory.create_crawler('iam_policy').crawl(
           project_id,
-          ClientFactory.get_client('cloudresourcemanager').get_service(
-              credentials,
-          ),
+          client,
       )
 
+    def try_impersonation(candidate_service_account):
+      return attempt_impersonation(
+          context,
+          iam_client,
+          sa_name,
+          candidate_service_account,
+          updated_chain,
+          delegated_iam_client,
+          delegates,
+      )
+
+    # Candidates are tried in parallel. A service account listed in several
+    # project policies is only tried once per impersonating identity.
     project_service_accounts = get_sas_for_impersonation(iam_policy)
-    for candidate_service_account in project_service_accounts:
-      try:
-        logging.info('Trying %s', candidate_service_account)
-        creds_impersonated = credsdb.impersonate_sa(
-            iam_client, candidate_service_account
-        )
-        context.service_account_queue.put(
-            (candidate_service_account, creds_impersonated, updated_chain)
-        )
-        project_result['service_account_edges'].append(
-            candidate_service_account
+    attempts = [
+        (
+            candidate_service_account,
+            context.impersonate(
+                sa_name, candidate_service_account, try_impersonation
+            ),
         )
-        logging.info(
-            'Successfully impersonated %s using %s',
+        for candidate_service_account in project_service_accounts
+    ]
+    for candidate_service_account, attempt in attempts:
+      if attempt.exception() is not None:
+        logging.error('Failed to get token for %s', candidate_service_account)
+        logging.error(attempt.exception())
+        continue
+      project_result['service_account_edges'].append(
+          candidate_service_account
+      )
+
+
+def attempt_impersonation(
+    context: models.SpiderContext,
+    iam_client: 'IAMCredentialsClient',
+    sa_name: str,
+    candidate_service_account: str,
+    updated_chain: List[str],
+    delegated_iam_client: Optional['IAMCredentialsClient'] = None,
+    delegates: Optional[List[str]] = None,
+) -> Credentials:
+  """The function impersonates a candidate SA and queues it for scanning.
+
+  Results are looked up in and recorded to the impersonation cache, so known
+  outcomes do not cost a generateAccessToken call. If delegates are given, the
+  token is requested by the root of the chain first and by the impersonating
+  identity only if that fails.
+
+  Args:
+    context: the context with the queue of service accounts to process
+    iam_client: IAM Credentials client of the impersonating identity
+    sa_name: name of the impersonating identity
+    candidate_service_account: email of the service account to impersonate
+    updated_chain: the impersonation chain leading to the candidate
+    delegated_iam_client: IAM Credentials client of the chain root (Optional)
+    delegates: service accounts between the chain root and the candidate
+
+  Returns:
+    The impersonated credentials.
+  """
+
+  def mint_token():
+    creds = None
+    if delegates:
+      try:
+        creds = credsdb.impersonate_sa(
+            delegated_iam_client,
             candidate_service_account,
-            sa_name,
+            timeout=context.impersonation_timeout,
+            delegates=delegates,
         )
       except Exception:
-        logging.error('Failed to get token for %s', candidate_service_account)
-        logging.error(sys.exc_info()[1])
+        logging.info('Delegated impersonation of %s failed, using %s token',
+                     candidate_service_account, sa_name)
+        logging.debug(sys.exc_info()[1])
+    if creds is None:
+      creds = credsdb.impersonate_sa(
+          iam_client,
+          candidate_service_account,
+          timeout=context.impersonation_timeout,
+      )
+    return creds.token, creds.expiry
+
+  cache = context.impersonation_cache
+  cached = cache.get(sa_name, candidate_service_account)
+  if cached is not None and cached['status'] == 'failure':
+    raise CachedImpersonationFailure(cached['reason'])
+
+  if cached is not None:
+    logging.info('Reusing cached token for %s', candidate_service_account)
+    token = cached['token']
+    expiry = credsdb.timestamp_to_expiry(cached['token_expiry'])
+  else:
+    logging.info('Trying %s', candidate_service_account)
+    try:
+      token, expiry = mint_token()
+    except (exceptions.PermissionDenied, exceptions.NotFound) as ex:
+      cache.record_failure(
+          sa_name, candidate_service_account, f'{type(ex).__name__}: {ex}'
+      )
+      raise
+    cache.record_success(
+        sa_name,
+        candidate_service_account,
+        token,
+        credsdb.expiry_to_timestamp(expiry),
+    )
+
+  # the token is minted again before it expires
+  creds_impersonated = credential_manager.manager.issue(
+      token,
+      expiry,
+      credsdb.IMPERSONATION_SCOPES,
+      candidate_service_account,
+      mint_token,
+  )
+
+  context.service_account_queue.put(
+      (candidate_service_account, creds_impersonated, updated_chain)
+  )
+  logging.info(
+      'Successfully impersonated %s using %s',
+      candidate_service_account,
+      sa_name,
+  )
+  return creds_impersonated
+
+
+def log_project_failure(future: futures.Future):
+  """Logs an exception raised by a project scan, if any."""
+  exc = future.exception()
+  if exc is not None:
+    logging.error('Failed to scan project')
+    logging.error(exc)
+
+
+def get_service(client_name: str, credentials: Credentials):
+  return ClientFactory.get_client(client_name).get_service(credentials)
+
+
+# Discovery services shared by the crawlers of projects scanned with the
+# same credentials
+service_pool = ServicePool(get_service)
+
+
+_iam_clients: Dict[Credentials, 'IAMCredentialsClient'] = dict()
+_iam_clients_lock = threading.Lock()
 
 
 def iam_client_for_credentials(
     credentials: Credentials,
-) -> IAMCredentialsClient:
-  return iam_credentials.IAMCredentialsClient(credentials=credentials)
+) -> 'IAMCredentialsClient':
+  """Returns the IAM Credentials client of the credentials.
+
+  A single client is kept per credential object, so its gRPC channel is
+  reused for every project scanned with the credentials.
+  """
+  with _iam_clients_lock:
+    iam_client = _iam_clients.get(credentials)
+    if iam_client is None:
+      iam_client = iam_credentials.IAMCredentialsClient(
+          credentials=credentials
+      )
+      _iam_clients[credentials] = iam_client
+    return iam_client
 
 
 def gke_client_for_credentials(
     credentials: Credentials,
-) -> container_v1.services.cluster_manager.client.ClusterManagerClient:
+) -> 'container_v1.services.cluster_manager.client.ClusterManagerClient':
   return container_v1.services.cluster_manager.ClusterManagerClient(
       credentials=credentials
   )
@@ -500,13 +949,428 @@ def get_sa_tuples(args):
   return sa_tuples
 
 
+def discover_projects(
+    context: models.SpiderContext,
+    args,
+    scan_config: Optional[dict],
+    scan_time_suffix: str,
+    force_projects_list: List[str],
+    project_queue: queue.Queue,
+):
+  """The function discovers projects and feeds them to the project scanners.
+
+  Service accounts found through impersonation are processed as well. A None
+  entry is put into project_queue once discovery is over.
+
+  Args:
+    context: the context with the queue of service accounts to process
+    args: parsed command-line arguments
+    scan_config: scan configuration, if any
+    scan_time_suffix: timestamp appended to the output file names
+    force_projects_list: projects to scan even if they are not listed
+    project_queue: the queue to put discovered models.ProjectInfo objects in
+  """
+
+  processed_sas = set()
+  queued_projects = list()
+  try:
+    while not context.service_account_queue.empty():
+      # Get a new candidate service account / token
+      sa_name, credentials, chain_so_far = context.service_account_queue.get()
+      if sa_name in processed_sas:
+        continue
+
+      # Don't process this service account again
+      processed_sas.add(sa_name)
+
+      logging.info('>> current service account: %s', sa_name)
+      sa_results = scanner.infinite_defaultdict()
+      # Log the chain we used to get here (even if we have no privs)
+      sa_results['service_account_chain'] = chain_so_far
+      sa_results['current_service_account'] = sa_name
+      # Add token scopes in the result
+      sa_results['token_scopes'] = credentials.scopes
+
+      with service_pool.lease('cloudresourcemanager', credentials) as client:
+        project_list = CrawlerFactory.create_crawler(
+            'project_list',
+        ).crawl(client, scan_config.get('project_list')
+                if scan_config is not None else None)
+
+      if len(project_list) <= 0:
+        logging.info('Unable to list projects accessible from service account')
+
+      if force_projects_list:
+        for force_project_id in force_projects_list:
+          if (
+              next(
+                  (
+                      item
+                      for item in project_list
+                      if item['projectId'] == force_project_id
+                  ),
+                  None,
+              )
+              is not None
+          ):
+            logging.info('The project %s is already in the list',
+                         force_project_id)
+            continue
+          with service_pool.lease('cloudresourcemanager',
+                                  credentials) as client:
+            res = CrawlerFactory.create_crawler(
+                'project_info',
+            ).crawl(force_project_id, client)
+          if res:
+            project_list.append(res)
+          else:
+            # force object creation anyway
+            project_list.append(
+                {'projectId': force_project_id, 'projectNumber': 'N/A'}
+            )
+
+      # Enumerate projects accessible by SA. Every project is handed to the
+      # scanners first, so they do not wait for the impersonation attempts.
+      # Projects of other shards are not scanned, but service accounts are
+      # still impersonated there, so every shard sees the same projects.
+      scanned_ids = [
+          project['projectId'] for project in project_list
+          if sharding.in_shard(project['projectId'], args.shard_index,
+                               args.shard_count)
+          and (not args.target_project
+               or args.target_project in project['projectId'])
+      ]
+      # billing info of many projects is listed per billing account
+      billing_index = BillingIndex() if len(scanned_ids) > 1 else None
+      project_objs = list()
+      for project in project_list:
+        project_obj = models.ProjectInfo(
+            project,
+            sa_results,
+            args.output,
+            scan_config,
+            args.light_scan,
+            args.target_project,
+            scan_time_suffix,
+            sa_name,
+            credentials,
+            chain_so_far,
+            int(args.resource_worker_count),
+            billing_index,
+        )
+        project_objs.append(project_obj)
+        if sharding.in_shard(project['projectId'], args.shard_index,
+                             args.shard_count):
+          # services of the credentials are kept until the project is done
+          service_pool.retain(credentials)
+          project_queue.put(project_obj)
+          queued_projects.append(project_obj)
+
+      for project_obj in project_objs:
+        try:
+          impersonate_service_accounts(
+              context,
+              project_obj.project,
+              scan_config,
+              sa_results,
+              chain_so_far,
+              sa_name,
+              credentials,
+          )
+        except Exception:
+          logging.error('Failed to look for impersonation options in %s',
+                        project_obj.project['projectId'])
+          logging.error(sys.exc_info()[1])
+        finally:
+          finish_impersonation(project_obj)
+  except Exception:
+    logging.error('Project discovery failed')
+    logging.error(sys.exc_info()[1])
+  finally:
+    # results of projects queued before a failure are finished as well
+    for project_obj in queued_projects:
+      if not project_obj.impersonation_done.is_set():
+        finish_impersonation(project_obj)
+    project_queue.put(None)
+
+  try:
+    context.impersonation_cache.save()
+  except Exception:
+    logging.error('Failed to save impersonation cache')
+    logging.error(sys.exc_info()[1])
+
+
+def queue_project_tasks(
+    project_key: str,
+    project: models.ProjectInfo,
+    job_queue: coordinator.JobQueue,
+):
+  """The function queues a task per crawler of the project for the workers.
+
+  Args:
+    project_key: key identifying the project scan in the job queue
+    project: class to store project scan configration
+    job_queue: the queue the workers take tasks from
+  """
+
+  project_id = project.project['projectId']
+  _, gcs_output_path = project_output_paths(project)
+  for crawler_name in project_crawlers(project.scan_config):
+    crawler_config = None
+    if project.scan_config is not None:
+      crawler_config = {crawler_name: project.scan_config.get(crawler_name)}
+    job_queue.add(project_key, crawler_name, {
+        'project_id': project_id,
+        'sa_name': project.sa_name,
+        'chain': project.chain_so_far,
+        'scan_config': crawler_config,
+        'gcs_output_name': gcs_output_path.name,
+        'light_scan': project.light_scan,
+    })
+
+
+def coordinate_projects(
+    project_queue: queue.Queue,
+    job_queue: coordinator.JobQueue,
+    poll_interval: float = 1,
+) -> Dict[str, str]:
+  """The function hands discovered projects to the workers as tasks.
+
+  Results of a project are saved once all of its tasks are finished.
+
+  Args:
+    project_queue: the queue discovered models.ProjectInfo objects come from
+    job_queue: the queue the workers take tasks from
+    poll_interval: number of seconds between checks of finished projects
+
+  Returns:
+    Output file names by project ID.
+  """
+
+  pending = dict()
+  output_files = dict()
+  scheduled = 0
+  discovering = True
+  while discovering or pending:
+    try:
+      project_obj = project_queue.get(timeout=poll_interval)
+    except queue.Empty:
+      project_obj = False
+    if project_obj is None:
+      discovering = False
+      job_queue.close()
+    elif project_obj:
+      project_id = project_obj.project['projectId']
+      if (
+          project_obj.target_project
+          and project_obj.target_project not in project_id
+      ):
+        service_pool.release(project_obj.credentials)
+        continue
+      print(f'Inspecting project {project_id}')
+      lazy_import.mark('first project crawl started')
+      scheduled += 1
+      project_key = f'{scheduled}:{project_id}'
+      output_path, _ = project_output_paths(project_obj)
+      create_output_file(output_path)
+      queue_project_tasks(project_key, project_obj, job_queue)
+      pending[project_key] = (project_obj, output_path)
+
+    for project_key, (project_obj, output_path) in list(pending.items()):
+      if not job_queue.project_finished(project_key):
+        continue
+      del pending[project_key]
+      service_pool.release(project_obj.credentials)
+      project_result = new_project_result(project_obj)
+      for crawler_name, res in job_queue.results(project_key).items():
+        if res is not None and len(res) != 0:
+          project_result[crawler_name] = res
+      try:
+        save_project_result(project_obj, project_result, output_path)
+      except Exception:
+        logging.error('Failed to save results of %s',
+                      project_obj.project['projectId'])
+        logging.error(sys.exc_info()[1])
+        continue
+      output_files[project_obj.project['projectId']] = output_path.name
+
+  logging.info('Tasks by state: %s', job_queue.counts())
+  return output_files
+
+
+_worker_credentials: Dict[Tuple[str, ...], Credentials] = dict()
+_worker_credentials_lock = threading.Lock()
+
+
+def worker_credentials(
+    root_credentials: Dict[str, Credentials],
+    sa_name: str,
+    chain: List[str],
+    timeout: Optional[float] = None,
+) -> Credentials:
+  """Returns the credentials of a service account on a worker.
+
+  Workers get their own root credentials from their command-line arguments.
+  Service accounts found through impersonation are impersonated again
+  from the root of their chain, with the rest of the chain as delegates.
+
+  Args:
+    root_credentials: credentials of the worker by identity name
+    sa_name: the identity to get credentials of
+    chain: the impersonation chain that led to sa_name
+    timeout: timeout of the generateAccessToken calls in seconds
+
+  Returns:
+    The credentials of sa_name.
+  """
+
+  root_name = chain[0] if chain else sa_name
+  if root_name not in root_credentials:
+    raise ValueError(f'Credentials of {root_name} are not available')
+  if not chain:
+    return root_credentials[sa_name]
+
+  key = (sa_name, *chain)
+  with _worker_credentials_lock:
+    creds = _worker_credentials.get(key)
+  if creds is not None:
+    return creds
+
+  iam_client = iam_client_for_credentials(root_credentials[root_name])
+
+  def mint_token():
+    creds = credsdb.impersonate_sa(
+        iam_client, sa_name, timeout=timeout, delegates=chain[1:]
+    )
+    return creds.token, creds.expiry
+
+  token, expiry = mint_token()
+  creds = credential_manager.manager.issue(
+      token, expiry, credsdb.IMPERSONATION_SCOPES, sa_name, mint_token
+  )
+  with _worker_credentials_lock:
+    if key not in _worker_credentials:
+      # workers keep services of every identity until they exit
+      service_pool.retain(creds)
+      _worker_credentials[key] = creds
+    return _worker_credentials[key]
+
+
+def run_worker_task(
+    client: coordinator.CoordinatorClient,
+    task: Dict[str, Any],
+    lease_seconds: float,
+    root_credentials: Dict[str, Credentials],
+    out_dir: str,
+    timeout: Optional[float] = None,
+):
+  """The function runs a leased task and reports its result.
+
+  The lease is extended by heartbeats while the crawler runs.
+
+  Args:
+    client: client of the coordinator
+    task: the leased task
+    lease_seconds: number of seconds a task is leased for
+    root_credentials: credentials of the worker by identity name
+    out_dir: directory to save storage object listings in
+    timeout: timeout of the generateAccessToken calls in seconds
+  """
+
+  payload = task['payload']
+  stop = threading.Event()
+
+  def heartbeat():
+    while not stop.wait(lease_seconds / 3):
+      try:
+        if not client.heartbeat(task['id']):
+          return
+      except Exception:
+        logging.error('Heartbeat of task %d failed', task['id'])
+        logging.error(sys.exc_info()[1])
+
+  heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+  heartbeat_thread.start()
+  try:
+    credentials = worker_credentials(
+        root_credentials, payload['sa_name'], payload['chain'], timeout
+    )
+    res = crawl_resource(
+        task['crawler'],
+        payload['project_id'],
+        credentials,
+        payload['scan_config'],
+        Path(out_dir, payload['gcs_output_name']),
+        payload.get('light_scan', False),
+    )
+  except Exception:
+    logging.error('Crawler %s failed for project %s', task['crawler'],
+                  payload['project_id'])
+    logging.error(sys.exc_info()[1])
+    client.fail(task['id'], str(sys.exc_info()[1]))
+    return
+  finally:
+    stop.set()
+    heartbeat_thread.join()
+  if isinstance(res, spool.SpooledDict):
+    # results are sent to the coordinator as JSON
+    with res as spooled:
+      res = dict(spooled)
+  client.complete(task['id'], res)
+
+
+def run_worker(
+    client: coordinator.CoordinatorClient,
+    root_credentials: Dict[str, Credentials],
+    out_dir: str,
+    worker_count: int,
+    timeout: Optional[float] = None,
+    poll_interval: float = 1,
+):
+  """The function takes tasks from the coordinator until the scan is over.
+
+  Args:
+    client: client of the coordinator
+    root_credentials: credentials of the worker by identity name
+    out_dir: directory to save storage object listings in
+    worker_count: number of tasks run in parallel
+    timeout: timeout of the generateAccessToken calls in seconds
+    poll_interval: number of seconds to wait when no task is queued
+  """
+
+  def worker_loop():
+    while True:
+      try:
+        response = client.lease()
+      except OSError:
+        logging.info('Coordinator at %s is gone', client.url)
+        return
+      task = response['task']
+      if task is None:
+        if response['finished']:
+          return
+        time.sleep(poll_interval)
+        continue
+      run_worker_task(client, task, response['lease_seconds'],
+                      root_credentials, out_dir, timeout)
+
+  for credentials in root_credentials.values():
+    service_pool.retain(credentials)
+  with BoundedExecutor(worker_count, 'worker') as executor:
+    loops = [executor.submit(worker_loop) for _ in range(worker_count)]
+  for loop in loops:
+    loop.result()
+
+
 def main():
   """The main scanner loop for GCP Scanner"""
 
+  lazy_import.mark('modules imported')
   logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
   logging.getLogger('googleapiclient.http').setLevel(logging.ERROR)
 
   args = arguments.arg_parser()
+  lazy_import.mark('arguments parsed')
 
   logging.basicConfig(
       level=getattr(logging, args.log_level.upper(), None),
@@ -516,134 +1380,197 @@ def main():
       filemode='a',
   )
 
+  # Generate current timestamp to append to the filename
+  scan_time_suffix = args.scan_time_suffix
+  if scan_time_suffix is None:
+    scan_time_suffix = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+
+  if args.processes > 1:
+    # every shard runs in its own process with its own credentials
+    return sharding.run_shards(
+        sys.argv[1:], args.processes, args.output, scan_time_suffix
+    )
+
+  error_report_name = f'errors-{scan_time_suffix}.jsonl'
+  if args.worker is not None:
+    error_report_name = f'errors-{scan_time_suffix}-{os.getpid()}.jsonl'
+  elif args.shard_count > 1:
+    error_report_name = f'errors-{scan_time_suffix}-{args.shard_index}.jsonl'
+  discovery_documents.configure(
+      args.cache_dir,
+      args.discovery_cache_ttl,
+      args.discovery_docs == 'live',
+  )
   force_projects_list = list()
   if args.force_projects:
     force_projects_list = args.force_projects.split(',')
 
   sa_tuples = scanner.get_sa_tuples(args)
+  lazy_import.mark('credentials loaded')
+
+  impersonation_cache_path = None
+  location_cache_path = None
+  if args.cache_dir is not None:
+    os.makedirs(args.cache_dir, exist_ok=True)
+    impersonation_cache_path = os.path.join(
+        args.cache_dir, 'impersonation.json'
+    )
+    location_cache_path = os.path.join(args.cache_dir, 'locations.json')
+
+  # objects shared by all threads of the scan, including worker processes
+  context = models.SpiderContext(
+      sa_tuples,
+      int(args.impersonation_worker_count),
+      args.impersonation_timeout,
+      ImpersonationCache(
+          impersonation_cache_path, args.impersonation_cache_ttl
+      ),
+      request_budget.RequestBudget(
+          args.max_inflight_requests,
+          args.max_inflight_requests_per_api,
+      ),
+      transport.HttpPool(args.http_pool_size),
+      retry.RetryPolicy(
+          args.max_attempts,
+          args.retry_budget_per_api,
+          report=retry.ErrorReport.to_file(
+              os.path.join(args.output, error_report_name)),
+      ),
+      negative_cache.NegativeCache(),
+      location_cache.LocationCache(
+          location_cache_path, args.empty_location_ttl
+      ),
+      # background requests never run beyond the limit of the budget
+      BoundedExecutor(
+          args.max_inflight_requests or scheduler.DEFAULT_REQUEST_WORKERS,
+          'request',
+      ),
+  )
+  with context.activate():
+    return scan(context, args, scan_time_suffix, force_projects_list)
 
-  scan_config = None
-  if args.config_path is not None:
-    with open(args.config_path, 'r', encoding='utf-8') as f:
-      scan_config = json.load(f)
-
-  # Generate current timestamp to append to the filename
-  scan_time_suffix = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
 
-  context = models.SpiderContext(sa_tuples)
+def scan(
+    context: models.SpiderContext,
+    args: Any,
+    scan_time_suffix: str,
+    force_projects_list: List[str],
+) -> int:
+  """The function runs the scan, or the worker, once the context is set up.
 
-  project_queue = list()
-  processed_sas = set()
+  Args:
+    context: the context of the scan, activated by the caller
+    args: parsed command-line arguments
+    scan_time_suffix: timestamp appended to the output file names
+    force_projects_list: projects to scan even if they are not listed
 
-  while not context.service_account_queue.empty():
-    # Get a new candidate service account / token
-    sa_name, credentials, chain_so_far = context.service_account_queue.get()
-    if sa_name in processed_sas:
-      continue
+  Returns:
+    The exit status of the process.
+  """
 
-    # Don't process this service account again
-    processed_sas.add(sa_name)
-
-    logging.info('>> current service account: %s', sa_name)
-    sa_results = scanner.infinite_defaultdict()
-    # Log the chain we used to get here (even if we have no privs)
-    sa_results['service_account_chain'] = chain_so_far
-    sa_results['current_service_account'] = sa_name
-    # Add token scopes in the result
-    sa_results['token_scopes'] = credentials.scopes
-
-    project_list = CrawlerFactory.create_crawler(
-        'project_list',
-    ).crawl(
-        ClientFactory.get_client('cloudresourcemanager').get_service(
-            credentials
-        ),
+  if args.worker is not None:
+    # Workers use their own credentials and get the rest from the tasks
+    client = coordinator.CoordinatorClient(
+        args.worker, f'{socket.gethostname()}-{os.getpid()}'
     )
+    run_worker(
+        client,
+        context.root_credentials,
+        args.output,
+        int(args.resource_worker_count),
+        args.impersonation_timeout,
+    )
+    service_pool.log_report()
+    transport.log_report()
+    retry.log_report()
+    negative_cache.log_report()
+    location_cache.save()
+    credential_manager.manager.log_report()
+    if args.startup_profile:
+      lazy_import.report()
+    return 0
 
-    if len(project_list) <= 0:
-      logging.info('Unable to list projects accessible from service account')
-
-    if force_projects_list:
-      for force_project_id in force_projects_list:
-        if (
-            next(
-                (
-                    item
-                    for item in project_list
-                    if item['projectId'] == force_project_id
-                ),
-                None,
-            )
-            is not None
-        ):
-          logging.info('The project %s is already in the list',
-                       force_project_id)
-          continue
-        res = CrawlerFactory.create_crawler(
-            'project_info',
-        ).crawl(
-            force_project_id,
-            ClientFactory.get_client('cloudresourcemanager').get_service(
-                credentials,
-            ),
-        )
-        if res:
-          project_list.append(res)
-        else:
-          # force object creation anyway
-          project_list.append(
-              {'projectId': force_project_id, 'projectNumber': 'N/A'}
-          )
-
-    # Enumerate projects accessible by SA
-    for project in project_list:
-      project_obj = models.ProjectInfo(
-          project,
-          sa_results,
-          args.output,
-          scan_config,
-          args.light_scan,
-          args.target_project,
-          scan_time_suffix,
-          sa_name,
-          credentials,
-          chain_so_far,
-          int(args.resource_worker_count),
-      )
-      project_queue.append(project_obj)
-      impersonate_service_accounts(
+  scan_config = None
+  if args.config_path is not None:
+    with open(args.config_path, 'r', encoding='utf-8') as f:
+      scan_config = json.load(f)
+    config_errors = validate_scan_config(scan_config)
+    if config_errors:
+      for error in config_errors:
+        logging.error('Invalid scan config: %s', error)
+      sys.exit(ERROR_CODES.get('InvalidScanConfigError'))
+
+  project_queue = queue.Queue()
+  discovery = threading.Thread(
+      # discovery requests are made with the objects of the scan
+      target=contextvars.copy_context().run,
+      args=(
+          discover_projects,
           context,
-          project,
+          args,
           scan_config,
-          sa_results,
-          chain_so_far,
-          sa_name,
-          credentials,
-      )
-
-  all_thread_handles = list()
-
-  # See i#267 on why we use the native threading approach here.
-  for i, project_obj in enumerate(project_queue):
-    logging.info('Finished %d projects out of %d', i, len(project_queue) - 1)
-    sync_t = threading.Thread(target=scanner.get_resources, args=(project_obj,))
-    sync_t.daemon = True
-    sync_t.start()
-    all_thread_handles.append(sync_t)
-
-    while True:  # enforce explicit block on number of threads
-      active_threads = 0
-      for t in all_thread_handles:
-        if t.is_alive():
-          active_threads += 1
-
-      if active_threads >= int(args.project_worker_count):
-        time.sleep(0.1)
-      else:
-        break
-
-  # wait for any threads left to finish
-  for t in all_thread_handles:
-    t.join()
-
+          scan_time_suffix,
+          force_projects_list,
+          project_queue,
+      ),
+      name='discovery',
+      daemon=True,
+  )
+  discovery.start()
+
+  output_files = dict()
+  if args.coordinator is not None:
+    # Workers take (project, crawler) tasks from the coordinator
+    job_queue = coordinator.JobQueue(
+        os.path.join(args.output, f'tasks-{scan_time_suffix}.db'),
+        args.lease_timeout,
+    )
+    server = coordinator.CoordinatorServer(
+        coordinator.parse_address(args.coordinator), job_queue
+    )
+    server.start()
+    logging.info('Coordinator is listening on %s', server.url)
+    output_files = coordinate_projects(project_queue, job_queue)
+    server.shutdown()
+  elif args.engine == 'asyncio':
+    output_files = async_engine.AsyncEngine(
+        int(args.project_worker_count),
+        int(args.resource_worker_count),
+    ).run(project_queue)
+  else:
+    # See i#267 on why we use the native threading approach here.
+    # Projects are scanned as soon as discovery finds them.
+    scheduled = 0
+    project_futures = list()
+    with BoundedExecutor(int(args.project_worker_count),
+                         'project') as executor:
+      while True:
+        project_obj = project_queue.get()
+        if project_obj is None:
+          break
+        scheduled += 1
+        logging.info('Scheduling project %s (%d so far)',
+                     project_obj.project['projectId'], scheduled)
+        future = executor.submit(scanner.get_resources, project_obj)
+        future.add_done_callback(log_project_failure)
+        project_futures.append((project_obj.project['projectId'], future))
+
+    for project_id, future in project_futures:
+      if future.exception() is None and future.result() is not None:
+        output_files[project_id] = os.path.basename(future.result())
+
+  discovery.join()
+
+  if args.shard_count > 1:
+    sharding.write_manifest(args.output, scan_time_suffix, args.shard_index,
+                            args.shard_count, output_files)
+  service_pool.log_report()
+  transport.log_report()
+  retry.log_report()
+  negative_cache.log_report()
+  location_cache.save()
+  credential_manager.manager.log_report()
+  if args.startup_profile:
+    lazy_import.mark('scan finished')
+    lazy_import.report()
   return 0
@@ -0,0 +1,107 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module with a bounded thread pool used to schedule crawlers.
+
+"""
+
+from concurrent import futures
+import contextlib
+import contextvars
+import threading
+from typing import Any, Callable, Iterator
+
+# Number of background API requests, e.g. prefetched pages, running at once
+# unless the scan limits the requests in flight.
+DEFAULT_REQUEST_WORKERS = 32
+
+
+class BoundedExecutor:
+  """A fixed size thread pool that blocks producers when all workers are busy.
+
+  Unlike a bare ThreadPoolExecutor, the number of submitted but not yet
+  finished tasks never exceeds the worker count, so memory stays flat no
+  matter how many tasks the producer generates. A new task is started the
+  moment a running one finishes.
+  """
+
+  def __init__(self, max_workers: int, name: str = ''):
+    """Initialize the pool.
+
+    Args:
+      max_workers: maximum number of tasks running at the same time.
+      name: prefix used to name worker threads.
+    """
+
+    max_workers = max(1, int(max_workers))
+    self._executor = futures.ThreadPoolExecutor(
+        max_workers=max_workers,
+        thread_name_prefix=name,
+    )
+    self._slots = threading.BoundedSemaphore(max_workers)
+    self.max_workers = max_workers
+
+  def submit(self, fn: Callable[..., Any], *args, **kwargs) -> futures.Future:
+    """Schedule fn(*args, **kwargs), waiting for a free worker if needed.
+
+    The task runs in a copy of the caller's context, so it sees the objects
+    of the running scan, see SpiderContext.activate().
+
+    Returns:
+      A future holding the result or the exception raised by the task.
+    """
+
+    self._slots.acquire()
+    try:
+      future = self._executor.submit(contextvars.copy_context().run, fn,
+                                     *args, **kwargs)
+    except Exception:
+      self._slots.release()
+      raise
+    future.add_done_callback(lambda _: self._slots.release())
+    return future
+
+  def shutdown(self, wait: bool = True):
+    """Stop accepting tasks and optionally wait for running ones."""
+    self._executor.shutdown(wait=wait)
+
+  def __enter__(self) -> 'BoundedExecutor':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.shutdown(wait=True)
+    return False
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the executor the one of background requests in the block."""
+
+    token = _current.set(self)
+    try:
+      yield
+    finally:
+      _current.reset(token)
+
+
+# The executor of background requests of the running scan, see
+# SpiderContext.activate(). Its tasks must not submit tasks of their own.
+_current: 'contextvars.ContextVar[BoundedExecutor]' = contextvars.ContextVar(
+    'request_executor',
+    default=BoundedExecutor(DEFAULT_REQUEST_WORKERS, 'request'))
+
+
+def request_executor() -> BoundedExecutor:
+  """Returns the executor of background requests of the running scan."""
+  return _current.get()
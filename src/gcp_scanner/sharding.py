@@ -0,0 +1,200 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to split a scan into shards run by separate processes.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# Options that are set by the parent process for every shard.
+SHARD_OPTIONS = (
+    '--processes',
+    '--shard-index',
+    '--shard-count',
+    '--scan-time-suffix',
+)
+
+
+def shard_of(project_id: str, shard_count: int) -> int:
+  """Returns the shard a project belongs to.
+
+  The shard depends only on the project ID, so every process and every
+  machine partitions the same project list in the same way.
+
+  Args:
+    project_id: ID of the project.
+    shard_count: total number of shards.
+
+  Returns:
+    Index of the shard in [0, shard_count).
+  """
+
+  digest = hashlib.sha256(project_id.encode('utf-8')).digest()
+  return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def in_shard(project_id: str, shard_index: int, shard_count: int) -> bool:
+  """Checks whether a project should be scanned by the given shard."""
+
+  if shard_count <= 1:
+    return True
+  return shard_of(project_id, shard_count) == shard_index
+
+
+def manifest_path(out_dir: str, scan_time_suffix: str, shard_index: int,
+                  shard_count: int) -> str:
+  """Returns path of the manifest written by a shard."""
+
+  return os.path.join(
+      out_dir,
+      f'manifest-{scan_time_suffix}-shard-{shard_index}-of-{shard_count}.json',
+  )
+
+
+def write_manifest(out_dir: str, scan_time_suffix: str, shard_index: int,
+                   shard_count: int, output_files: Dict[str, str]) -> str:
+  """Writes the manifest of the output files produced by a shard.
+
+  Args:
+    out_dir: output directory of the scan.
+    scan_time_suffix: timestamp appended to the output file names.
+    shard_index: index of the shard.
+    shard_count: total number of shards.
+    output_files: mapping of project IDs to their output file names.
+
+  Returns:
+    Path of the manifest.
+  """
+
+  path = manifest_path(out_dir, scan_time_suffix, shard_index, shard_count)
+  manifest = {
+      'scan_time_suffix': scan_time_suffix,
+      'shard_index': shard_index,
+      'shard_count': shard_count,
+      'projects': output_files,
+  }
+  with open(path, 'w', encoding='utf-8') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  return path
+
+
+def merge_manifests(out_dir: str, scan_time_suffix: str,
+                    shard_count: int) -> Dict[str, Any]:
+  """Merges manifests of all shards of a scan into a single manifest.
+
+  Shard manifests are removed once merged. Shards that did not write a
+  manifest (e.g. because the process crashed) are listed as missing.
+
+  Args:
+    out_dir: output directory of the scan.
+    scan_time_suffix: timestamp appended to the output file names.
+    shard_count: total number of shards.
+
+  Returns:
+    The merged manifest.
+  """
+
+  projects: Dict[str, str] = dict()
+  missing_shards: List[int] = list()
+  for shard_index in range(shard_count):
+    path = manifest_path(out_dir, scan_time_suffix, shard_index, shard_count)
+    try:
+      with open(path, 'r', encoding='utf-8') as f:
+        projects.update(json.load(f)['projects'])
+    except Exception:
+      logging.error('Failed to read manifest of shard %d', shard_index)
+      logging.error(sys.exc_info()[1])
+      missing_shards.append(shard_index)
+      continue
+    os.remove(path)
+
+  manifest = {
+      'scan_time_suffix': scan_time_suffix,
+      'shard_count': shard_count,
+      'missing_shards': missing_shards,
+      'projects': projects,
+  }
+  with open(os.path.join(out_dir, f'manifest-{scan_time_suffix}.json'), 'w',
+            encoding='utf-8') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  return manifest
+
+
+def shard_argv(argv: List[str], shard_index: int, shard_count: int,
+               scan_time_suffix: str) -> List[str]:
+  """Builds command-line arguments of a shard from the parent arguments."""
+
+  shard_args = list()
+  skip_value = False
+  for arg in argv:
+    if skip_value:
+      skip_value = False
+      continue
+    name = arg.split('=', 1)[0]
+    if name in SHARD_OPTIONS:
+      skip_value = '=' not in arg
+      continue
+    shard_args.append(arg)
+  # argparse keeps the last value of an option, so these also override
+  # abbreviations of the options, e.g. --proc 4
+  return shard_args + [
+      '--processes', '1',
+      '--shard-index', str(shard_index),
+      '--shard-count', str(shard_count),
+      '--scan-time-suffix', scan_time_suffix,
+  ]
+
+
+def run_shards(argv: List[str], processes: int, out_dir: str,
+               scan_time_suffix: str) -> int:
+  """Runs the scan in separate worker processes, one per shard.
+
+  Args:
+    argv: command-line arguments of the parent process.
+    processes: number of worker processes (and shards).
+    out_dir: output directory of the scan.
+    scan_time_suffix: timestamp shared by all shards.
+
+  Returns:
+    0 if all shards succeeded, 1 otherwise.
+  """
+
+  workers = list()
+  for shard_index in range(processes):
+    cmd = [sys.executable, '-m', 'gcp_scanner'] + shard_argv(
+        argv, shard_index, processes, scan_time_suffix)
+    logging.info('Starting shard %d of %d', shard_index, processes)
+    workers.append(subprocess.Popen(cmd))  # pylint: disable=consider-using-with
+
+  status = 0
+  for shard_index, worker in enumerate(workers):
+    if worker.wait() != 0:
+      logging.error('Shard %d exited with code %d', shard_index,
+                    worker.returncode)
+      status = 1
+
+  manifest = merge_manifests(out_dir, scan_time_suffix, processes)
+  logging.info('Scanned %d projects in %d shards',
+               len(manifest['projects']), processes)
+  if manifest['missing_shards']:
+    status = 1
+  return status
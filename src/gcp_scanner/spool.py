@@ -0,0 +1,118 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to keep large crawl results out of memory until they are saved.
+
+"""
+
+import json
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, Mapping, TextIO, Tuple
+
+# Results up to this many bytes stay in memory.
+DEFAULT_MAX_MEMORY = 8 * 1024 * 1024
+
+
+class SpooledDict(Mapping):
+  """A read-only mapping whose values are kept in a temporary file.
+
+  Crawlers add entries as soon as they are crawled, e.g. the tables of a
+  BigQuery dataset. Values are serialized to JSON right away and moved to
+  disk once they exceed max_memory bytes, so only the keys stay in memory.
+  The mapping is written into the output file by dump() entry by entry.
+  """
+
+  def __init__(self, max_memory: int = DEFAULT_MAX_MEMORY):
+    self._file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    # offset and length of the serialized value by key
+    self._index: Dict[str, Tuple[int, int]] = dict()
+    self._lock = threading.Lock()
+
+  def add(self, key: str, value: Any):
+    """Stores the value of key, replacing the previous one if any."""
+
+    data = json.dumps(value).encode('utf-8')
+    with self._lock:
+      self._file.seek(0, 2)
+      self._index[key] = (self._file.tell(), len(data))
+      self._file.write(data)
+
+  def update(self, values: Mapping):
+    for key, value in values.items():
+      self.add(key, value)
+
+  def __getitem__(self, key: str) -> Any:
+    with self._lock:
+      # KeyError for unknown keys, like a dict
+      offset, length = self._index[key]
+      self._file.seek(offset)
+      data = self._file.read(length)
+    return json.loads(data.decode('utf-8'))
+
+  def __iter__(self) -> Iterator[str]:
+    with self._lock:
+      keys = list(self._index)
+    return iter(keys)
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._index)
+
+  def close(self):
+    """Removes the temporary file, the values are gone afterwards."""
+    self._file.close()
+
+  def __enter__(self) -> 'SpooledDict':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+    return False
+
+
+def close_all(values: Mapping):
+  """Closes the SpooledDict values of a mapping, e.g. once it is saved."""
+
+  for value in values.values():
+    if isinstance(value, SpooledDict):
+      value.close()
+
+
+def dump(value: Any, out: TextIO, level: int = 0):
+  """Writes value as json.dumps(value, indent=2) does, streaming mappings.
+
+  The top-level mapping and SpooledDict values are written one entry at a
+  time, so a SpooledDict is never loaded into memory as a whole.
+
+  Args:
+    value: the value to write.
+    out: the file to write to.
+    level: nesting level of the value, for the indentation.
+  """
+
+  if not isinstance(value, Mapping) or (
+      level > 0 and not isinstance(value, SpooledDict)):
+    out.write(json.dumps(value, indent=2).replace('\n', '\n' + '  ' * level))
+    return
+  if not value:
+    out.write('{}')
+    return
+  separator = '{'
+  for key in value:
+    out.write(f'{separator}\n{"  " * (level + 1)}{json.dumps(key)}: ')
+    dump(value[key], out, level + 1)
+    separator = ','
+  out.write(f'\n{"  " * level}}}')
@@ -16,46 +16,85 @@
 
 """
 
+import asyncio
 import datetime
 import difflib
 import filecmp
+import gzip
+import io
 import json
 import logging
 import os
+import queue
 import shutil
 import sqlite3
+import sys
 import tempfile
+import threading
+import time
 import unittest
+from http import server
 from unittest.mock import patch, Mock
 
+import httplib2
 import requests
+from google.api_core import exceptions
+from google.auth import credentials as auth_credentials
+from google.auth import exceptions as auth_exceptions
 from google.oauth2 import credentials
-
+from googleapiclient import discovery
+from googleapiclient import discovery_cache
+from googleapiclient import errors as googleapiclient_errors
+from googleapiclient import http as googleapiclient_http
+
+from . import arguments
+from . import async_engine
+from . import coordinator
+from . import credential_manager
 from . import credsdb
+from . import lazy_import
+from . import location_cache
+from . import models
+from . import negative_cache
+from . import request_budget
+from . import retry
 from . import scanner
+from . import sharding
+from . import spool
+from . import transport
 from .client.appengine_client import AppEngineClient
 from .client.bigquery_client import BQClient
 from .client.bigtable_client import BigTableClient
 from .client.client_factory import ClientFactory
-from .client.client_factory import CloudBillingClient
+from .client.cloud_billing_client import CloudBillingClient
 from .client.cloud_functions_client import CloudFunctionsClient
 from .client.cloud_resource_manager_client import CloudResourceManagerClient
 from .client.compute_client import ComputeClient
 from .client.datastore_client import DatastoreClient
+from .client import discovery_documents
+from .client.discovery_documents import DiscoveryDocumentCache
 from .client.dns_client import DNSClient
 from .client.domains_client import DomainsClient
 from .client.filestore_client import FilestoreClient
 from .client.firestore_client import FirestoreClient
+from .client.http_request import ScannerHttpRequest
 from .client.iam_client import IAMClient
 from .client.kms_client import CloudKMSClient
 from .client.pubsub_client import PubSubClient
 from .client.service_management_client import ServiceManagementClient
+from .client.service_pool import ServicePool
 from .client.serviceusage_client import ServiceUsageClient
 from .client.sourcerepo_client import SourceRepoClient
 from .client.spanner_client import SpannerClient
 from .client.sql_client import SQLClient
 from .client.storage_client import StorageClient
+from .crawler import batch
+from .crawler import bigquery_crawler
+from .crawler import cloud_billing_account_crawler
+from .crawler import crawler_factory
 from .crawler import misc_crawler
+from .crawler import object_inventory
+from .crawler import pagination
 from .crawler.app_services_crawler import AppServicesCrawler
 from .crawler.bigquery_crawler import BigQueryCrawler
 from .crawler.bigtable_instances_crawler import BigTableInstancesCrawler
@@ -73,6 +112,7 @@ from .crawler.compute_snapshots_crawler import ComputeSnapshotsCrawler
 from .crawler.compute_static_ips_crawler import ComputeStaticIPsCrawler
 from .crawler.compute_subnets_crawler import ComputeSubnetsCrawler
 from .crawler.crawler_factory import CrawlerFactory
+from .crawler.interface_async_crawler import IAsyncCrawler
 from .crawler.datastore_crawler import DatastoreCrawler
 from .crawler.dns_managed_zones_crawler import DNSManagedZonesCrawler
 from .crawler.dns_policies_crawler import DNSPoliciesCrawler
@@ -90,6 +130,9 @@ from .crawler.spanner_instances_crawler import SpannerInstancesCrawler
 from .crawler.sql_instances_crawler import SQLInstancesCrawler
 from .crawler.storage_buckets_crawler import StorageBucketsCrawler
 from .credsdb import get_scopes_from_refresh_token
+from .impersonation_cache import CachedImpersonationFailure
+from .impersonation_cache import ImpersonationCache
+from .scheduler import BoundedExecutor
 
 PROJECT_NAME = "test-gcp-scanner-2"
 
@@ -110,9 +153,8 @@ def print_diff(f1, f2):
 
 
 def save_to_test_file(res):
-  res = json.dumps(res, indent=2, sort_keys=False)
   with open("test_res", "w", encoding="utf-8") as outfile:
-    outfile.write(res)
+    spool.dump(res, outfile)
 
 
 def compare_volatile(f1, f2):
@@ -1159,3 +1201,1943 @@ class TestCrawlerFactory(unittest.TestCase):
       crawler = CrawlerFactory.create_crawler("invalid")
       self.assertIsNone(crawler)
       self.assertEqual(log.output, ["ERROR:root:Crawler not supported."])
+
+
+class TestBoundedExecutor(unittest.TestCase):
+  """Unit tests for the BoundedExecutor class."""
+
+  def test_limits_running_tasks(self):
+    """Test that no more than max_workers tasks run at the same time."""
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def task():
+      with lock:
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+      time.sleep(0.01)
+      with lock:
+        running[0] -= 1
+
+    with BoundedExecutor(3) as executor:
+      for _ in range(20):
+        executor.submit(task)
+    self.assertEqual(running[0], 0)
+    self.assertLessEqual(peak[0], 3)
+
+  def test_returns_results_and_exceptions(self):
+    """Test that futures carry task results and exceptions."""
+    def task(value):
+      if value < 0:
+        raise ValueError("negative")
+      return value * 2
+
+    with BoundedExecutor(2) as executor:
+      ok = executor.submit(task, 21)
+      failed = executor.submit(task, -1)
+    self.assertEqual(ok.result(), 42)
+    self.assertIsInstance(failed.exception(), ValueError)
+
+
+class TestRequestBudget(unittest.TestCase):
+  """Unit tests for the RequestBudget class."""
+
+  def _run_requests(self, budget, api_names):
+    lock = threading.Lock()
+    running = dict()
+    peak = dict()
+
+    def request(api_name):
+      with budget.slot(api_name):
+        with lock:
+          for key in (api_name, "total"):
+            running[key] = running.get(key, 0) + 1
+            peak[key] = max(peak.get(key, 0), running[key])
+        time.sleep(0.01)
+        with lock:
+          for key in (api_name, "total"):
+            running[key] -= 1
+
+    with BoundedExecutor(len(api_names)) as executor:
+      for api_name in api_names:
+        executor.submit(request, api_name)
+    return peak
+
+  def test_global_limit(self):
+    """Test that the total number of requests in flight is capped."""
+    budget = request_budget.RequestBudget(max_inflight=2)
+    peak = self._run_requests(budget, ["compute", "storage"] * 5)
+    self.assertLessEqual(peak["total"], 2)
+
+  def test_per_api_limit(self):
+    """Test that every API gets its own sub-budget."""
+    budget = request_budget.RequestBudget(max_inflight_per_api=1)
+    peak = self._run_requests(budget, ["compute", "storage"] * 5)
+    self.assertEqual(peak["compute"], 1)
+    self.assertEqual(peak["storage"], 1)
+
+  def test_several_slots(self):
+    """Test that callers taking several slots do not deadlock."""
+    budget = request_budget.RequestBudget(max_inflight=3,
+                                          max_inflight_per_api=2)
+
+    def batch_request():
+      with budget.slot("bigquery", 5):
+        time.sleep(0.01)
+
+    with BoundedExecutor(4) as executor:
+      tasks = [executor.submit(batch_request) for _ in range(4)]
+      tasks.append(executor.submit(self._run_requests, budget,
+                                   ["bigquery"] * 4))
+      for task in tasks:
+        task.result(timeout=10)
+
+  def test_scan_budget(self):
+    """Test that threads of a scan use the budget of its context."""
+    context = models.SpiderContext(
+        [], request_budget=request_budget.RequestBudget(4, 2))
+    with context.activate():
+      with BoundedExecutor(1) as executor:
+        limits = executor.submit(request_budget.limits).result()
+    self.assertEqual(limits, (4, 2))
+    self.assertEqual(request_budget.limits(), (None, None))
+
+  def test_client_uses_budgeted_requests(self):
+    """Test that discovery clients build budgeted requests."""
+    service = ComputeClient().get_service(
+      auth_credentials.AnonymousCredentials())
+    request = service.instances().aggregatedList(project=PROJECT_NAME)
+    self.assertIsInstance(request, ScannerHttpRequest)
+    self.assertEqual(request.api_name, "compute")
+
+    with patch("gcp_scanner.client.http_request.request_budget.slot") as slot, \
+        patch("googleapiclient.http.HttpRequest.execute") as execute:
+      execute.return_value = {"items": {}}
+      self.assertEqual(request.execute(), {"items": {}})
+      slot.assert_called_once_with("compute")
+
+
+class TestDiscoverProjects(unittest.TestCase):
+  """Unit tests for the project discovery pipeline."""
+
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.scanner.CrawlerFactory")
+  @patch("gcp_scanner.scanner.impersonate_service_accounts")
+  def test_projects_are_queued_before_impersonation(
+    self, mocked_impersonate, mocked_crawler_factory, _
+  ):
+    """Test that projects reach the scanners before impersonation ends."""
+    mocked_crawler_factory.create_crawler.return_value.crawl.return_value = [
+      {"projectId": "project-1"},
+      {"projectId": "project-2"},
+    ]
+    project_queue = queue.Queue()
+    queued_at_impersonation = list()
+    mocked_impersonate.side_effect = (
+      lambda *args: queued_at_impersonation.append(project_queue.qsize()))
+    args = Mock(output="out", light_scan=False, target_project=None,
+                resource_worker_count=1, shard_index=0, shard_count=1)
+    context = models.SpiderContext([("sa", Mock(scopes=[]), [])])
+
+    scanner.discover_projects(context, args, None, "suffix", [],
+                              project_queue)
+
+    self.assertEqual(queued_at_impersonation, [2, 2])
+    projects = [project_queue.get() for _ in range(3)]
+    self.assertIsNone(projects[-1])
+    for project_obj in projects[:-1]:
+      self.assertTrue(project_obj.impersonation_done.is_set())
+
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.scanner.CrawlerFactory")
+  def test_discovery_failure_ends_queue(self, mocked_crawler_factory, _):
+    """Test that the queue is closed even if discovery fails."""
+    mocked_crawler_factory.create_crawler.side_effect = RuntimeError("boom")
+    project_queue = queue.Queue()
+    context = models.SpiderContext([("sa", Mock(scopes=[]), [])])
+
+    scanner.discover_projects(context, Mock(), None, "suffix", [],
+                              project_queue)
+
+    self.assertIsNone(project_queue.get_nowait())
+
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.scanner.CrawlerFactory")
+  @patch("gcp_scanner.scanner.impersonate_service_accounts")
+  def test_queued_projects_unblocked_on_failure(
+    self, mocked_impersonate, mocked_crawler_factory, _
+  ):
+    """Test that queued projects are released if discovery fails."""
+    mocked_crawler_factory.create_crawler.return_value.crawl.return_value = [
+      {"projectId": "project-1"},
+      {"projectId": "project-2"},
+    ]
+    project_queue = queue.Queue()
+    args = Mock(output="out", light_scan=False, target_project=None,
+                resource_worker_count=1, shard_index=0, shard_count=1)
+    context = models.SpiderContext([("sa", Mock(scopes=[]), [])])
+
+    with patch.object(scanner.service_pool, "retain",
+                      side_effect=[None, RuntimeError("boom")]):
+      scanner.discover_projects(context, args, None, "suffix", [],
+                                project_queue)
+
+    mocked_impersonate.assert_not_called()
+    project_obj = project_queue.get_nowait()
+    self.assertTrue(project_obj.impersonation_done.is_set())
+    self.assertIsNone(project_queue.get_nowait())
+
+  def test_service_account_edges_saved(self):
+    """Test that results are saved before the edges are known."""
+    sa_results = scanner.infinite_defaultdict()
+    sa_results["projects"]["project-1"]["service_account_edges"] = ["sa-1"]
+    project_obj = models.ProjectInfo({"projectId": "project-1"}, sa_results,
+                                     "out", None, False, None, "suffix",
+                                     "sa", Mock(), [], 1)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+      output_path = os.path.join(out_dir, "project-1.json")
+      scanner.save_project_result(project_obj, {"project_info": {}},
+                                  output_path)
+      with open(output_path, encoding="utf-8") as f:
+        self.assertEqual(json.load(f), {"project_info": {},
+                                        "service_account_edges": []})
+
+      scanner.finish_impersonation(project_obj)
+      with open(output_path, encoding="utf-8") as f:
+        self.assertEqual(json.load(f), {"project_info": {},
+                                        "service_account_edges": ["sa-1"]})
+
+  def test_project_list_crawler(self):
+    """Test that every page of accessible projects is returned."""
+    http = googleapiclient_http.HttpMockSequence([
+        ({"status": "200"}, json.dumps({"projects": [{"projectId": "p1"}],
+                                        "nextPageToken": "t"})),
+        ({"status": "200"}, json.dumps({"projects": [{"projectId": "p2"}]})),
+    ])
+    service = discovery.build("cloudresourcemanager", "v1", http=http,
+                              static_discovery=True)
+
+    projects = CrawlerFactory.create_crawler("project_list").crawl(
+        service, {"page_size": 1})
+
+    self.assertEqual([project["projectId"] for project in projects],
+                     ["p1", "p2"])
+    self.assertIn("pageSize=1", http.request_sequence[0][0])
+
+
+class TestParallelImpersonation(unittest.TestCase):
+  """Unit tests for impersonation attempts scheduled by SpiderContext."""
+
+  def test_attempts_are_deduplicated(self):
+    """Test that a pair is only attempted once across projects."""
+    context = models.SpiderContext([], impersonation_worker_count=4)
+    impersonate_fn = Mock(side_effect=lambda target: f"creds-{target}")
+
+    first = context.impersonate("root", "sa-1", impersonate_fn)
+    second = context.impersonate("root", "sa-1", impersonate_fn)
+    other = context.impersonate("root", "sa-2", impersonate_fn)
+
+    self.assertIs(first, second)
+    self.assertEqual(first.result(), "creds-sa-1")
+    self.assertEqual(other.result(), "creds-sa-2")
+    self.assertEqual(impersonate_fn.call_count, 2)
+
+  def test_attempts_run_in_parallel(self):
+    """Test that candidates are tried concurrently."""
+    context = models.SpiderContext([], impersonation_worker_count=2)
+    barrier = threading.Barrier(2, timeout=5)
+
+    attempts = [
+      context.impersonate("root", target, lambda _: barrier.wait())
+      for target in ("sa-1", "sa-2")
+    ]
+    for attempt in attempts:
+      self.assertIsNone(attempt.exception())
+
+  @patch("gcp_scanner.scanner.iam_client_for_credentials")
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.scanner.CrawlerFactory")
+  @patch("gcp_scanner.scanner.credsdb.impersonate_sa")
+  def test_impersonate_service_accounts(
+    self, mocked_impersonate_sa, mocked_crawler_factory, _, __
+  ):
+    """Test that edges are recorded only for successful attempts."""
+    mocked_crawler_factory.create_crawler.return_value.crawl.return_value = [
+      {"members": ["serviceAccount:good@test.iam.gserviceaccount.com",
+                   "serviceAccount:bad@test.iam.gserviceaccount.com",
+                   "user:someone@example.com"]},
+    ]
+    mocked_impersonate_sa.side_effect = (
+      lambda _, target, timeout: self._impersonate(target))
+    context = models.SpiderContext([], impersonation_worker_count=2)
+    sa_results = scanner.infinite_defaultdict()
+    scan_config = {"service_accounts": {"impersonate": True}}
+
+    for project_id in ("project-1", "project-2"):
+      scanner.impersonate_service_accounts(
+        context, {"projectId": project_id}, scan_config, sa_results, [],
+        "root", Mock())
+
+    for project_id in ("project-1", "project-2"):
+      self.assertEqual(
+        sa_results["projects"][project_id]["service_account_edges"],
+        ["good@test.iam.gserviceaccount.com"])
+    self.assertEqual(mocked_impersonate_sa.call_count, 2)
+    self.assertEqual(context.service_account_queue.qsize(), 1)
+
+  @staticmethod
+  def _impersonate(target):
+    if target.startswith("bad"):
+      raise PermissionError("denied")
+    return credentials.Credentials("token")
+
+
+class TestImpersonationCache(unittest.TestCase):
+  """Unit tests for the ImpersonationCache class."""
+
+  def test_success_and_failure(self):
+    """Test that results are returned until they expire."""
+    cache = ImpersonationCache(failure_ttl=60)
+    cache.record_success("root", "sa-1", "token", time.time() + 3600)
+    cache.record_success("root", "sa-2", "token", time.time() + 10)
+    cache.record_failure("root", "sa-3", "PermissionDenied")
+
+    self.assertEqual(cache.get("root", "sa-1")["token"], "token")
+    # the token is about to expire
+    self.assertIsNone(cache.get("root", "sa-2"))
+    self.assertEqual(cache.get("root", "sa-3")["status"], "failure")
+    self.assertIsNone(cache.get("other", "sa-1"))
+
+  def test_eviction(self):
+    """Test that least recently used entries are evicted."""
+    cache = ImpersonationCache(max_entries=2)
+    cache.record_failure("root", "sa-1", "NotFound")
+    cache.record_failure("root", "sa-2", "NotFound")
+    cache.get("root", "sa-1")
+    cache.record_failure("root", "sa-3", "NotFound")
+
+    self.assertIsNotNone(cache.get("root", "sa-1"))
+    self.assertIsNone(cache.get("root", "sa-2"))
+    self.assertIsNotNone(cache.get("root", "sa-3"))
+
+  def test_probe_by_default(self):
+    """Test that empty locations are probed again unless a TTL is set."""
+    cache = location_cache.LocationCache()
+    cache.record("p", "kms_keyrings", "us", False)
+    cache.record("p", "kms_keyrings", "eu", True)
+    self.assertEqual(cache.plan("p", "kms_keyrings", ["us", "eu"]),
+                     ["eu", "us"])
+
+  def test_persistence(self):
+    """Test that live entries survive a reload."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+      path = os.path.join(cache_dir, "impersonation.json")
+      cache = ImpersonationCache(path)
+      cache.record_success("root", "sa-1", "token", time.time() + 3600)
+      cache.record_failure("root", "sa-2", "NotFound")
+      cache.save()
+
+      reloaded = ImpersonationCache(path)
+      self.assertEqual(reloaded.get("root", "sa-1")["token"], "token")
+      self.assertEqual(reloaded.get("root", "sa-2")["reason"], "NotFound")
+
+  @patch("gcp_scanner.scanner.credsdb.impersonate_sa")
+  def test_attempt_impersonation_uses_cache(self, mocked_impersonate_sa):
+    """Test that cached outcomes skip generateAccessToken calls."""
+    mocked_impersonate_sa.side_effect = [
+      credentials.Credentials(
+        "token", expiry=datetime.datetime.utcnow() + datetime.timedelta(
+          hours=1)),
+      exceptions.PermissionDenied("denied"),
+    ]
+    context = models.SpiderContext([])
+
+    for _ in range(2):
+      creds = scanner.attempt_impersonation(
+        context, Mock(), "root", "sa-1", ["root"])
+      self.assertEqual(creds.token, "token")
+    with self.assertRaises(exceptions.PermissionDenied):
+      scanner.attempt_impersonation(context, Mock(), "root", "sa-2", ["root"])
+    with self.assertRaises(CachedImpersonationFailure):
+      scanner.attempt_impersonation(context, Mock(), "root", "sa-2", ["root"])
+
+    self.assertEqual(mocked_impersonate_sa.call_count, 2)
+    self.assertEqual(context.service_account_queue.qsize(), 2)
+
+
+class TestDelegatedImpersonation(unittest.TestCase):
+  """Unit tests for impersonation through delegate chains."""
+
+  def test_impersonate_sa_with_delegates(self):
+    """Test that delegates are passed as resource names."""
+    iam_client = Mock()
+    iam_client.generate_access_token.return_value = Mock(
+      access_token="token", expire_time=None)
+
+    creds = credsdb.impersonate_sa(
+      iam_client, "target@test.iam.gserviceaccount.com",
+      delegates=["hop@test.iam.gserviceaccount.com"])
+
+    self.assertEqual(creds.token, "token")
+    kwargs = iam_client.generate_access_token.call_args.kwargs
+    self.assertEqual(
+      kwargs["name"],
+      "projects/-/serviceAccounts/target@test.iam.gserviceaccount.com")
+    self.assertEqual(
+      kwargs["delegates"],
+      ["projects/-/serviceAccounts/hop@test.iam.gserviceaccount.com"])
+
+  def test_root_credentials(self):
+    """Test that the context resolves the root of a chain."""
+    root_creds = Mock()
+    context = models.SpiderContext([("root", root_creds, [])])
+    self.assertIs(context.get_root_credentials(["root", "hop"]), root_creds)
+    self.assertIsNone(context.get_root_credentials([]))
+    self.assertIsNone(context.get_root_credentials(["unknown"]))
+
+  @patch("gcp_scanner.scanner.credsdb.impersonate_sa")
+  def test_attempt_impersonation_prefers_delegates(self, mocked_impersonate_sa):
+    """Test that the chain root is used first and the hop as a fallback."""
+    hop_client, root_client = Mock(), Mock()
+    mocked_impersonate_sa.side_effect = [
+      exceptions.PermissionDenied("denied"),
+      credentials.Credentials("token"),
+      credentials.Credentials("token"),
+    ]
+    context = models.SpiderContext([])
+
+    scanner.attempt_impersonation(context, hop_client, "hop", "sa-1",
+                                  ["root", "hop"], root_client, ["hop"])
+    scanner.attempt_impersonation(context, hop_client, "hop", "sa-2",
+                                  ["root", "hop"], root_client, ["hop"])
+
+    calls = mocked_impersonate_sa.call_args_list
+    self.assertIs(calls[0].args[0], root_client)
+    self.assertEqual(calls[0].kwargs["delegates"], ["hop"])
+    self.assertIs(calls[1].args[0], hop_client)
+    self.assertIs(calls[2].args[0], root_client)
+
+  @patch("gcp_scanner.scanner.iam_credentials.IAMCredentialsClient")
+  def test_iam_client_per_credentials(self, mocked_client):
+    """Test that IAM Credentials clients are reused per credential."""
+    creds, other_creds = Mock(), Mock()
+    self.assertIs(scanner.iam_client_for_credentials(creds),
+                  scanner.iam_client_for_credentials(creds))
+    scanner.iam_client_for_credentials(other_creds)
+    self.assertEqual(mocked_client.call_count, 2)
+
+
+class TestCredentialManager(unittest.TestCase):
+  """Unit tests for credentials issued by the CredentialManager."""
+
+  def setUp(self):
+    self.manager = credential_manager.CredentialManager(
+      refresh_margin=datetime.timedelta(minutes=5))
+
+  def test_refresh_before_expiry(self):
+    """Test that tokens about to expire are minted again."""
+    new_expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    minter = Mock(return_value=("new-token", new_expiry))
+    creds = self.manager.issue(
+      "old-token",
+      datetime.datetime.utcnow() + datetime.timedelta(minutes=2),
+      ["scope"], "sa", minter)
+
+    self.assertFalse(creds.valid)
+    creds.before_request(Mock(), "GET", "https://example.com", {})
+
+    self.assertEqual(creds.token, "new-token")
+    self.assertEqual(creds.expiry, new_expiry)
+    self.assertTrue(creds.valid)
+    self.assertEqual(minter.call_count, 1)
+
+  def test_single_flight_refresh(self):
+    """Test that concurrent refreshes mint a single token."""
+    def mint():
+      time.sleep(0.05)
+      return "new-token", datetime.datetime.utcnow() + datetime.timedelta(
+        hours=1)
+    minter = Mock(side_effect=mint)
+    creds = self.manager.issue("old-token", datetime.datetime.utcnow(),
+                               ["scope"], "sa", minter)
+
+    with BoundedExecutor(4) as executor:
+      for _ in range(4):
+        executor.submit(creds.refresh, Mock())
+
+    self.assertEqual(minter.call_count, 1)
+    self.assertEqual(creds.token, "new-token")
+
+  def test_expired_token_without_minter(self):
+    """Test that tokens without a refresh path fail once expired."""
+    creds = self.manager.issue("token", datetime.datetime.utcnow(),
+                               ["scope"], "token-file")
+    with self.assertRaises(auth_exceptions.RefreshError):
+      creds.refresh(Mock())
+    self.assertEqual(self.manager.issued(), [creds])
+
+  def test_token_without_minter_used_until_expiry(self):
+    """Test that the refresh margin only applies to refreshable tokens."""
+    creds = self.manager.issue(
+      "token", datetime.datetime.utcnow() + datetime.timedelta(minutes=2),
+      ["scope"], "token-file")
+    self.assertTrue(creds.valid)
+    headers = dict()
+    creds.before_request(Mock(), "GET", "https://example.com", headers)
+    self.assertEqual(headers["authorization"], "Bearer token")
+
+  def test_creds_from_access_token_expiry(self):
+    """Test that the expiry of access token files is tracked."""
+    with tempfile.TemporaryDirectory() as token_dir:
+      path = os.path.join(token_dir, "token.json")
+      with open(path, "w", encoding="utf-8") as f:
+        json.dump({"access_token": "token",
+                   "expiry": "2030-01-01T01:00:00+01:00"}, f)
+      creds = credsdb.creds_from_access_token(path)
+
+    self.assertEqual(creds.token, "token")
+    self.assertEqual(creds.expiry, datetime.datetime(2030, 1, 1))
+    self.assertFalse(creds.refreshable)
+
+
+class TestSharding(unittest.TestCase):
+  """Unit tests for splitting scans into shards."""
+
+  def test_shards_partition_projects(self):
+    """Test that every project belongs to exactly one stable shard."""
+    project_ids = [f"project-{i}" for i in range(100)]
+    for project_id in project_ids:
+      shards = [i for i in range(4) if sharding.in_shard(project_id, i, 4)]
+      self.assertEqual(shards, [sharding.shard_of(project_id, 4)])
+    self.assertEqual(sharding.shard_of("project-1", 4), 1)
+    self.assertTrue(sharding.in_shard("project-1", 0, 1))
+
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.scanner.CrawlerFactory")
+  @patch("gcp_scanner.scanner.impersonate_service_accounts")
+  def test_discovery_queues_shard_projects(
+    self, mocked_impersonate, mocked_crawler_factory, _
+  ):
+    """Test that only projects of the shard are scanned."""
+    project_ids = [f"project-{i}" for i in range(10)]
+    mocked_crawler_factory.create_crawler.return_value.crawl.return_value = [
+      {"projectId": project_id} for project_id in project_ids
+    ]
+    project_queue = queue.Queue()
+    args = Mock(output="out", light_scan=False, target_project=None,
+                resource_worker_count=1, shard_index=1, shard_count=3)
+    context = models.SpiderContext([("sa", Mock(scopes=[]), [])])
+
+    scanner.discover_projects(context, args, None, "suffix", [],
+                              project_queue)
+
+    queued = list()
+    project_obj = project_queue.get()
+    while project_obj is not None:
+      queued.append(project_obj.project["projectId"])
+      project_obj = project_queue.get()
+    self.assertEqual(queued, [
+      project_id for project_id in project_ids
+      if sharding.shard_of(project_id, 3) == 1
+    ])
+    # impersonation still covers every project
+    self.assertEqual(mocked_impersonate.call_count, len(project_ids))
+
+  def test_merge_manifests(self):
+    """Test that shard manifests are merged into one."""
+    with tempfile.TemporaryDirectory() as out_dir:
+      sharding.write_manifest(out_dir, "suffix", 0, 3,
+                              {"project-a": "project-a-suffix.json"})
+      sharding.write_manifest(out_dir, "suffix", 2, 3,
+                              {"project-b": "project-b-suffix.json"})
+      manifest = sharding.merge_manifests(out_dir, "suffix", 3)
+
+      self.assertEqual(os.listdir(out_dir), ["manifest-suffix.json"])
+    self.assertEqual(manifest["missing_shards"], [1])
+    self.assertEqual(manifest["projects"], {
+      "project-a": "project-a-suffix.json",
+      "project-b": "project-b-suffix.json",
+    })
+
+  def test_shard_argv(self):
+    """Test that shard options of the parent are replaced."""
+    argv = ["-o", "out", "--processes", "4", "-m", "--shard-count=2"]
+    self.assertEqual(
+      sharding.shard_argv(argv, 1, 4, "suffix"),
+      ["-o", "out", "-m", "--processes", "1", "--shard-index", "1",
+       "--shard-count", "4", "--scan-time-suffix", "suffix"],
+    )
+
+  def test_shard_argv_abbreviated_processes(self):
+    """Test that shards never start shards of their own."""
+    with tempfile.TemporaryDirectory() as out_dir:
+      argv = sharding.shard_argv(["-o", out_dir, "--proc", "4", "-m"], 1, 4,
+                                 "suffix")
+      with patch.object(sys, "argv", ["gcp_scanner"] + argv):
+        args = arguments.arg_parser()
+    self.assertEqual(args.processes, 1)
+    self.assertEqual(args.shard_count, 4)
+
+  def test_processes_with_shard_count(self):
+    """Test that processes cannot split a shard of several machines."""
+    with tempfile.TemporaryDirectory() as out_dir:
+      argv = ["gcp_scanner", "-o", out_dir, "-m", "--processes", "2",
+              "--shard-count", "3"]
+      with patch.object(sys, "argv", argv), \
+          self.assertRaises(SystemExit) as raised, \
+          self.assertLogs(level="ERROR"):
+        arguments.arg_parser()
+    self.assertEqual(raised.exception.code, 4)
+
+
+class TestCoordinator(unittest.TestCase):
+  """Unit tests for distributing tasks between scan workers."""
+
+  def test_lease_and_complete(self):
+    """Test that tasks are leased in order and finished once."""
+    job_queue = coordinator.JobQueue()
+    first = job_queue.add("1:project", "kms", {"project_id": "project"})
+    job_queue.add("1:project", "bq", {"project_id": "project"})
+    job_queue.close()
+
+    task, finished = job_queue.lease("worker-1")
+    self.assertEqual(task["id"], first)
+    self.assertEqual(task["payload"], {"project_id": "project"})
+    self.assertFalse(finished)
+    self.assertTrue(job_queue.heartbeat(first, "worker-1"))
+    self.assertFalse(job_queue.heartbeat(first, "worker-2"))
+    self.assertTrue(job_queue.complete(first, "worker-1", ["key"]))
+    self.assertFalse(job_queue.complete(first, "worker-2", ["other"]))
+    self.assertFalse(job_queue.project_finished("1:project"))
+
+    task, _ = job_queue.lease("worker-2")
+    self.assertTrue(job_queue.complete(task["id"], "worker-2", {}))
+    self.assertTrue(job_queue.project_finished("1:project"))
+    self.assertEqual(job_queue.results("1:project"), {"kms": ["key"], "bq": {}})
+    self.assertEqual(job_queue.lease("worker-1"), (None, True))
+
+  def test_expired_lease_is_requeued(self):
+    """Test that tasks of stalled workers are handed to other workers."""
+    job_queue = coordinator.JobQueue(lease_seconds=0.01, max_attempts=2)
+    task_id = job_queue.add("1:project", "kms", {})
+
+    job_queue.lease("slow-worker")
+    time.sleep(0.02)
+    task, _ = job_queue.lease("fast-worker")
+    self.assertEqual(task["id"], task_id)
+    self.assertFalse(job_queue.fail(task_id, "slow-worker", "error"))
+
+    time.sleep(0.02)
+    self.assertEqual(job_queue.requeue_expired(), 1)
+    self.assertEqual(job_queue.counts(), {coordinator.FAILED: 1})
+    self.assertEqual(job_queue.results("1:project"), {})
+
+  def test_failed_task_is_retried(self):
+    """Test that failed tasks are retried up to max_attempts times."""
+    job_queue = coordinator.JobQueue(max_attempts=2)
+    task_id = job_queue.add("1:project", "kms", {})
+    for _ in range(2):
+      task, _ = job_queue.lease("worker")
+      self.assertEqual(task["id"], task_id)
+      self.assertTrue(job_queue.fail(task_id, "worker", "error"))
+    self.assertEqual(job_queue.counts(), {coordinator.FAILED: 1})
+
+  @patch("gcp_scanner.scanner.crawl_resource")
+  def test_scan_with_workers(self, mocked_crawl_resource):
+    """Test a scan split between workers over a localhost coordinator."""
+    mocked_crawl_resource.side_effect = (
+      lambda crawler_name, project_id, *args: {"crawler": crawler_name})
+    scan_config = {
+      "kms": {"fetch": True},
+      "bq": {"fetch": True},
+      "compute_instances": {"fetch": False},
+    }
+    sa_results = scanner.infinite_defaultdict()
+    sa_results["service_account_chain"] = []
+    sa_results["current_service_account"] = "sa"
+    sa_results["token_scopes"] = []
+    sa_results["projects"]["project"]["service_account_edges"] = ["edge"]
+    root_credentials = {"sa": Mock()}
+
+    with tempfile.TemporaryDirectory() as out_dir:
+      project_obj = models.ProjectInfo(
+        {"projectId": "project"}, sa_results, out_dir, scan_config, False,
+        None, "suffix", "sa", root_credentials["sa"], [], 1)
+      project_obj.impersonation_done.set()
+      project_queue = queue.Queue()
+      project_queue.put(project_obj)
+      project_queue.put(None)
+
+      job_queue = coordinator.JobQueue()
+      server = coordinator.CoordinatorServer(("localhost", 0), job_queue)
+      server.start()
+      try:
+        workers = list()
+        for worker in ("worker-1", "worker-2"):
+          client = coordinator.CoordinatorClient(server.url, worker)
+          thread = threading.Thread(
+            target=scanner.run_worker,
+            args=(client, root_credentials, out_dir, 2),
+            kwargs={"poll_interval": 0.01},
+          )
+          thread.start()
+          workers.append(thread)
+        output_files = scanner.coordinate_projects(project_queue, job_queue,
+                                                   poll_interval=0.01)
+        for thread in workers:
+          thread.join()
+      finally:
+        server.shutdown()
+        server.server_close()
+
+      self.assertEqual(output_files, {"project": "project-suffix.json"})
+      with open(os.path.join(out_dir, "project-suffix.json"),
+                encoding="utf-8") as f:
+        result = json.load(f)
+
+    self.assertEqual(result["kms"], {"crawler": "kms"})
+    self.assertEqual(result["bq"], {"crawler": "bq"})
+    self.assertNotIn("compute_instances", result)
+    self.assertEqual(result["service_account_edges"], ["edge"])
+    self.assertEqual(mocked_crawl_resource.call_count, 2)
+    # workers only get the config section of their crawler
+    self.assertCountEqual(
+      [call[0][3] for call in mocked_crawl_resource.call_args_list],
+      [{"kms": {"fetch": True}}, {"bq": {"fetch": True}}],
+    )
+
+
+class TestAsyncEngine(unittest.TestCase):
+  """Unit tests for the asyncio crawl engine."""
+
+  def _compute_service(self):
+    service = Mock()
+    request = service.disks.return_value.aggregatedList.return_value
+    request.execute.return_value = {
+      "items": {"zones/a": {"disks": [{"name": "disk"}]}},
+    }
+    service.disks.return_value.aggregatedList_next.return_value = None
+    return service
+
+  def test_async_crawler_in_threaded_engine(self):
+    """Test that async crawlers still implement the synchronous crawl()."""
+    crawler = CrawlerFactory.create_crawler("compute_disks")
+    self.assertIsInstance(crawler, IAsyncCrawler)
+    self.assertEqual(crawler.crawl("project", self._compute_service()),
+                     [{"name": "disk"}])
+
+  @patch("gcp_scanner.scanner.crawl_resource")
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.async_engine.aiohttp", None)
+  def test_crawl_projects(self, mocked_client_factory, mocked_crawl_resource):
+    """Test that async and synchronous crawlers run side by side."""
+    mocked_client_factory.get_client.return_value.get_service.return_value = (
+      self._compute_service())
+    mocked_crawl_resource.return_value = [{"name": "key"}]
+    scan_config = {"compute_disks": {"fetch": True}, "kms": {"fetch": True}}
+    sa_results = scanner.infinite_defaultdict()
+    sa_results["service_account_chain"] = []
+    sa_results["current_service_account"] = "sa"
+    sa_results["token_scopes"] = []
+
+    with tempfile.TemporaryDirectory() as out_dir:
+      project_queue = queue.Queue()
+      for project_id in ("project-1", "project-2"):
+        project_obj = models.ProjectInfo(
+          {"projectId": project_id}, sa_results, out_dir, scan_config, False,
+          None, "suffix", "sa", Mock(), [], 1)
+        project_obj.impersonation_done.set()
+        project_queue.put(project_obj)
+      project_queue.put(None)
+
+      output_files = async_engine.AsyncEngine(2, 2).run(project_queue)
+
+      self.assertEqual(output_files, {
+        "project-1": "project-1-suffix.json",
+        "project-2": "project-2-suffix.json",
+      })
+      with open(os.path.join(out_dir, "project-2-suffix.json"),
+                encoding="utf-8") as f:
+        result = json.load(f)
+
+    self.assertEqual(result["compute_disks"], [{"name": "disk"}])
+    self.assertEqual(result["kms"], [{"name": "key"}])
+    # only the synchronous crawler goes through the adapter
+    self.assertEqual(mocked_crawl_resource.call_count, 2)
+    self.assertEqual(mocked_crawl_resource.call_args[0][0], "kms")
+
+  def test_async_request_budget(self):
+    """Test that both engines share the limits of the scan's budget."""
+    budget = request_budget.RequestBudget(max_inflight_per_api=2)
+    lock = threading.Lock()
+    inflight = list()
+    peak = list()
+
+    def start():
+      with lock:
+        inflight.append(1)
+        peak.append(len(inflight))
+
+    def finish():
+      with lock:
+        inflight.pop()
+
+    def thread_request():
+      with budget.slot("compute"):
+        start()
+        time.sleep(0.01)
+        finish()
+
+    async def request(async_budget):
+      async with async_budget.slot("compute"):
+        start()
+        await asyncio.sleep(0.01)
+        finish()
+
+    async def main():
+      async_budget = async_engine.AsyncRequestBudget(budget)
+      await asyncio.gather(*[request(async_budget) for _ in range(6)])
+
+    with BoundedExecutor(3) as executor:
+      for _ in range(6):
+        executor.submit(thread_request)
+      asyncio.run(main())
+    self.assertEqual(max(peak), 2)
+
+
+class TestDiscoveryDocumentCache(unittest.TestCase):
+  """Unit tests for the discovery document cache."""
+
+  def test_documents_are_parsed_once(self):
+    """Test that bundled documents are loaded once per API."""
+    cache = DiscoveryDocumentCache()
+    with patch("gcp_scanner.client.discovery_documents.discovery_cache."
+               "get_static_doc", wraps=discovery_cache.get_static_doc) as doc:
+      document = cache.get("dns", "v1")
+      self.assertIs(cache.get("dns", "v1"), document)
+    doc.assert_called_once_with("dns", "v1")
+    self.assertEqual(document["name"], "dns")
+
+  @patch("gcp_scanner.client.discovery_documents.requests.get")
+  def test_live_documents_are_cached_on_disk(self, mocked_get):
+    """Test that downloaded documents are reused until they expire."""
+    mocked_get.return_value.text = discovery_cache.get_static_doc("dns", "v1")
+    with tempfile.TemporaryDirectory() as cache_dir:
+      DiscoveryDocumentCache(cache_dir, prefer_live=True).get("dns", "v1")
+      self.assertTrue(
+        os.path.exists(os.path.join(cache_dir, "discovery", "dns.v1.json")))
+      DiscoveryDocumentCache(cache_dir, prefer_live=True).get("dns", "v1")
+      self.assertEqual(mocked_get.call_count, 1)
+
+      DiscoveryDocumentCache(cache_dir, ttl=-1, prefer_live=True).get(
+        "dns", "v1")
+      self.assertEqual(mocked_get.call_count, 2)
+
+  @patch("gcp_scanner.client.discovery_documents.requests.get")
+  def test_live_documents_fall_back_to_bundled(self, mocked_get):
+    """Test that scans work offline."""
+    mocked_get.side_effect = requests.exceptions.ConnectionError()
+    document = DiscoveryDocumentCache(prefer_live=True).get("dns", "v1")
+    self.assertEqual(document["name"], "dns")
+
+  def test_services_share_documents(self):
+    """Test that services built from a cached document work."""
+    cache = DiscoveryDocumentCache()
+    with patch("gcp_scanner.client.discovery_documents._cache", cache):
+      for _ in range(2):
+        service = ComputeClient().get_service(
+          auth_credentials.AnonymousCredentials())
+        request = service.instances().aggregatedList(project="project")
+        self.assertEqual(
+          request.uri,
+          "https://compute.googleapis.com/compute/v1/projects/project/"
+          "aggregated/instances?alt=json",
+        )
+        self.assertIsInstance(request, ScannerHttpRequest)
+
+
+class TestServicePool(unittest.TestCase):
+  """Unit tests for the pool of discovery services."""
+
+  def setUp(self):
+    self.build_fn = Mock(side_effect=lambda *args: Mock())
+    self.pool = ServicePool(self.build_fn)
+    self.credentials = Mock()
+    self.pool.retain(self.credentials)
+
+  def test_services_are_reused(self):
+    """Test that a service is built once per credentials and client."""
+    with self.pool.lease("compute", self.credentials) as first:
+      pass
+    with self.pool.lease("compute", self.credentials) as second:
+      pass
+    with self.pool.lease("storage", self.credentials):
+      pass
+    self.assertIs(first, second)
+    self.assertEqual(self.build_fn.call_count, 2)
+    self.assertEqual((self.pool.builds, self.pool.reuses), (2, 1))
+
+  def test_leased_services_are_not_shared(self):
+    """Test that a service is used by a single thread at a time."""
+    with self.pool.lease("compute", self.credentials) as first:
+      with self.pool.lease("compute", self.credentials) as second:
+        self.assertIsNot(first, second)
+    with self.pool.lease("compute", self.credentials):
+      with self.pool.lease("compute", self.credentials):
+        pass
+    self.assertEqual(self.build_fn.call_count, 2)
+
+  def test_released_credentials_are_dropped(self):
+    """Test that services are dropped once the credentials are done."""
+    self.pool.retain(self.credentials)
+    with self.pool.lease("compute", self.credentials):
+      pass
+    self.pool.release(self.credentials)
+    with self.pool.lease("compute", self.credentials):
+      pass
+    self.assertEqual(self.build_fn.call_count, 1)
+
+    self.pool.release(self.credentials)
+    with self.pool.lease("compute", self.credentials):
+      pass
+    with self.pool.lease("compute", self.credentials):
+      pass
+    self.assertEqual(self.build_fn.call_count, 3)
+
+
+class _KeepAliveHandler(server.BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    body = b"{}"
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):  # pylint: disable=arguments-differ
+    pass
+
+
+class TestTransport(unittest.TestCase):
+  """Unit tests for the pooled HTTP transports."""
+
+  def setUp(self):
+    self.server = server.ThreadingHTTPServer(("localhost", 0),
+                                             _KeepAliveHandler)
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    host, port = self.server.server_address[:2]
+    self.host = f"{host}:{port}"
+    self.url = f"http://{self.host}/"
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def test_http_pool_reuses_connections(self):
+    """Test that requests of all clients share keep-alive connections."""
+    pool = transport.HttpPool(max_size=2)
+    for _ in range(3):
+      response, content = pool.request(self.url)
+      self.assertEqual((response.status, content), (200, b"{}"))
+    self.assertEqual(pool.stats.new, {self.host: 1})
+    self.assertEqual(pool.stats.reused, {self.host: 2})
+    pool.close()
+
+  def test_http_pool_does_not_block(self):
+    """Test that busy transports never delay requests."""
+    pool = transport.HttpPool(max_size=2)
+    barrier = threading.Barrier(4, timeout=10)
+    transports = list()
+
+    def new_http():
+      http = Mock()
+      http.request.side_effect = lambda *args, **kwargs: barrier.wait()
+      transports.append(http)
+      return http
+
+    with patch.object(pool, "_new_http", new_http):
+      with BoundedExecutor(4) as executor:
+        futures = [executor.submit(pool.request, self.url) for _ in range(4)]
+      for future in futures:
+        future.result()
+    self.assertEqual(len(transports), 4)
+    # only max_size idle transports are kept
+    self.assertEqual(sum(http.close.called for http in transports), 2)
+
+  def test_http_pool_of_scan(self):
+    """Test that clients built during a scan use the pool of its context."""
+    pool = transport.HttpPool(max_size=2)
+    with models.SpiderContext([], http_pool=pool).activate():
+      service = discovery_documents.build_service(
+          "compute", "v1", auth_credentials.AnonymousCredentials())
+    self.assertIs(service._http.http, pool)  # pylint: disable=protected-access
+    self.assertIsNot(transport.http_pool(), pool)
+
+  def test_bounded_sessions(self):
+    """Test that idle sessions are reused and extra ones are closed."""
+    pool = transport.SessionPool(max_size=1)
+    with pool.session() as session:
+      for _ in range(3):
+        self.assertEqual(session.get(self.url, timeout=10).json(), {})
+      with pool.session() as other:
+        self.assertIsNot(other, session)
+        other.get(self.url, timeout=10)
+    with pool.session() as reused:
+      self.assertIs(reused, other)
+    with self.assertLogs(level="INFO") as logs:
+      pool.log_report()
+    self.assertIn("4 requests over 2 new connections", logs.output[0])
+
+
+def _batch_response(parts):
+  """Returns an HttpMockSequence entry with a multipart batch response."""
+
+  body = ""
+  for request_id, status, content in parts:
+    body += (
+        "--batch_boundary\r\n"
+        "Content-Type: application/http\r\n"
+        "Content-Transfer-Encoding: binary\r\n"
+        f"Content-ID: <response-batch + {request_id}>\r\n\r\n"
+        f"HTTP/1.1 {status} Status\r\n"
+        "Content-Type: application/json\r\n\r\n"
+        f"{json.dumps(content)}\r\n"
+    )
+  body += "--batch_boundary--"
+  return ({"status": "200",
+           "content-type": "multipart/mixed; boundary=batch_boundary"}, body)
+
+
+class TestBatch(unittest.TestCase):
+  """Unit tests for batched execution of fan-out calls."""
+
+  def _service(self, responses):
+    document = discovery_cache.get_static_doc("bigquery", "v2")
+    return discovery.build_from_document(
+        document,
+        http=googleapiclient_http.HttpMockSequence(responses),
+        requestBuilder=ScannerHttpRequest,
+    )
+
+  def _requests(self, service, dataset_ids):
+    return {
+        dataset_id: service.tables().list(projectId="p",
+                                          datasetId=dataset_id)
+        for dataset_id in dataset_ids
+    }
+
+  def test_pages_and_failures(self):
+    """Test that follow-up pages are fetched and failures stay per call."""
+    service = self._service([
+        _batch_response([
+            (0, 200, {"tables": [{"id": "a1"}], "nextPageToken": "t"}),
+            (1, 403, {"error": {"code": 403, "message": "denied"}}),
+            (2, 200, {"tables": [{"id": "c1"}]}),
+        ]),
+        ({"status": "200"}, json.dumps({"tables": [{"id": "a2"}]})),
+    ])
+    responses, failed = batch.execute_batched(
+        service,
+        self._requests(service, ["a", "b", "c"]),
+        next_request=service.tables().list_next,
+    )
+    self.assertEqual(
+        [t["id"] for page in responses["a"] for t in page["tables"]],
+        ["a1", "a2"],
+    )
+    self.assertEqual(responses["b"], [])
+    self.assertEqual(list(failed), ["b"])
+    self.assertEqual(failed["b"].resp.status, 403)
+    self.assertEqual(len(responses["c"]), 1)
+
+  def test_batch_size(self):
+    """Test that calls are split into batches of batch_size."""
+    service = self._service([
+        _batch_response([(0, 200, {}), (1, 200, {})]),
+        _batch_response([(0, 200, {}), (1, 200, {})]),
+        ({"status": "200"}, "{}"),
+    ])
+    responses, failed = batch.execute_batched(
+        service,
+        self._requests(service, ["a", "b", "c", "d", "e"]),
+        batch_size=2,
+    )
+    self.assertEqual(failed, {})
+    self.assertEqual([len(pages) for pages in responses.values()],
+                     [1, 1, 1, 1, 1])
+
+  def test_budget_and_negative_cache(self):
+    """Test that batched calls go through the budget and the cache."""
+    service = self._service([
+        _batch_response([(0, 200, {}), (1, 200, {})]),
+    ])
+    with patch.object(batch.request_budget, "slot") as slot:
+      _, failed = batch.execute_batched(service,
+                                        self._requests(service, ["a", "b"]))
+    self.assertEqual(failed, {})
+    slot.assert_called_once_with("bigquery", 2)
+
+    with negative_cache.NegativeCache().activate(), \
+        negative_cache.scope("creds", "p"):
+      negative_cache.record(
+          "bigquery", _forbidden("PERMISSION_DENIED", "SERVICE_DISABLED"))
+      # the mocked transport has no responses left
+      _, failed = batch.execute_batched(service,
+                                        self._requests(service, ["a", "b"]))
+    self.assertEqual(list(failed), ["a", "b"])
+    self.assertEqual(failed["a"].resp.status, 403)
+
+  def test_failed_batch_falls_back(self):
+    """Test that calls of a failed batch are executed one by one."""
+    service = self._service([
+        ({"status": "500"}, "{}"),
+        ({"status": "200"}, json.dumps({"tables": [{"id": "a1"}]})),
+        ({"status": "404"}, "{}"),
+    ])
+    responses, failed = batch.execute_batched(
+        service, self._requests(service, ["a", "b"])
+    )
+    self.assertEqual(responses["a"], [{"tables": [{"id": "a1"}]}])
+    self.assertEqual(list(failed), ["b"])
+
+
+class TestLightScan(unittest.TestCase):
+  """Unit tests for the fields masks of light scans."""
+
+  def test_light_scan_fields(self):
+    """Test that light scan schemas compile to fields masks."""
+    self.assertEqual(
+        scanner.light_scan_fields("compute_images"),
+        "nextPageToken,items(name,status,diskSizeGb,sourceDisk)",
+    )
+    self.assertEqual(
+        scanner.light_scan_fields("services"),
+        "nextPageToken,services(name)",
+    )
+    self.assertTrue(
+        scanner.light_scan_fields("compute_instances").startswith(
+            "nextPageToken,items/*/instances(name,zone,"))
+    self.assertIsNone(scanner.light_scan_fields("storage_buckets"))
+    self.assertEqual(set(scanner.LIGHT_SCAN_ITEMS_PATHS),
+                     set(scanner.LIGHT_VERSION_SCAN_SCHEMA))
+
+  def test_crawler_config(self):
+    """Test that only light scans request partial responses."""
+    config = scanner.crawler_config_for("kms", None, "out", light_scan=True)
+    self.assertEqual(config["fields"], scanner.light_scan_fields("kms"))
+    self.assertNotIn("fields",
+                     scanner.crawler_config_for("kms", None, "out"))
+    self.assertNotIn(
+        "fields",
+        scanner.crawler_config_for("storage_buckets", None, "out",
+                                   light_scan=True),
+    )
+
+  def test_crawler_requests_fields(self):
+    """Test that crawlers pass the fields mask to their list requests."""
+    service = Mock()
+    service.images().list().execute.return_value = {"items": [{"name": "i"}]}
+    service.images().list_next.return_value = None
+    crawler = ComputeImagesCrawler()
+    self.assertTrue(crawler.has_config_dependency)
+    config = {"fields": "nextPageToken,items(name)"}
+    self.assertEqual(scanner.get_crawl(crawler, "p", service, config),
+                     [{"name": "i"}])
+    service.images().list.assert_called_with(
+        project="p", fields="nextPageToken,items(name)")
+
+  def test_save_light_results(self):
+    """Test that light scans keep only the schema fields of results."""
+    project_result = {
+        "project_info": {"projectId": "p"},
+        "compute_images": [{"name": "i", "status": "READY", "labels": {}}],
+    }
+    with tempfile.TemporaryDirectory() as out_dir:
+      path = os.path.join(out_dir, "p.json")
+      scanner.save_results(project_result, path, is_light=True)
+      with open(path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    self.assertEqual(saved["project_info"], {"projectId": "p"})
+    self.assertEqual(saved["compute_images"], [
+        {"name": "i", "status": "READY", "diskSizeGb": None,
+         "sourceDisk": None},
+    ])
+
+
+class TestListOptions(unittest.TestCase):
+  """Unit tests for the list options of the scan config sections."""
+
+  def test_list_methods_exist(self):
+    """Test that declared list methods are in the discovery documents."""
+    for name, crawler_cls in crawler_factory.service_crawler_map.items():
+      crawler = crawler_cls()
+      if crawler._list_method is None:  # pylint: disable=protected-access
+        continue
+      self.assertIn("fields", crawler.list_parameters(), name)
+      self.assertTrue(crawler.has_config_dependency, name)
+
+  def test_list_kwargs(self):
+    """Test that options map to the parameters of the API."""
+    dns_crawler = CrawlerFactory.create_crawler("dns_policies")
+    self.assertEqual(dns_crawler.page_size_param(), "maxResults")
+    self.assertEqual(dns_crawler._list_kwargs(None, maxResults=500),  # pylint: disable=protected-access
+                     {"maxResults": 500})
+    self.assertEqual(
+        dns_crawler._list_kwargs({"page_size": 20}, maxResults=500),  # pylint: disable=protected-access
+        {"maxResults": 20},
+    )
+    services_crawler = CrawlerFactory.create_crawler("services")
+    self.assertEqual(
+        services_crawler._list_kwargs(  # pylint: disable=protected-access
+            {"page_size": 50, "filter": "state:DISABLED", "fields": "f"},
+            pageSize=200, filter="state:ENABLED"),
+        {"pageSize": 50, "filter": "state:DISABLED",
+         "fields": "f,nextPageToken"},
+    )
+
+  def test_fields_keep_pagination(self):
+    """Test that a fields mask never drops the token of the next page."""
+    kms_crawler = CrawlerFactory.create_crawler("kms")
+    for fields, expected in (
+        ("cryptoKeys(name)", "cryptoKeys(name),nextPageToken"),
+        ("nextPageToken,cryptoKeys(name)", "nextPageToken,cryptoKeys(name)"),
+        ("*", "*"),
+    ):
+      self.assertEqual(
+          kms_crawler._list_kwargs({"fields": fields}),  # pylint: disable=protected-access
+          {"fields": expected})
+    # a nested nextPageToken does not paginate the request
+    self.assertEqual(
+        kms_crawler._list_kwargs(  # pylint: disable=protected-access
+            {"fields": "cryptoKeys(name,nextPageToken)"}),
+        {"fields": "cryptoKeys(name,nextPageToken),nextPageToken"})
+
+  def test_validate_scan_config(self):
+    """Test that unsupported list options are reported."""
+    self.assertEqual(scanner.validate_scan_config(None), [])
+    self.assertEqual(scanner.validate_scan_config({
+        "compute_instances": {"fetch": True, "page_size": 500,
+                              "filter": "status = RUNNING"},
+        "kms": {"fetch": True, "fields": "cryptoKeys(name)"},
+        "iam_policy": {"fetch": True},
+    }), [])
+
+    errors = scanner.validate_scan_config({
+        "compute_images": {"fetch": True, "page_size": 0},
+        "storage_buckets": {"fetch": True, "filter": "name:x"},
+        "iam_policy": {"fetch": True, "page_size": 10},
+        "gke_images": {"fetch": True, "filter": "x"},
+        "bigtable_instances": {"fetch": True, "page_size": 10},
+    })
+    self.assertEqual(len(errors), 5)
+    self.assertTrue(errors[0].startswith("compute_images: page_size"))
+    self.assertTrue(errors[1].startswith("storage_buckets: filter"))
+    self.assertTrue(errors[2].startswith("iam_policy"))
+    self.assertTrue(errors[3].startswith("gke_images"))
+    self.assertTrue(errors[4].startswith("bigtable_instances: page_size"))
+
+  def test_light_scan_keeps_config_fields(self):
+    """Test that fields of the scan config win over light scan masks."""
+    config = scanner.crawler_config_for(
+        "kms", {"kms": {"fields": "cryptoKeys(name)"}}, "out",
+        light_scan=True)
+    self.assertEqual(config["fields"], "cryptoKeys(name)")
+
+
+class TestLazyImport(unittest.TestCase):
+  """Unit tests for the deferred imports of crawlers and clients."""
+
+  def test_registry_imports_on_lookup(self):
+    """Test that registry entries are imported when first looked up."""
+    sys_modules = sys.modules
+    sys_modules.pop("colorsys", None)
+    registry = lazy_import.LazyRegistry({"hsv": "colorsys:rgb_to_hsv"})
+    self.assertIn("hsv", registry)
+    self.assertEqual(list(registry), ["hsv"])
+    self.assertNotIn("colorsys", sys_modules)
+    self.assertEqual(registry["hsv"](0, 0, 0), (0, 0, 0))
+    self.assertIn("colorsys", sys_modules)
+    with self.assertRaises(KeyError):
+      registry["rgb"]  # pylint: disable=pointless-statement
+    self.assertIsNone(registry.get("rgb"))
+
+  def test_factories(self):
+    """Test that factories resolve crawlers and clients lazily."""
+    self.assertIsInstance(ClientFactory.get_client("cloudbilling"),
+                          CloudBillingClient)
+    self.assertIsInstance(CrawlerFactory.create_crawler("bq"),
+                          BigQueryCrawler)
+    self.assertEqual(len(crawler_factory.service_crawler_map), 32)
+    self.assertIsNone(CrawlerFactory.create_crawler("unknown"))
+
+  def test_lazy_module(self):
+    """Test that lazy modules forward attribute access to the module."""
+    module = lazy_import.LazyModule("json")
+    self.assertIs(module.dumps, json.dumps)
+    with patch("json.dumps") as dumps:
+      self.assertIs(module.dumps, dumps)
+    with patch.object(module, "loads") as loads:
+      self.assertIs(json.loads, loads)
+    self.assertIsNot(json.loads, loads)
+
+  def test_report(self):
+    """Test that the startup profile lists events and deferred imports."""
+    lazy_import.mark("test event")
+    lazy_import.mark("test event")
+    lazy_import.timed_import("colorsys")
+    out = io.StringIO()
+    lazy_import.report(out)
+    self.assertEqual(out.getvalue().count("test event"), 1)
+    self.assertIn("Deferred imports", out.getvalue())
+
+
+class _FakePageRequest:
+  """A paginated request returning pages from a list."""
+
+  def __init__(self, pages, index=0, fetched=None):
+    self.pages = pages
+    self.index = index
+    self.fetched = fetched if fetched is not None else threading.Event()
+
+  def execute(self):
+    page = self.pages[self.index]
+    if isinstance(page, Exception):
+      raise page
+    if self.index > 0:
+      self.fetched.set()
+    return page
+
+  @staticmethod
+  def list_next(previous_request, previous_response):
+    if "nextPageToken" not in previous_response:
+      return None
+    return _FakePageRequest(previous_request.pages,
+                            previous_request.index + 1,
+                            previous_request.fetched)
+
+
+class TestPagination(unittest.TestCase):
+  """Unit tests for the prefetching pagination helpers."""
+
+  def test_pages_in_order(self):
+    """Test that all pages are yielded in order."""
+    pages = [{"items": [1], "nextPageToken": "a"},
+             {"items": [2], "nextPageToken": "b"},
+             {"items": [3]}]
+    request = _FakePageRequest(pages)
+    self.assertEqual(
+        list(pagination.paginate(request, _FakePageRequest.list_next)), pages)
+    self.assertEqual(
+        list(pagination.paginate(request, _FakePageRequest.list_next,
+                                 prefetch=False)), pages)
+
+  def test_next_page_is_prefetched(self):
+    """Test that the next page downloads while a page is processed."""
+    request = _FakePageRequest([{"nextPageToken": "a"}, {}])
+    pages = pagination.paginate(request, _FakePageRequest.list_next)
+    next(pages)
+    # the consumer has not asked for the second page yet
+    self.assertTrue(request.fetched.wait(10))
+    self.assertEqual(list(pages), [{}])
+
+  def test_pages_prefetched_by_scan_executor(self):
+    """Test that pages are fetched on the request executor of the scan."""
+    request = _FakePageRequest([{"nextPageToken": "a"}, {}])
+    executor = BoundedExecutor(2, "test-request")
+    with models.SpiderContext([], request_executor=executor).activate(), \
+        patch.object(executor, "submit", wraps=executor.submit) as submit:
+      self.assertEqual(
+          len(list(pagination.paginate(request, _FakePageRequest.list_next))),
+          2)
+    submit.assert_called_once()
+
+  def test_errors_of_later_pages(self):
+    """Test that errors of prefetched pages reach the caller."""
+    request = _FakePageRequest([{"nextPageToken": "a"}, ValueError("boom")])
+    pages = pagination.paginate(request, _FakePageRequest.list_next)
+    self.assertEqual(next(pages), {"nextPageToken": "a"})
+    with self.assertRaises(ValueError):
+      next(pages)
+
+  def test_paginate_async(self):
+    """Test that the asyncio helper yields all pages in order."""
+    pages = [{"items": [1], "nextPageToken": "a"}, {"items": [2]}]
+
+    class Transport:
+      async def execute(self, request):
+        return request.execute()
+
+    async def collect():
+      return [
+          page async for page in pagination.paginate_async(
+              _FakePageRequest(pages), _FakePageRequest.list_next,
+              Transport())
+      ]
+
+    self.assertEqual(asyncio.run(collect()), pages)
+
+  def test_async_crawler_prefetches_in_threads(self):
+    """Test that async crawlers fetch the next page during processing."""
+
+    class PageCrawler(IAsyncCrawler):
+      async def crawl_async(self, project_name, service, transport,
+                            config=None):
+        prefetched = list()
+        async for page in pagination.paginate_async(
+            service, _FakePageRequest.list_next, transport):
+          # the crawler thread is busy until the next page arrives
+          prefetched.append(page.get("nextPageToken") is None
+                            or service.fetched.wait(5))
+        return prefetched
+
+    request = _FakePageRequest([{"nextPageToken": "a"}, {}])
+    crawler = PageCrawler()
+    self.assertEqual(crawler.crawl("project", request), [True, True])
+    # the event loop of the thread is reused
+    self.assertEqual(crawler.crawl("project", _FakePageRequest([{}])),
+                     [True])
+
+
+def _http_error(status, reason=""):
+  content = json.dumps({"error": {"errors": [{"reason": reason}]}})
+  return googleapiclient_errors.HttpError(
+      httplib2.Response({"status": status}), content.encode("utf-8"))
+
+
+class TestRetry(unittest.TestCase):
+  """Test the retry policy of API requests."""
+
+  def test_is_retryable(self):
+    """Test that transient errors are retried and others fail fast."""
+    self.assertTrue(retry.is_retryable(_http_error(429)))
+    self.assertTrue(retry.is_retryable(_http_error(503)))
+    self.assertTrue(retry.is_retryable(_http_error(403, "rateLimitExceeded")))
+    self.assertTrue(retry.is_retryable(ConnectionResetError()))
+    self.assertFalse(retry.is_retryable(_http_error(403, "forbidden")))
+    self.assertFalse(retry.is_retryable(_http_error(404)))
+    self.assertFalse(retry.is_retryable(ValueError()))
+
+  def test_attempts_and_report(self):
+    """Test that retries stop after max_attempts and are reported."""
+    out = io.StringIO()
+    policy = retry.RetryPolicy(3, 0, report=retry.ErrorReport(out))
+    uri = "https://compute.googleapis.com/p?pageToken=secret"
+    delays = [
+        policy.on_error("compute", "compute.instances.list", uri,
+                        _http_error(503), attempt)
+        for attempt in (1, 2, 3)
+    ]
+    self.assertIsNotNone(delays[0])
+    self.assertLessEqual(delays[1], 2)
+    self.assertIsNone(delays[2])
+    entries = [json.loads(line) for line in out.getvalue().splitlines()]
+    self.assertEqual([entry["action"] for entry in entries],
+                     [retry.RETRY, retry.RETRY, retry.GIVE_UP])
+    self.assertEqual(entries[0]["status"], 503)
+    self.assertEqual(entries[0]["uri"], "https://compute.googleapis.com/p")
+
+  def test_budget_per_api(self):
+    """Test that an API stops retrying once its budget is used."""
+    policy = retry.RetryPolicy(5, 1)
+    self.assertIsNotNone(policy.on_error("dns", "", "", _http_error(500), 1))
+    self.assertIsNone(policy.on_error("dns", "", "", _http_error(500), 1))
+    self.assertIsNotNone(policy.on_error("pubsub", "", "", _http_error(500),
+                                         1))
+
+  def test_execute_retries(self):
+    """Test that execute() retries transient errors only."""
+    service = discovery.build(
+        "compute", "v1",
+        http=googleapiclient_http.HttpMockSequence([
+            ({"status": "503"}, "{}"),
+            ({"status": "200"}, '{"items": []}'),
+            ({"status": "404"}, "{}"),
+        ]),
+        requestBuilder=ScannerHttpRequest,
+        static_discovery=True,
+    )
+    with retry.RetryPolicy(3, 0, base_delay=0).activate():
+      request = service.instances().list(project="p", zone="z")
+      self.assertEqual(request.execute(), {"items": []})
+      with self.assertRaises(googleapiclient_errors.HttpError):
+        service.instances().list(project="p", zone="z").execute()
+      self.assertEqual(
+          retry.policy().report.counts,
+          {("compute", retry.RETRY): 1, ("compute", retry.GIVE_UP): 1})
+
+
+def _forbidden(status, reason):
+  content = json.dumps({"error": {
+      "code": 403, "status": status, "details": [{"reason": reason}]}})
+  return googleapiclient_errors.HttpError(
+      httplib2.Response({"status": 403}), content.encode("utf-8"))
+
+
+class TestNegativeCache(unittest.TestCase):
+  """Test the cache of requests failed with 403."""
+
+  def setUp(self):
+    activation = negative_cache.NegativeCache().activate()
+    activation.__enter__()
+    self.addCleanup(activation.__exit__, None, None, None)
+
+  def test_classify(self):
+    """Test that disabled APIs and missing permissions are told apart."""
+    self.assertEqual(
+        negative_cache.classify(_forbidden("PERMISSION_DENIED",
+                                           "SERVICE_DISABLED")),
+        negative_cache.SERVICE_DISABLED)
+    self.assertEqual(
+        negative_cache.classify(_forbidden("PERMISSION_DENIED",
+                                           "IAM_PERMISSION_DENIED")),
+        negative_cache.PERMISSION_DENIED)
+    self.assertIsNone(negative_cache.classify(_http_error(429)))
+    self.assertIsNone(
+        negative_cache.classify(_http_error(403, "rateLimitExceeded")))
+
+  def test_scope(self):
+    """Test that cached errors only affect the same credentials and project."""
+    creds, other_creds = object(), object()
+    with negative_cache.scope(creds, "p"):
+      negative_cache.record(
+          "compute", _forbidden("PERMISSION_DENIED", "SERVICE_DISABLED"))
+      with self.assertRaises(googleapiclient_errors.HttpError):
+        negative_cache.check("compute")
+      # permissions may be granted on single resources
+      negative_cache.record(
+          "dns", _forbidden("PERMISSION_DENIED", "IAM_PERMISSION_DENIED"))
+      negative_cache.check("dns")
+    with negative_cache.scope(other_creds, "p"):
+      negative_cache.check("compute")
+    with negative_cache.scope(creds, "q"):
+      negative_cache.check("compute")
+    self.assertTrue(negative_cache.is_disabled(creds, "p", "compute"))
+
+  def test_resource_permission_denied_is_not_cached(self):
+    """Test that a 403 on one bucket does not hide the next bucket."""
+    forbidden = _forbidden("PERMISSION_DENIED", "IAM_PERMISSION_DENIED")
+    service = discovery.build(
+        "storage", "v1",
+        http=googleapiclient_http.HttpMockSequence([
+            ({"status": "403"}, forbidden.content),
+            ({"status": "200"}, '{"items": [{"name": "o"}]}'),
+        ]),
+        requestBuilder=ScannerHttpRequest,
+        static_discovery=True,
+    )
+    with negative_cache.scope(object(), "p"):
+      with self.assertRaises(googleapiclient_errors.HttpError):
+        service.objects().list(bucket="a").execute()
+      self.assertEqual(service.objects().list(bucket="b").execute(),
+                       {"items": [{"name": "o"}]})
+
+  def test_crawl_resource_skips_disabled_api(self):
+    """Test that crawlers of a disabled API make no more requests."""
+    creds = Mock()
+    forbidden = _forbidden("PERMISSION_DENIED", "SERVICE_DISABLED")
+    service = discovery.build(
+        "compute", "v1",
+        http=googleapiclient_http.HttpMockSequence([
+            ({"status": "403"}, forbidden.content),
+        ]),
+        requestBuilder=ScannerHttpRequest,
+        static_discovery=True,
+    )
+    lease = Mock()
+    lease.return_value.__enter__ = Mock(return_value=service)
+    lease.return_value.__exit__ = Mock(return_value=False)
+    with patch.object(scanner.service_pool, "lease", lease):
+      self.assertEqual(
+          scanner.crawl_resource("compute_instances", "p", creds, None, ""),
+          [])
+      self.assertIsNone(
+          scanner.crawl_resource("compute_disks", "p", creds, None, ""))
+    self.assertEqual(lease.call_count, 1)
+
+
+class TestLocationCache(unittest.TestCase):
+  """Test the cache of locations with resources."""
+
+  def setUp(self):
+    activation = location_cache.LocationCache().activate()
+    activation.__enter__()
+    self.addCleanup(activation.__exit__, None, None, None)
+
+  def test_plan(self):
+    """Test that populated locations go first and empty ones are skipped."""
+    cache = location_cache.LocationCache(empty_ttl=3600)
+    cache.record("p", "kms_keyrings", "us", False)
+    cache.record("p", "kms_keyrings", "eu", True)
+    self.assertEqual(cache.plan("p", "kms_keyrings", ["us", "asia", "eu"]),
+                     ["eu", "asia"])
+    self.assertEqual(cache.plan("q", "kms_keyrings", ["us", "eu"]),
+                     ["us", "eu"])
+    cache.empty_ttl = 0
+    self.assertEqual(cache.plan("p", "kms_keyrings", ["us", "asia", "eu"]),
+                     ["eu", "asia", "us"])
+
+  def test_probe_by_default(self):
+    """Test that empty locations are probed again unless a TTL is set."""
+    cache = location_cache.LocationCache()
+    cache.record("p", "kms_keyrings", "us", False)
+    cache.record("p", "kms_keyrings", "eu", True)
+    self.assertEqual(cache.plan("p", "kms_keyrings", ["us", "eu"]),
+                     ["eu", "us"])
+
+  def test_persistence(self):
+    """Test that the cache is saved and loaded."""
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "locations.json")
+      cache = location_cache.LocationCache(path)
+      cache.record("p", "kms_keyrings", "us", False)
+      cache.save()
+      loaded = location_cache.LocationCache(path, empty_ttl=3600)
+      self.assertEqual(loaded.plan("p", "kms_keyrings", ["us", "eu"]),
+                       ["eu"])
+
+  def test_save_merges_other_processes(self):
+    """Test that entries saved by another shard in the meantime are kept."""
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "locations.json")
+      first = location_cache.LocationCache(path)
+      second = location_cache.LocationCache(path)
+      first.record("p", "kms_keyrings", "us", False)
+      second.record("q", "kms_keyrings", "us", True)
+      second.record("p", "kms_keyrings", "us", True)
+      first.save()
+      second.save()
+      loaded = location_cache.LocationCache(path, empty_ttl=3600)
+      self.assertEqual(loaded.plan("p", "kms_keyrings", ["us"]), ["us"])
+      self.assertEqual(loaded.plan("q", "kms_keyrings", ["eu", "us"]),
+                       ["us", "eu"])
+
+  def test_kms_skips_empty_locations(self):
+    """Test that KMS keyrings are not listed again in empty locations."""
+    responses = [
+        ({"status": "200"}, json.dumps({"locations": [
+            {"locationId": "us"}, {"locationId": "eu"}]})),
+        ({"status": "200"}, json.dumps({})),
+        ({"status": "200"}, json.dumps({
+            "keyRings": [{"name": "projects/p/locations/eu/keyRings/r"}]})),
+        ({"status": "200"}, json.dumps({"cryptoKeys": [{"name": "k"}]})),
+        ({"status": "200"}, json.dumps({"locations": [
+            {"locationId": "us"}, {"locationId": "eu"}]})),
+        ({"status": "200"}, json.dumps({
+            "keyRings": [{"name": "projects/p/locations/eu/keyRings/r"}]})),
+        ({"status": "200"}, json.dumps({"cryptoKeys": [{"name": "k"}]})),
+    ]
+    service = discovery.build(
+        "cloudkms", "v1",
+        http=googleapiclient_http.HttpMockSequence(responses),
+        requestBuilder=ScannerHttpRequest,
+        static_discovery=True,
+    )
+    crawler = KMSKeysCrawler()
+    # locations are listed on the request executor, one at a time for the
+    # ordered mock responses
+    context = models.SpiderContext(
+        [], location_cache=location_cache.LocationCache(empty_ttl=3600),
+        request_executor=BoundedExecutor(1, "test-request"))
+    with context.activate():
+      self.assertEqual(crawler.crawl("p", service), [{"name": "k"}])
+      # only eu is listed again, us had no keyrings
+      self.assertEqual(crawler.crawl("p", service), [{"name": "k"}])
+
+
+class TestSpool(unittest.TestCase):
+  """Test spooled crawler results."""
+
+  def test_spooled_dict(self):
+    """Test that spooled values read back like a dict."""
+    spooled = spool.SpooledDict(max_memory=16)
+    spooled.add("a", [{"id": "t1"}])
+    spooled.update({"b": [], "c": [{"id": "\u00e9"}]})
+    spooled.add("a", [{"id": "t2"}])
+    self.assertEqual(spooled, {"a": [{"id": "t2"}], "b": [],
+                               "c": [{"id": "\u00e9"}]})
+    self.assertEqual(list(spooled), ["a", "b", "c"])
+    with self.assertRaises(KeyError):
+      spooled["d"]  # pylint: disable=pointless-statement
+
+  def test_dump(self):
+    """Test that streamed output matches json.dumps."""
+    spooled = spool.SpooledDict()
+    spooled.add("dataset", [{"tableReference": {"tableId": "t"}}])
+    result = {"project_info": {"projectId": "p"}, "bq": spooled,
+              "empty": spool.SpooledDict(), "compute_instances": []}
+    out = io.StringIO()
+    spool.dump(result, out)
+    self.assertEqual(
+        out.getvalue(),
+        json.dumps(dict(result, bq=dict(spooled), empty={}), indent=2))
+
+  def test_closed_once_saved(self):
+    """Test that save_results removes the spooled values it wrote."""
+    spooled = spool.SpooledDict()
+    spooled.add("dataset", [])
+    with tempfile.TemporaryDirectory() as out_dir:
+      path = os.path.join(out_dir, "p.json")
+      scanner.save_results({"bq": spooled}, path, False)
+      with open(path, "r", encoding="utf-8") as f:
+        self.assertEqual(json.load(f), {"bq": {"dataset": []}})
+    self.assertEqual(len(spooled), 1)
+    with self.assertRaises(ValueError):
+      spooled["dataset"]  # pylint: disable=pointless-statement
+
+  def test_bq_tables_of_all_pages(self):
+    """Test that tables of every dataset page are listed in order."""
+    crawler = BigQueryCrawler()
+    service = Mock()
+    pages = [{"datasets": [{"datasetReference": {"datasetId": f"d{i}"}}]}
+             for i in range(10)]
+    with patch.object(bigquery_crawler, "paginate", return_value=pages), \
+        patch.object(BigQueryCrawler, "get_bq_tables",
+                     side_effect=lambda _, ids, __: {ids[0]: [ids[0]]}):
+      result = crawler.crawl("p", service)
+    self.assertEqual(list(result), [f"d{i}" for i in range(10)])
+    self.assertEqual(result["d3"], ["d3"])
+
+
+class _FakeObjectsService:
+  """A storage service listing objects from pages by bucket."""
+
+  def __init__(self, pages):
+    self.pages = pages
+    self.calls = list()
+
+  def objects(self):
+    return self
+
+  def list(self, bucket, fields, pageToken=None, **kwargs):
+    self.calls.append((bucket, pageToken, kwargs))
+    if bucket == "lake":
+      return Mock(execute=Mock(return_value=self._lake(pageToken, **kwargs)))
+    response = self.pages[bucket][int(pageToken or 0)]
+    return Mock(execute=Mock(return_value=response))
+
+  @staticmethod
+  def _lake(page_token, prefix="", delimiter=None, startOffset=""):
+    # a bucket with objects x/y/0-3 and z, listed one object per page
+    names = sorted([f"{d}/{s}/{i}" for d in "ab" for s in "cd"
+                    for i in range(4)] + ["z"])
+    names = [n for n in names if n.startswith(prefix) and n >= startOffset]
+    prefixes = list()
+    if delimiter is not None:
+      prefixes = sorted({prefix + n[len(prefix):].split("/")[0] + "/"
+                         for n in names if "/" in n[len(prefix):]})
+      names = [n for n in names if "/" not in n[len(prefix):]]
+    index = int(page_token or 0)
+    response = {"items": [{"name": n} for n in names[index:index + 1]],
+                "prefixes": prefixes if index == 0 else []}
+    if index + 1 < len(names):
+      response["nextPageToken"] = str(index + 1)
+    return response
+
+
+class TestObjectInventory(unittest.TestCase):
+  """Test the object inventory of storage buckets."""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, "gcs-p.json")
+    self.service = _FakeObjectsService({
+        "a": [{"items": [{"name": "a1"}], "nextPageToken": "1"},
+              {"items": [{"name": "a2"}, {"name": "a3"}]}],
+        "b": [{"items": [{"name": "b1"}]}],
+    })
+
+  def _read(self, path, opener=open):
+    with opener(path, "rt", encoding="utf-8") as f:
+      return sorted(json.loads(line)["name"] for line in f)
+
+  def test_ndjson(self):
+    """Test that objects of all buckets are written one per line."""
+    with object_inventory.ObjectInventory(self.service, self.path) as inventory:
+      inventory.add_bucket("a")
+      inventory.add_bucket("b")
+    self.assertEqual(self._read(self.path), ["a1", "a2", "a3", "b1"])
+
+  def test_listing_in_crawler_context(self):
+    """Test that buckets are listed with the objects of the scan."""
+    budgets = list()
+    list_objects = self.service.list
+
+    def list_in_context(*args, **kwargs):
+      budgets.append(request_budget.current())
+      return list_objects(*args, **kwargs)
+
+    budget = request_budget.RequestBudget(4)
+    with patch.object(self.service, "list", list_in_context), \
+        budget.activate(), \
+        object_inventory.ObjectInventory(self.service, self.path,
+                                         workers=2) as inventory:
+      inventory.add_bucket("a")
+      inventory.add_bucket("b")
+    self.assertEqual(len(budgets), 3)
+    for listing_budget in budgets:
+      self.assertIs(listing_budget, budget)
+
+  def test_cap_and_gzip(self):
+    """Test that listing stops at the cap and the output is compressed."""
+    with object_inventory.ObjectInventory(
+        self.service, self.path, max_objects_per_bucket=2,
+        compress=True) as inventory:
+      inventory.add_bucket("a")
+    self.assertEqual(self._read(self.path + ".gz", gzip.open), ["a1", "a2"])
+
+  def _save_state(self, path, offset):
+    shard = dict(object_inventory._shard(), page_token="1")  # pylint: disable=protected-access
+    done = dict(object_inventory._shard(), done=True)  # pylint: disable=protected-access
+    with open(path + ".state.json", "w", encoding="utf-8") as f:
+      json.dump({"offset": offset, "buckets": {
+          "a": {"count": 1, "shards": {"a": shard}},
+          "b": {"count": 1, "shards": {"b": done}}}}, f)
+
+  def test_resume(self):
+    """Test that a later run continues from the saved page tokens."""
+    saved = (json.dumps({"name": "a1"}) + "\n").encode("utf-8")
+    with open(self.path, "wb") as f:
+      # a2 was written after the last save
+      f.write(saved + (json.dumps({"name": "a2"}) + "\n").encode("utf-8"))
+    self._save_state(self.path, len(saved))
+    with object_inventory.ObjectInventory(self.service, self.path) as inventory:
+      inventory.add_bucket("a")
+      inventory.add_bucket("b")
+    self.assertEqual(self._read(self.path), ["a1", "a2", "a3"])
+    self.assertEqual(self.service.calls, [("a", "1", {})])
+
+  def test_resume_gzip_after_crash(self):
+    """Test that a gzip member cut by a crash is dropped on resume."""
+    path = self.path + ".gz"
+    saved = gzip.compress((json.dumps({"name": "a1"}) + "\n").encode("utf-8"))
+    cut = gzip.compress((json.dumps({"name": "a2"}) + "\n").encode("utf-8"))
+    with open(path, "wb") as f:
+      f.write(saved + cut[:len(cut) // 2])
+    self._save_state(path, len(saved))
+    with object_inventory.ObjectInventory(self.service, self.path,
+                                          compress=True) as inventory:
+      inventory.add_bucket("a")
+      inventory.add_bucket("b")
+    self.assertEqual(self._read(path, gzip.open), ["a1", "a2", "a3"])
+
+  def test_prefix_shards(self):
+    """Test that prefix shards list every object of a bucket once."""
+    expected = sorted([f"{d}/{s}/{i}" for d in "ab" for s in "cd"
+                       for i in range(4)] + ["z"])
+    for depth, split_after_pages in ((1, 100), (2, 100), (1, 2)):
+      with self.subTest(depth=depth, split_after_pages=split_after_pages):
+        with object_inventory.ObjectInventory(
+            self.service, self.path, workers=4, prefix_depth=depth,
+            split_after_pages=split_after_pages) as inventory:
+          inventory.add_bucket("lake")
+        self.assertEqual(self._read(self.path), expected)
+        with open(self.path + ".state.json", encoding="utf-8") as f:
+          state = json.load(f)["buckets"]["lake"]
+        self.assertEqual(state["count"], len(expected))
+        self.assertTrue(all(s["done"] for s in state["shards"].values()))
+        os.remove(self.path + ".state.json")
+
+  def test_prefix_shards_cap(self):
+    """Test that the cap applies to all shards of a bucket."""
+    with object_inventory.ObjectInventory(
+        self.service, self.path, workers=4, prefix_depth=2,
+        max_objects_per_bucket=5) as inventory:
+      inventory.add_bucket("lake")
+    self.assertEqual(len(self._read(self.path)), 5)
+
+
+class TestBillingIndex(unittest.TestCase):
+  """Test the billing info index of billing accounts."""
+
+  def test_index_and_fallback(self):
+    """Test that indexed projects need no per-project calls."""
+    info = {"name": "projects/p1/billingInfo", "projectId": "p1",
+            "billingAccountName": "billingAccounts/A", "billingEnabled": True}
+    other = {"name": "projects/p2/billingInfo", "projectId": "p2",
+             "billingAccountName": "", "billingEnabled": False}
+    service = discovery.build(
+        "cloudbilling", "v1",
+        http=googleapiclient_http.HttpMockSequence([
+            ({"status": "200"}, json.dumps(
+                {"billingAccounts": [{"name": "billingAccounts/A"}]})),
+            ({"status": "200"}, json.dumps({"projectBillingInfo": [info]})),
+            ({"status": "200"}, json.dumps(other)),
+        ]),
+        requestBuilder=ScannerHttpRequest,
+        static_discovery=True,
+    )
+    crawler = CloudBillingAccountCrawler()
+    config = {"billing_index": cloud_billing_account_crawler.BillingIndex()}
+    self.assertEqual(crawler.crawl("p1", service, config), [info])
+    self.assertEqual(crawler.crawl("p1", service, config), [info])
+    # p2 is on no listed account
+    self.assertEqual(crawler.crawl("p2", service, config), [other])
+
+  def test_single_project(self):
+    """Test that a scan without an index makes a single call."""
+    info = {"name": "projects/p1/billingInfo", "projectId": "p1"}
+    http = googleapiclient_http.HttpMockSequence([
+        ({"status": "200"}, json.dumps(info)),
+    ])
+    service = discovery.build("cloudbilling", "v1", http=http,
+                              static_discovery=True)
+    self.assertEqual(CloudBillingAccountCrawler().crawl("p1", service, {}),
+                     [info])
+    self.assertEqual(len(http.request_sequence), 1)
+
+  def test_index_through_crawl_resource(self):
+    """Test that scanned projects get the index through their config."""
+    info = [{"name": f"projects/{project_id}/billingInfo",
+             "projectId": project_id} for project_id in ("p1", "p2")]
+    http = googleapiclient_http.HttpMockSequence([
+        ({"status": "200"}, json.dumps(
+            {"billingAccounts": [{"name": "billingAccounts/A"}]})),
+        ({"status": "200"}, json.dumps({"projectBillingInfo": info})),
+    ])
+    service = discovery.build("cloudbilling", "v1", http=http,
+                              requestBuilder=ScannerHttpRequest,
+                              static_discovery=True)
+    lease = Mock()
+    lease.return_value.__enter__ = Mock(return_value=service)
+    lease.return_value.__exit__ = Mock(return_value=False)
+    index = cloud_billing_account_crawler.BillingIndex()
+    with patch.object(scanner.service_pool, "lease", lease):
+      for project_id, project_info in zip(("p1", "p2"), info):
+        self.assertEqual(
+            scanner.crawl_resource("cloud_billing_account", project_id,
+                                   Mock(), None, "", billing_index=index),
+            [project_info])
+    # no getBillingInfo calls
+    self.assertEqual(len(http.request_sequence), 2)
+
+  @patch("gcp_scanner.scanner.ClientFactory")
+  @patch("gcp_scanner.scanner.CrawlerFactory")
+  @patch("gcp_scanner.scanner.impersonate_service_accounts")
+  def test_index_per_multi_project_scan(self, _, mocked_crawler_factory,
+                                        unused_client_factory):
+    """Test that the index is only shared by scans of several projects."""
+    mocked_crawler_factory.create_crawler.return_value.crawl.return_value = [
+      {"projectId": "project-1"},
+      {"projectId": "project-2"},
+    ]
+    for target_project, shared in ((None, True), ("project-2", False)):
+      project_queue = queue.Queue()
+      args = Mock(output="out", light_scan=False,
+                  target_project=target_project, resource_worker_count=1,
+                  shard_index=0, shard_count=1)
+      context = models.SpiderContext([("sa", Mock(scopes=[]), [])])
+      scanner.discover_projects(context, args, None, "suffix", [],
+                                project_queue)
+      first, second = project_queue.get(), project_queue.get()
+      self.assertIs(first.billing_index, second.billing_index)
+      self.assertEqual(first.billing_index is not None, shared)
+      self.assertEqual(
+          "billing_index" in scanner.crawler_config_for(
+              "cloud_billing_account", None, "out",
+              billing_index=first.billing_index),
+          shared)
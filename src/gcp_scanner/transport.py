@@ -0,0 +1,262 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""The module to share keep-alive HTTP connections between API calls.
+
+"""
+
+import collections
+import contextlib
+import contextvars
+import logging
+import socket
+import threading
+from typing import ContextManager, Dict, Iterator, List, Optional
+
+import httplib2
+import requests
+from requests import adapters
+
+# Timeout of the pooled connections, the same as googleapiclient uses.
+DEFAULT_HTTP_TIMEOUT = 60
+
+# Default number of transports shared by the discovery clients.
+DEFAULT_POOL_SIZE = 32
+
+
+class ConnectionStats:
+  """Counts new and reused connections per host."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.new: Dict[str, int] = collections.Counter()
+    self.reused: Dict[str, int] = collections.Counter()
+
+  def record(self, host: str, reused: bool):
+    with self._lock:
+      if reused:
+        self.reused[host] += 1
+      else:
+        self.new[host] += 1
+
+  def log_report(self):
+    with self._lock:
+      hosts = sorted(set(self.new) | set(self.reused))
+      for host in hosts:
+        logging.info('%s: %d requests over %d new connections', host,
+                     self.new[host] + self.reused[host], self.new[host])
+
+
+class PooledHttp(httplib2.Http):
+  """httplib2.Http recording whether requests reuse an open connection."""
+
+  def __init__(self, stats: ConnectionStats, **kwargs):
+    super().__init__(**kwargs)
+    self._stats = stats
+
+  def request(self, uri, method='GET', body=None, headers=None,
+              redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+              connection_type=None):
+    scheme, authority, _, _ = httplib2.urlnorm(httplib2.iri2uri(uri))
+    conn = self.connections.get(f'{scheme}:{authority}')
+    self._stats.record(authority,
+                       conn is not None and conn.sock is not None)
+    return super().request(uri, method=method, body=body, headers=headers,
+                           redirections=redirections,
+                           connection_type=connection_type)
+
+
+class HttpPool:
+  """A pool of httplib2 transports shared by all discovery clients.
+
+  httplib2.Http is not thread-safe, so every request takes an idle
+  transport from the pool for its duration, or a new one if all are busy.
+  Each transport keeps one keep-alive connection per host and up to
+  max_size transports are kept once idle, so TLS handshakes are only
+  repeated when more than max_size requests to a host run at once. The
+  pool never limits the number of requests in flight, the request budget
+  does. It can be passed as http to google_auth_httplib2.AuthorizedHttp.
+  """
+
+  def __init__(self, max_size: int = DEFAULT_POOL_SIZE,
+               timeout: Optional[float] = None):
+    """Initialize the pool.
+
+    Args:
+      max_size: maximum number of idle transports kept for later requests,
+        others are closed once their request is done.
+      timeout: socket timeout of the connections in seconds.
+    """
+
+    if timeout is None:
+      timeout = socket.getdefaulttimeout() or DEFAULT_HTTP_TIMEOUT
+    self.timeout = timeout
+    self.follow_redirects = True
+    # googleapiclient handles 308 responses of resumable uploads itself
+    self.redirect_codes = httplib2.Http().redirect_codes - {308}
+    self.stats = ConnectionStats()
+    self.max_size = max_size
+    self._idle: List[PooledHttp] = list()
+    self._lock = threading.Lock()
+
+  def _new_http(self) -> PooledHttp:
+    http = PooledHttp(self.stats, timeout=self.timeout)
+    http.redirect_codes = self.redirect_codes
+    return http
+
+  def request(self, uri, method='GET', body=None, headers=None,
+              redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+              connection_type=None):
+    with self._lock:
+      http = self._idle.pop() if self._idle else None
+    if http is None:
+      http = self._new_http()
+    try:
+      return http.request(uri, method=method, body=body, headers=headers,
+                          redirections=redirections,
+                          connection_type=connection_type)
+    finally:
+      with self._lock:
+        keep = len(self._idle) < self.max_size
+        if keep:
+          self._idle.append(http)
+      if not keep:
+        http.close()
+
+  def close(self):
+    with self._lock:
+      for http in self._idle:
+        http.close()
+      self._idle = list()
+
+  @contextlib.contextmanager
+  def activate(self) -> Iterator[None]:
+    """Makes the pool the one of discovery clients built in the block."""
+
+    token = _current_http_pool.set(self)
+    try:
+      yield
+    finally:
+      _current_http_pool.reset(token)
+
+
+class SessionPool:
+  """A pool of requests sessions with keep-alive connections.
+
+  requests.Session is not guaranteed to be thread-safe, so every caller
+  leases an idle session for its requests, or a new one if all are busy.
+  Up to max_size sessions are kept once idle and others are closed, so the
+  number of open sockets does not grow with the number of threads started
+  during the scan.
+  """
+
+  def __init__(self, max_size: int = DEFAULT_POOL_SIZE,
+               max_connections: int = 10):
+    """Initialize the pool.
+
+    Args:
+      max_size: maximum number of idle sessions kept for later requests.
+      max_connections: maximum number of connections a session keeps per
+        host.
+    """
+
+    self.max_size = max_size
+    self.max_connections = max_connections
+    self._idle: List[requests.Session] = list()
+    # requests and new connections per host of the closed sessions
+    self._closed_stats = collections.defaultdict(lambda: [0, 0])
+    self._lock = threading.Lock()
+
+  def _new_session(self) -> requests.Session:
+    session = requests.Session()
+    adapter = adapters.HTTPAdapter(pool_connections=self.max_connections,
+                                   pool_maxsize=self.max_connections)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+  @contextlib.contextmanager
+  def session(self) -> Iterator[requests.Session]:
+    """Leases a session for the requests made in the block."""
+
+    with self._lock:
+      session = self._idle.pop() if self._idle else None
+    if session is None:
+      session = self._new_session()
+    try:
+      yield session
+    finally:
+      with self._lock:
+        keep = len(self._idle) < self.max_size
+        if keep:
+          self._idle.append(session)
+        else:
+          _add_stats(self._closed_stats, session)
+      if not keep:
+        session.close()
+
+  def close(self):
+    with self._lock:
+      for session in self._idle:
+        _add_stats(self._closed_stats, session)
+        session.close()
+      self._idle = list()
+
+  def log_report(self):
+    with self._lock:
+      stats = collections.defaultdict(lambda: [0, 0], {
+          host: list(counts) for host, counts in self._closed_stats.items()
+      })
+      for session in self._idle:
+        _add_stats(stats, session)
+    for host, (num_requests, num_connections) in sorted(stats.items()):
+      logging.info('%s: %d requests over %d new connections', host,
+                   num_requests, num_connections)
+
+
+def _add_stats(stats: Dict[str, List[int]], session: requests.Session):
+  """Adds requests and new connections per host of an idle session."""
+
+  for adapter in set(session.adapters.values()):
+    pools = adapter.poolmanager.pools
+    # keys() is the only thread-safe way to iterate the container
+    for key in pools.keys():
+      pool = pools.get(key)
+      if pool is None:
+        continue
+      stats[pool.host][0] += pool.num_requests
+      stats[pool.host][1] += pool.num_connections
+
+
+# The pool of the running scan, see SpiderContext.activate().
+_current_http_pool: 'contextvars.ContextVar[HttpPool]' = (
+    contextvars.ContextVar('http_pool', default=HttpPool()))
+session_pool = SessionPool()
+
+
+def http_pool() -> HttpPool:
+  """Returns the pool of httplib2 transports of the running scan."""
+  return _current_http_pool.get()
+
+
+def session() -> ContextManager[requests.Session]:
+  """Leases a pooled requests session, see SessionPool.session()."""
+  return session_pool.session()
+
+
+def log_report():
+  """Logs connection reuse statistics of the transports of the scan."""
+  http_pool().stats.log_report()
+  session_pool.log_report()